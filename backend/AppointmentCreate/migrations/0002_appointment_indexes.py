@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AppointmentCreate', '0001_initial'),
+        ('ContactsCreate', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['contact', 'start_time'], name='Appointment_contact_30553c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['calendar_id', 'start_time'], name='Appointment_calenda_f19291_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['start_time'], name='Appointment_start_t_e2cd13_idx'),
+        ),
+    ]
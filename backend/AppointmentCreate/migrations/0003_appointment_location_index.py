@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AppointmentCreate', '0002_appointment_indexes'),
+        ('ContactsCreate', '0002_contact_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['location_id', 'start_time', 'id'], name='Appointment_locatio_519440_idx'),
+        ),
+    ]
@@ -1,8 +1,11 @@
 #appointmentCreate/models.py
+import logging
 import uuid
 from django.db import models
 from ContactsCreate.models import Contact  # Importamos el modelo Contact
-from ghlmp_updates.ghl_client import add_tag_to_contact, set_custom_field
+from ghlmp_updates.ghl_client import queue_custom_field, queue_tag
+
+logger = logging.getLogger(__name__)
 
 
 class Appointment(models.Model):
@@ -24,6 +27,14 @@ class Appointment(models.Model):
     date_added = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["contact", "start_time"]),
+            models.Index(fields=["calendar_id", "start_time"]),
+            models.Index(fields=["start_time"]),
+            models.Index(fields=["location_id", "start_time", "id"]),  # listado paginado por location
+        ]
+
     def __str__(self):
         return f"{self.title} ({self.ghl_id})"
 
@@ -33,11 +44,16 @@ class Appointment(models.Model):
             self.status = "paid"
             self.save()
 
-        # 🔹 Sincronizar con GoHighLevel
+        # 🔹 Sincronizar con GoHighLevel: tag y campo salen en el mismo lote del contacto
         try:
-            add_tag_to_contact(self.contact_id, "pago_confirmado")
-            set_custom_field(self.contact_id, "payment_status", "paid")
-            print(f"[GHL] Contacto {self.contact_id} actualizado correctamente.")
+            pending = [
+                queue_tag(self.contact_id, "pago_confirmado"),
+                queue_custom_field(self.contact_id, "payment_status", "paid"),
+            ]
+            if all(future.result() for future in pending):
+                logger.info("[GHL] Contacto %s actualizado correctamente.", self.contact_id)
+            else:
+                logger.error("[ERROR GHL Sync] GHL rechazó la actualización del contacto %s", self.contact_id)
         except Exception as e:
-            print(f"[ERROR GHL Sync] {e}")
+            logger.error("[ERROR GHL Sync] %s", e)
 
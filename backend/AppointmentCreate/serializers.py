@@ -1,8 +1,27 @@
 # appointments/serializers.py
 from rest_framework import serializers
 from .models import Appointment
+from ContactsCreate.models import Contact
 
 class AppointmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Appointment
-        fields = "__all__"
\ No newline at end of file
+        fields = "__all__"
+
+
+class AppointmentContactSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Contact
+        fields = ["id", "ghl_id", "first_name", "last_name", "email", "phone"]
+
+
+class AppointmentListSerializer(serializers.ModelSerializer):
+    """Serializer liviano para el listado (sin notas ni campos internos)."""
+    contact = AppointmentContactSerializer(read_only=True)
+
+    class Meta:
+        model = Appointment
+        fields = [
+            "id", "ghl_id", "location_id", "calendar_id", "title", "appointment_status",
+            "assigned_user_id", "start_time", "end_time", "contact",
+        ]
@@ -0,0 +1,133 @@
+# AppointmentCreate/services.py
+import uuid
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Appointment
+from ContactsCreate.resolver import resolve_contacts
+from ghlmp_updates.batching import MicroBatcher
+from payments.links import enqueue_payment_links
+
+# campos que se actualizan si la cita ya existía (mismo ghl_id)
+APPOINTMENT_FIELDS = [
+    "calendar_id", "contact_id", "location_id", "title", "appointment_status",
+    "assigned_user_id", "notes", "start_time", "end_time", "source",
+]
+
+
+# campos sin los que la cita no se puede guardar (NOT NULL): campo local -> nombre en el evento
+REQUIRED_EVENT_FIELDS = {
+    "contact_ghl_id": "contactId",
+    "calendar_id": "calendarId",
+    "location_id": "locationId",
+    "start_time": "startTime",
+    "end_time": "endTime",
+}
+
+
+# Función para convertir ISO8601 a datetime aware
+def _to_datetime(iso_str):
+    """Convierte ISO8601 string a datetime aware o devuelve None."""
+    if not iso_str:
+        return None
+    dt = parse_datetime(iso_str)
+    if dt is None:
+        return None
+    if settings.USE_TZ and timezone.is_naive(dt):
+        tz = timezone.get_current_timezone()
+        dt = timezone.make_aware(dt, tz)
+    return dt
+
+
+def normalize_appointment_event(data):
+    """
+    Extrae los campos de la cita de un evento del webhook de GHL (formatos plano o anidado).
+    Lanza ValueError si falta un campo obligatorio: el evento se rechaza solo, antes
+    de entrar a un lote con otros válidos.
+    """
+    appointment_data = data.get("appointment", {})
+    appointment_id = data.get("ghl_id") or data.get("id") or appointment_data.get("id")
+
+    if not appointment_id:
+        appointment_id = f"test-{uuid.uuid4()}"  # ID temporal para pruebas
+
+    row = {
+        "ghl_id": appointment_id,
+        "calendar_id": data.get("calendarId") or appointment_data.get("calendarId"),
+        # id de GHL: upsert_appointments lo traduce al id local de Contact
+        "contact_ghl_id": data.get("contactId") or appointment_data.get("contactId"),
+        "location_id": data.get("locationId") or appointment_data.get("locationId"),
+        "title": data.get("title") or appointment_data.get("title") or "Cita",
+        "appointment_status": (
+            data.get("appointmentStatus") or
+            appointment_data.get("appointmentStatus") or
+            "confirmed"
+        ),
+        "assigned_user_id": data.get("assignedUserId") or appointment_data.get("assignedUserId"),
+        "notes": data.get("notes") or appointment_data.get("notes"),
+        "source": data.get("source") or appointment_data.get("source"),
+        "start_time": _to_datetime(data.get("startTime") or appointment_data.get("startTime")),
+        "end_time": _to_datetime(data.get("endTime") or appointment_data.get("endTime")),
+    }
+    for field, name in REQUIRED_EVENT_FIELDS.items():
+        if not row[field]:
+            raise ValueError(f"Falta o es inválido el campo: {name}")
+    return row
+
+
+def upsert_appointments(rows):
+    """
+    Guarda un lote de citas normalizadas con un solo upsert
+    (bulk_create con update_conflicts sobre ghl_id), enlazadas al Contact local
+    de su contactId de GHL, y encola, en la misma transacción,
+    la generación de sus links de pago. Devuelve `created` por item.
+    """
+    # el último evento de una misma cita gana
+    latest = {row["ghl_id"]: row for row in rows}
+
+    # los contactos del lote se resuelven (o crean) antes, en su propia transacción corta:
+    # así la del upsert no retiene el lock de escritura mientras tanto
+    with transaction.atomic():
+        contacts = resolve_contacts({row.get("contact_ghl_id"): row.get("location_id") for row in latest.values()})
+
+    with transaction.atomic():
+        objs = {
+            ghl_id: Appointment(
+                contact_id=contacts.get(row.get("contact_ghl_id")),
+                **{k: v for k, v in row.items() if k != "contact_ghl_id"},
+            )
+            for ghl_id, row in latest.items()
+        }
+
+        existing = set(Appointment.objects.filter(ghl_id__in=list(objs)).values_list("ghl_id", flat=True))
+        Appointment.objects.bulk_create(
+            list(objs.values()),
+            update_conflicts=True,
+            unique_fields=["ghl_id"],
+            update_fields=APPOINTMENT_FIELDS,
+        )
+        enqueue_payment_links(list(latest.values()))
+    # solo la primera aparición de un ghl_id nuevo cuenta como creada
+    created = []
+    for row in rows:
+        created.append(row["ghl_id"] not in existing)
+        existing.add(row["ghl_id"])
+    return created
+
+
+def _flush_appointments(rows):
+    close_old_connections()
+    try:
+        return upsert_appointments(rows)
+    finally:
+        close_old_connections()
+
+
+# eventos sueltos del webhook: se agrupan unos milisegundos y se escriben juntos
+appointment_batcher = MicroBatcher(
+    _flush_appointments,
+    max_size=settings.WEBHOOK_BATCH_MAX_SIZE,
+    max_wait=settings.WEBHOOK_BATCH_MAX_WAIT_MS / 1000,
+    name="appointment-webhook-batcher",
+)
@@ -1 +1,85 @@
-from django.test import TestCase
\ No newline at end of file
+import base64
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.test import TestCase
+
+from AppointmentCreate.models import Appointment
+from ContactsCreate.models import Contact
+
+
+class AppointmentListPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        contact = Contact.objects.create(ghl_id="ghl-c1", first_name="Ana")
+        base = datetime(2026, 1, 1, 9, tzinfo=dt_timezone.utc)
+        # varias citas comparten start_time: el cursor debe desempatar por id
+        Appointment.objects.bulk_create([
+            Appointment(
+                ghl_id=f"ghl-a{i}", location_id="loc-1" if i % 3 else "loc-2", calendar_id="cal-1",
+                contact=contact, start_time=base + timedelta(hours=i // 4), end_time=base + timedelta(hours=i // 4, minutes=30),
+            )
+            for i in range(23)
+        ])
+
+    def fetch_all(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            ids += [row["id"] for row in body["results"]]
+            url, pages = body["next"], pages + 1
+        return ids, pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        ids, pages = self.fetch_all("/api/appointments/?limit=5")
+
+        expected = list(Appointment.objects.order_by("start_time", "id").values_list("id", flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 5)
+
+    def test_page_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/appointments/?limit=50")
+
+        self.assertEqual(len(response.json()["results"]), 23)
+        self.assertEqual(response.json()["results"][0]["contact"]["first_name"], "Ana")
+
+    def test_cursor_keeps_the_filters(self):
+        ids, _ = self.fetch_all("/api/appointments/?location_id=loc-2&limit=2")
+
+        expected = list(
+            Appointment.objects.filter(location_id="loc-2").order_by("start_time", "id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_rows_inserted_before_the_cursor_do_not_shift_pages(self):
+        first = self.client.get("/api/appointments/?limit=5").json()
+        earliest = Appointment.objects.order_by("start_time").first()
+        Appointment.objects.create(
+            ghl_id="ghl-late", location_id="loc-1", calendar_id="cal-1", contact=earliest.contact,
+            start_time=earliest.start_time - timedelta(days=1), end_time=earliest.start_time,
+        )
+
+        rest, _ = self.fetch_all(first["next"])
+
+        seen = [row["id"] for row in first["results"]]
+        self.assertFalse(set(seen) & set(rest))
+        self.assertEqual(len(seen) + len(rest), 23)
+
+    def test_invalid_cursor_is_rejected(self):
+        for payload in (["no-es-fecha", 1], ["2026-01-01T09:00:00+00:00"], {"a": 1}, 5):
+            cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+            response = self.client.get("/api/appointments/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 400, payload)
+            self.assertIn("cursor", response.json())
+
+        self.assertEqual(self.client.get("/api/appointments/", {"cursor": "%%%"}).status_code, 400)
+
+    def test_invalid_date_filters_are_rejected(self):
+        for param in ("start_from", "start_to"):
+            for value in ("mañana", "2026-13-01T00:00:00", "2026-02-30T10:00:00"):
+                response = self.client.get("/api/appointments/", {param: value})
+                self.assertEqual(response.status_code, 400, value)
+                self.assertIn(param, response.json())
@@ -6,7 +6,9 @@ from .views import (
 from . import views
 
 urlpatterns = [
+    path('', views.AppointmentListView.as_view(), name="list_appointments"),
     path('create/', AppointmentCreateView.as_view(), name="create_appointment"),
+    path('create/async/', views.appointment_create_async, name="create_appointment_async"),
     path("webhooks/appointments/", appointment_webhook, name="appointment_webhook"),
     path("webhooks/ghl/appointments/", views.appointment_webhook, name="ghl_appointment_webhook"),  # 👈 esta es la que GHL intenta llamar
 ]
\ No newline at end of file
@@ -1,47 +1,91 @@
 #AppointmentCreate/views.py
 import os
 import json
-import uuid
+import base64
+from django.db import OperationalError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
 from django.http import JsonResponse
+import httpx
 import requests
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.decorators import api_view
 from django.views.decorators.csrf import csrf_exempt
 from dotenv import load_dotenv
 from .models import Appointment
-from .serializers import AppointmentSerializer
-from django.utils.dateparse import parse_datetime
-from django.utils import timezone
+from .serializers import AppointmentListSerializer, AppointmentSerializer
+from .services import _to_datetime, appointment_batcher, normalize_appointment_event, upsert_appointments
 from django.conf import settings
 from rest_framework.generics import ListAPIView
-from ContactsCreate.models import Contact  # ✅ Importamos el modelo Contact
+from ContactsCreate.resolver import aresolve_contact, resolve_contact
+from ghl_oauth.tokens import aghl_request, ghl_request
+from payments.idempotency import idempotent
+from ghlmp_updates.circuit import CircuitOpenError, busy_response, unavailable_response
+from ghlmp_updates.ratelimit import RateLimitExceeded, rate_limited_response
 
 # Cargar .env
 load_dotenv()
 
 # Constantes GHL
-GHL_BASE_URL = "https://services.leadconnectorhq.com"
+GHL_BASE_URL = os.getenv("GHL_SERVICES_URL", "https://services.leadconnectorhq.com")
 GHL_API_VERSION = os.getenv("GHL_API_VERSION", "2021-04-15")
-ACCESS_TOKEN = os.getenv("GHL_ACCESS_TOKEN")
 GHL_LOCATION_ID = os.getenv("GHL_LOCATION_ID")  # fallback si viene vacío en el webhook
-if not ACCESS_TOKEN:
-    raise Exception("Access Token de GHL no configurado en .env (GHL_ACCESS_TOKEN)")
 
 
-# Función para convertir ISO8601 a datetime aware
-def _to_datetime(iso_str):
-    """Convierte ISO8601 string a datetime aware o devuelve None."""
-    if not iso_str:
-        return None
-    dt = parse_datetime(iso_str)
-    if dt is None:
-        return None
-    if settings.USE_TZ and timezone.is_naive(dt):
-        tz = timezone.get_current_timezone()
-        dt = timezone.make_aware(dt, tz)
-    return dt
+REQUIRED_FIELDS = ["calendarId", "contactId", "startTime", "endTime"]
+
+
+def _missing_field(data):
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            return field
+    return None
+
+
+def _ghl_headers(location_id):
+    # Authorization lo agrega ghl_request con el token de la location (GHLClient)
+    return {
+        "Version": GHL_API_VERSION,
+        "Content-Type": "application/json",
+        "LocationId": location_id
+    }
+
+
+def _build_api_payload(data, location_id):
+    return {
+        "calendarId": data["calendarId"],
+        "locationId": location_id,
+        "contactId": data["contactId"],
+        "startTime": data["startTime"],
+        "endTime": data["endTime"],
+        "title": data.get("title", "Cita creada desde API"),
+        "appointmentStatus": data.get("appointmentStatus", "confirmed"),
+        "assignedUserId": data.get("assignedUserId"),
+        "ignoreFreeSlotValidation": True,
+        "toNotify": True
+    }
+
+
+def _appointment_defaults(ghl_data, api_payload, location_id, contact_pk):
+    """Campos locales de la cita a partir de la respuesta de GHL (o del payload enviado)."""
+    return {
+        "location_id": ghl_data.get("locationId") or location_id,
+        "calendar_id": ghl_data.get("calendarId") or api_payload["calendarId"],
+        "contact_id": contact_pk,  # 🔹 id local del Contact, no el ID string de GHL
+        "title": ghl_data.get("title") or api_payload.get("title", "Cita"),
+        "appointment_status": ghl_data.get("appointmentStatus") or api_payload.get("appointmentStatus", "confirmed"),
+        "assigned_user_id": ghl_data.get("assignedUserId") or api_payload.get("assignedUserId"),
+        "notes": ghl_data.get("notes") or None,
+        "start_time": _to_datetime(ghl_data.get("startTime") or api_payload["startTime"]),
+        "end_time": _to_datetime(ghl_data.get("endTime") or api_payload["endTime"]),
+        "source": ghl_data.get("source")
+    }
+
+
+NO_LOCATION_ERROR = "No se encontró locationId (poner GHL_LOCATION_ID en .env o enviarlo en el payload)"
 
 
 # Crear cita en GHL y guardarla en MySQL
@@ -50,67 +94,31 @@ class AppointmentCreateView(APIView):
 
     def post(self, request, *args, **kwargs):
         data = request.data or {}
-        required_fields = ["calendarId", "contactId", "startTime", "endTime"]
-        for field in required_fields:
-            if field not in data:
-                return Response({"error": f"Falta el campo: {field}"}, status=status.HTTP_400_BAD_REQUEST)
+        missing = _missing_field(data)
+        if missing:
+            return Response({"error": f"Falta el campo: {missing}"}, status=status.HTTP_400_BAD_REQUEST)
 
         location_id = data.get("locationId") or GHL_LOCATION_ID
         if not location_id:
-            return Response({"error": "No se encontró locationId (poner GHL_LOCATION_ID en .env o enviarlo en el payload)"},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-        headers = {
-            "Authorization": f"Bearer {ACCESS_TOKEN}",
-            "Version": GHL_API_VERSION,
-            "Content-Type": "application/json",
-            "LocationId": location_id
-        }
-
-        api_payload = {
-            "calendarId": data["calendarId"],
-            "locationId": location_id,
-            "contactId": data["contactId"],
-            "startTime": data["startTime"],
-            "endTime": data["endTime"],
-            "title": data.get("title", "Cita creada desde API"),
-            "appointmentStatus": data.get("appointmentStatus", "confirmed"),
-            "assignedUserId": data.get("assignedUserId"),
-            "ignoreFreeSlotValidation": True,
-            "toNotify": True
-        }
+            return Response({"error": NO_LOCATION_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+
+        headers = _ghl_headers(location_id)
+        api_payload = _build_api_payload(data, location_id)
 
         try:
             # 🔹 Crear cita en GoHighLevel
-            resp = requests.post(f"{GHL_BASE_URL}/calendars/events/appointments", json=api_payload, headers=headers, timeout=15)
+            resp = ghl_request(location_id, "POST", f"{GHL_BASE_URL}/calendars/events/appointments",
+                               json=api_payload, headers=headers)
             resp.raise_for_status()
             ghl_data = resp.json()
 
-            # 🔹 Convertimos fechas
-            start_dt = _to_datetime(ghl_data.get("startTime") or api_payload["startTime"])
-            end_dt = _to_datetime(ghl_data.get("endTime") or api_payload["endTime"])
-
-            # ✅ Buscar el contacto localmente usando su `ghl_id`
-            contact_obj = Contact.objects.filter(ghl_id=ghl_data.get("contactId")).first()
-            if not contact_obj:
-                # Si no existe, lo creamos automáticamente
-                contact_obj = Contact.objects.create(ghl_id=ghl_data.get("contactId"))
+            # ✅ Contacto local por su `ghl_id` (si no existe se crea, sin carreras)
+            contact_pk = resolve_contact(ghl_data.get("contactId") or data["contactId"], location_id)
 
             # ✅ Guardar o actualizar cita, relacionándola con el contacto encontrado
             appointment, created = Appointment.objects.update_or_create(
                 ghl_id=ghl_data.get("id"),
-                defaults={
-                    "location_id": ghl_data.get("locationId") or location_id,
-                    "calendar_id": ghl_data.get("calendarId") or api_payload["calendarId"],
-                    "contact": contact_obj,  # 🔹 Aquí se usa el objeto, no el ID string
-                    "title": ghl_data.get("title") or api_payload.get("title", "Cita"),
-                    "appointment_status": ghl_data.get("appointmentStatus") or api_payload.get("appointmentStatus", "confirmed"),
-                    "assigned_user_id": ghl_data.get("assignedUserId") or api_payload.get("assignedUserId"),
-                    "notes": ghl_data.get("notes") or None,
-                    "start_time": start_dt,
-                    "end_time": end_dt,
-                    "source": ghl_data.get("source")
-                }
+                defaults=_appointment_defaults(ghl_data, api_payload, location_id, contact_pk)
             )
 
             serializer = AppointmentSerializer(appointment)
@@ -121,65 +129,183 @@ class AppointmentCreateView(APIView):
             details = resp.text if resp is not None else str(http_err)
             code = resp.status_code if resp is not None else 500
             return Response({"error": "Error HTTP al crear cita en GHL", "details": details}, status=code)
+        except CircuitOpenError as e:
+            return unavailable_response(e)
+        except RateLimitExceeded as e:
+            return rate_limited_response(e)
         except requests.exceptions.RequestException as e:
             return Response({"error": "Error conexión GHL", "details": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
         except Exception as e:
             return Response({"error": "Error interno", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# Versión async (ASGI): no bloquea un hilo durante el round trip a GHL
+@csrf_exempt
+async def appointment_create_async(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+
+    missing = _missing_field(data)
+    if missing:
+        return JsonResponse({"error": f"Falta el campo: {missing}"}, status=400)
+
+    location_id = data.get("locationId") or GHL_LOCATION_ID
+    if not location_id:
+        return JsonResponse({"error": NO_LOCATION_ERROR}, status=400)
+
+    api_payload = _build_api_payload(data, location_id)
+
+    try:
+        resp = await aghl_request(
+            location_id, "POST", f"{GHL_BASE_URL}/calendars/events/appointments",
+            json=api_payload, headers=_ghl_headers(location_id)
+        )
+        resp.raise_for_status()
+        ghl_data = resp.json()
+
+        contact_pk = await aresolve_contact(ghl_data.get("contactId") or data["contactId"], location_id)
+
+        appointment, created = await Appointment.objects.aupdate_or_create(
+            ghl_id=ghl_data.get("id"),
+            defaults=_appointment_defaults(ghl_data, api_payload, location_id, contact_pk)
+        )
+        return JsonResponse(AppointmentSerializer(appointment).data, status=201)
+
+    except httpx.HTTPStatusError as http_err:
+        return JsonResponse({"error": "Error HTTP al crear cita en GHL", "details": http_err.response.text},
+                            status=http_err.response.status_code)
+    except CircuitOpenError as e:
+        return unavailable_response(e)
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+    except httpx.RequestError as e:
+        return JsonResponse({"error": "Error conexión GHL", "details": str(e)}, status=502)
+    except Exception as e:
+        return JsonResponse({"error": "Error interno", "details": str(e)}, status=500)
+
+
 # Webhook para recibir notificaciones de citas desde GHL
+# Acepta un evento o una lista de eventos; todo se escribe con un upsert por lote
 @csrf_exempt
+@idempotent("ghl_appointment")
 def appointment_webhook(request):
     if request.method == "POST":
         try:
             data = json.loads(request.body)
 
-            # Extraer datos principales del webhook
-            appointment_data = data.get("appointment", {})
-            appointment_id = data.get("ghl_id") or data.get("id") or appointment_data.get("id")
-            
-            if not appointment_id:
-                appointment_id = f"test-{uuid.uuid4()}"  # ID temporal para pruebas
-
-            # Normalizamos campos
-            calendar_id = data.get("calendarId") or appointment_data.get("calendarId")
-            contact_id = data.get("contactId") or appointment_data.get("contactId")
-            location_id = data.get("locationId") or appointment_data.get("locationId")
-            title = data.get("title") or appointment_data.get("title") or "Cita"
-            appointment_status = (
-                data.get("appointmentStatus") or
-                appointment_data.get("appointmentStatus") or
-                "confirmed"
-            )
-            assigned_user_id = (
-                data.get("assignedUserId") or appointment_data.get("assignedUserId")
-            )
-            notes = data.get("notes") or appointment_data.get("notes")
-            source = data.get("source") or appointment_data.get("source")
-
-            start_time = _to_datetime(data.get("startTime") or appointment_data.get("startTime"))
-            end_time = _to_datetime(data.get("endTime") or appointment_data.get("endTime"))
-
-            # Guardar o actualizar en DB
-            obj, created = Appointment.objects.update_or_create(
-                ghl_id=appointment_id,
-                defaults={
-                    "calendar_id": calendar_id,
-                    "contact_id": contact_id,
-                    "location_id": location_id,
-                    "title": title,
-                    "appointment_status": appointment_status,
-                    "assigned_user_id": assigned_user_id,
-                    "notes": notes,
-                    "start_time": start_time,
-                    "end_time": end_time,
-                    "source": source,
-                }
-            )
+            if isinstance(data, list):
+                # los eventos incompletos se informan y se omiten; el resto se guarda igual
+                rows, errors = [], []
+                for index, event in enumerate(data):
+                    if not isinstance(event, dict):
+                        continue
+                    try:
+                        rows.append(normalize_appointment_event(event))
+                    except ValueError as e:
+                        errors.append({"index": index, "error": str(e)})
+                created = upsert_appointments(rows) if rows else []
+                return JsonResponse({
+                    "ok": True,
+                    "count": len(rows),
+                    "created": sum(created),
+                    "ghl_ids": [row["ghl_id"] for row in rows],
+                    "skipped": len(errors),
+                    "errors": errors,
+                }, status=200)
+
+            row = normalize_appointment_event(data)
+            created = appointment_batcher.submit(row).result(timeout=settings.WEBHOOK_BATCH_TIMEOUT_SECONDS)
 
             return JsonResponse(
-                {"ok": True, "ghl_id": appointment_id, "created": created}, status=200)
+                {"ok": True, "ghl_id": row["ghl_id"], "created": created}, status=200)
+        except (OperationalError, TimeoutError) as e:
+            # BD ocupada (lock) o lote demorado: no es culpa del evento, GHL debe reintentar
+            return busy_response(e)
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=400)
 
-    return JsonResponse({"error": "Método no permitido"}, status=405)
\ No newline at end of file
+    return JsonResponse({"error": "Método no permitido"}, status=405)
+
+
+class StartTimeKeysetPagination(BasePagination):
+    """
+    Paginación keyset sobre (start_time, id): el cursor guarda la última fila
+    devuelta, así que la página 1000 cuesta lo mismo que la primera (sin OFFSET).
+    """
+    default_limit = 100
+    max_limit = 1000
+
+    def _decode(self, cursor):
+        try:
+            start_time, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            start_time, pk = parse_datetime(start_time), int(pk)
+        except (ValueError, TypeError):
+            raise ValidationError({"cursor": "Cursor inválido"})
+        if start_time is None:
+            raise ValidationError({"cursor": "Cursor inválido"})
+        return start_time, pk
+
+    def _encode(self, obj):
+        raw = json.dumps([obj.start_time.isoformat(), obj.id])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            limit = min(max(int(request.query_params.get("limit", self.default_limit)), 1), self.max_limit)
+        except ValueError:
+            raise ValidationError({"limit": "limit debe ser un entero"})
+
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            start_time, pk = self._decode(cursor)
+            # el >= redundante permite buscar en el índice (location_id, start_time, id) en vez de recorrerlo
+            queryset = queryset.filter(start_time__gte=start_time).filter(Q(start_time__gt=start_time) | Q(id__gt=pk))
+
+        page = list(queryset.order_by("start_time", "id")[:limit + 1])
+        self.next_url = None
+        if len(page) > limit:
+            page = page[:limit]
+            params = request.query_params.copy()
+            params["cursor"] = self._encode(page[-1])
+            self.next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({"results": data, "next": self.next_url})
+
+
+# Listado de citas para dashboards: filtros por location, calendario, estado y rango de fechas
+# GET /api/appointments/?location_id=...&calendar_id=...&status=confirmed&start_from=...&start_to=...
+class AppointmentListView(ListAPIView):
+    serializer_class = AppointmentListSerializer
+    pagination_class = StartTimeKeysetPagination
+
+    def get_queryset(self):
+        params = self.request.query_params
+        # columnas que usa AppointmentListSerializer (mantener en sync: una que falte es un query por fila)
+        qs = Appointment.objects.select_related("contact").only(
+            "id", "ghl_id", "location_id", "calendar_id", "title", "appointment_status",
+            "assigned_user_id", "start_time", "end_time",
+            "contact__id", "contact__ghl_id", "contact__first_name",
+            "contact__last_name", "contact__email", "contact__phone",
+        )
+        if params.get("location_id"):
+            qs = qs.filter(location_id=params["location_id"])
+        if params.get("calendar_id"):
+            qs = qs.filter(calendar_id=params["calendar_id"])
+        if params.get("status"):
+            qs = qs.filter(appointment_status__in=params["status"].split(","))
+        for param, lookup in (("start_from", "start_time__gte"), ("start_to", "start_time__lt")):
+            if params.get(param):
+                try:
+                    value = parse_datetime(params[param])
+                except ValueError:  # formato válido pero fecha imposible (ej. mes 13)
+                    value = None
+                if value is None:
+                    raise ValidationError({param: "Fecha ISO8601 inválida"})
+                qs = qs.filter(**{lookup: value})
+        return qs
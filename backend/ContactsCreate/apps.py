@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ContactscreateConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ContactsCreate'
+
+    def ready(self):
+        # invalida el cache de contactos al borrar un Contact
+        from . import resolver  # noqa: F401
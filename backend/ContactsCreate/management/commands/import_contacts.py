@@ -0,0 +1,47 @@
+# ContactsCreate/management/commands/import_contacts.py
+import csv
+import json
+from itertools import islice
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ContactsCreate.services import create_contacts_bulk
+from ghlmp_updates import http_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa contactos desde CSV (first_name,last_name,email,phone,location_id) o NDJSON: "
+        "los crea en GHL con concurrencia acotada y los guarda con bulk_create."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "ndjson"], default=None)
+        parser.add_argument("--concurrency", type=int, default=settings.GHL_BULK_CONCURRENCY)
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        http_client.run_in_background()  # puede esperar el rate limit en vez de fallar rápido
+        path = options["path"]
+        fmt = options["format"] or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+
+        created = failed = 0
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = csv.DictReader(f) if fmt == "csv" else (json.loads(line) for line in f if line.strip())
+            offset = 0
+            while True:
+                chunk = list(islice(rows, options["chunk_size"]))
+                if not chunk:
+                    break
+                for result in create_contacts_bulk(chunk, options["concurrency"]):
+                    if result["ok"]:
+                        created += 1
+                    else:
+                        failed += 1
+                        self.stderr.write(f"Fila {offset + result['index'] + 1}: {result['error']} {result['details']}")
+                offset += len(chunk)
+                self.stdout.write(f"{offset} procesados ({created} creados, {failed} con error)")
+
+        if failed and not created:
+            raise CommandError("No se pudo crear ningún contacto")
+        self.stdout.write(f"Importación terminada: {created} creados, {failed} con error")
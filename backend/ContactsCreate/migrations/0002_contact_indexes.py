@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ContactsCreate', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['email'], name='ContactsCre_email_28482b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['phone'], name='ContactsCre_phone_428e81_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['location_id'], name='ContactsCre_locatio_282dac_idx'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 #ContactsCreate/models.py
+import logging
 from django.db import models
-from ghlmp_updates.ghl_client import add_tag_to_contact, set_custom_field
+from ghlmp_updates.ghl_client import queue_custom_field, queue_tag
+
+logger = logging.getLogger(__name__)
 
 
 class Contact(models.Model):
@@ -15,6 +18,13 @@ class Contact(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["email"]),
+            models.Index(fields=["phone"]),
+            models.Index(fields=["location_id"]),
+        ]
+
     def __str__(self):
         nombre = f"{self.first_name or ''} {self.last_name or ''}".strip()
         return nombre or f"Contacto sin nombre ({self.email or 'sin email'})"
@@ -25,11 +35,16 @@ class Contact(models.Model):
             self.status = "paid"
             self.save()
 
-        # 🔹 Sincronizar con GoHighLevel
+        # 🔹 Sincronizar con GoHighLevel: tag y campo salen en el mismo lote del contacto
         try:
-            add_tag_to_contact(self.contact_id, "pago_confirmado")
-            set_custom_field(self.contact_id, "payment_status", "paid")
-            print(f"[GHL] Contacto {self.contact_id} actualizado correctamente.")
+            pending = [
+                queue_tag(self.contact_id, "pago_confirmado"),
+                queue_custom_field(self.contact_id, "payment_status", "paid"),
+            ]
+            if all(future.result() for future in pending):
+                logger.info("[GHL] Contacto %s actualizado correctamente.", self.contact_id)
+            else:
+                logger.error("[ERROR GHL Sync] GHL rechazó la actualización del contacto %s", self.contact_id)
         except Exception as e:
-            print(f"[ERROR GHL Sync] {e}")
+            logger.error("[ERROR GHL Sync] %s", e)
 
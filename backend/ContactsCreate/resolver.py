@@ -0,0 +1,63 @@
+# ContactsCreate/resolver.py
+# ghl_id de GHL → id local de Contact, con cache en memoria y alta atómica
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import Contact
+from ghlmp_updates.cache import TTLCache
+
+# cache acotado (LRU + TTL): un contacto borrado a mano deja de resolverse como mucho tras el TTL
+contact_cache = TTLCache(maxsize=settings.CONTACT_CACHE_SIZE, ttl=settings.CONTACT_CACHE_TTL_SECONDS)
+
+
+def resolve_contacts(ghl_ids, location_id=None):
+    """
+    Devuelve {ghl_id: contact_pk} para todos los `ghl_ids` con una sola consulta
+    para los que no están en cache. Los que no existen se crean vacíos (solo ghl_id
+    y location) con INSERT ... ON CONFLICT DO NOTHING, así que dos requests
+    concurrentes con el mismo contacto nuevo no chocan por el unique de ghl_id.
+    `ghl_ids` puede ser un dict {ghl_id: location_id} si cada uno trae su location.
+    """
+    locations = ghl_ids if isinstance(ghl_ids, dict) else {}
+    ghl_ids = {ghl_id for ghl_id in ghl_ids if ghl_id}
+    resolved = {}
+    for ghl_id in ghl_ids:
+        pk = contact_cache.get(ghl_id)
+        if pk is not None:
+            resolved[ghl_id] = pk
+    missing = ghl_ids - resolved.keys()
+    if not missing:
+        return resolved
+
+    found = dict(Contact.objects.filter(ghl_id__in=missing).values_list("ghl_id", "id"))
+    new = missing - found.keys()
+    if new:
+        Contact.objects.bulk_create(
+            [Contact(ghl_id=ghl_id, location_id=locations.get(ghl_id) or location_id) for ghl_id in new],
+            ignore_conflicts=True,
+        )
+        found.update(Contact.objects.filter(ghl_id__in=new).values_list("ghl_id", "id"))
+    resolved.update(found)
+
+    # se cachea al confirmar la transacción (o ya, si no hay una): tras un rollback
+    # no deben quedar en cache ids de contactos que no existen
+    transaction.on_commit(lambda: [contact_cache.set(ghl_id, pk) for ghl_id, pk in found.items()])
+    return resolved
+
+
+def resolve_contact(ghl_id, location_id=None):
+    """id local del contacto `ghl_id` (creándolo si no existe), o None si no hay ghl_id."""
+    if not ghl_id:
+        return None
+    return resolve_contacts([ghl_id], location_id=location_id).get(ghl_id)
+
+
+aresolve_contact = sync_to_async(resolve_contact)
+
+
+@receiver(post_delete, sender=Contact)
+def _forget_deleted_contact(sender, instance, **kwargs):
+    if instance.ghl_id:
+        contact_cache.delete(instance.ghl_id)
@@ -0,0 +1,171 @@
+# ContactsCreate/services.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from dotenv import load_dotenv
+from requests.exceptions import RequestException
+from .models import Contact
+from ghl_oauth.tokens import aghl_request, ghl_request
+from ghlmp_updates.batching import MicroBatcher
+from ghlmp_updates.logs import with_correlation
+from ghlmp_updates.ratelimit import RateLimitExceeded
+
+# Cargar .env
+load_dotenv()
+
+# Constantes GHL
+GHL_BASE_URL = os.getenv("GHL_SERVICES_URL", "https://services.leadconnectorhq.com")
+GHL_LOCATION_ID = os.getenv("GHL_LOCATION_ID")
+GHL_API_URL = f"{GHL_BASE_URL}/contacts/"
+
+# campos locales que se actualizan si el contacto ya existía (mismo ghl_id)
+CONTACT_FIELDS = ["first_name", "last_name", "email", "phone", "location_id"]
+
+
+def _ghl_contact_request(data):
+    ghl_payload = {
+        "firstName": data.get("first_name"),
+        "lastName": data.get("last_name"),
+        "email": data.get("email"),
+        "phone": data.get("phone"),
+        "locationId": data.get("location_id") or GHL_LOCATION_ID,
+    }
+
+    headers = {
+        "Version": "2021-07-28"  # 👈 encabezado requerido por la API GHL v2
+    }
+    return ghl_payload, headers
+
+
+def push_contact_to_ghl(data):
+    """Crea el contacto en GHL (API v2) con el token de su location y devuelve la respuesta HTTP."""
+    ghl_payload, headers = _ghl_contact_request(data)
+    return ghl_request(ghl_payload["locationId"], "POST", GHL_API_URL, json=ghl_payload, headers=headers)
+
+
+async def apush_contact_to_ghl(data):
+    """Igual que `push_contact_to_ghl`, con el cliente async."""
+    ghl_payload, headers = _ghl_contact_request(data)
+    return await aghl_request(ghl_payload["locationId"], "POST", GHL_API_URL, json=ghl_payload, headers=headers)
+
+
+def contact_from_ghl(ghl_contact):
+    """Construye (sin guardar) el Contact local a partir de la respuesta de GHL."""
+    return Contact(
+        ghl_id=ghl_contact.get("id"),
+        first_name=ghl_contact.get("firstName"),
+        last_name=ghl_contact.get("lastName"),
+        email=ghl_contact.get("email"),
+        phone=ghl_contact.get("phone"),
+        location_id=ghl_contact.get("locationId"),
+    )
+
+
+def _push_one(item):
+    index, data = item
+    try:
+        response = push_contact_to_ghl(data)
+    except RateLimitExceeded as e:
+        return index, None, {"error": "Cupo de GHL agotado, reintentar", "details": str(e)}
+    except RequestException as e:
+        return index, None, {"error": "Error conexión GHL", "details": str(e)}
+
+    if response.status_code not in (200, 201):
+        return index, None, {"error": "No se pudo crear contacto en GHL", "details": response.text}
+
+    try:
+        body = response.json()
+    except ValueError:
+        return index, None, {"error": "Respuesta inválida de GHL", "details": response.text}
+
+    ghl_contact = body.get("contact") if isinstance(body, dict) else None
+    if not isinstance(ghl_contact, dict) or not ghl_contact.get("id"):
+        return index, None, {"error": "Respuesta de GHL sin id de contacto", "details": response.text}
+    return index, ghl_contact, None
+
+
+def create_contacts_bulk(items, concurrency=None):
+    """
+    Crea muchos contactos: los envía a GHL en paralelo (concurrencia acotada) y
+    guarda los aceptados con un solo bulk_create (upsert por ghl_id).
+    Devuelve un resultado por item, en el mismo orden de entrada.
+    """
+    workers = max(1, concurrency or settings.GHL_BULK_CONCURRENCY)
+    results = [None] * len(items)
+    accepted = []
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(items) or 1)) as pool:
+        for index, ghl_contact, error in pool.map(with_correlation(_push_one), enumerate(items)):
+            if error:
+                results[index] = {"index": index, "ok": False, **error}
+            else:
+                accepted.append((index, contact_from_ghl(ghl_contact)))
+
+    # un mismo ghl_id solo puede aparecer una vez en el upsert
+    unique = {}
+    for index, contact in accepted:
+        unique[contact.ghl_id] = contact
+    Contact.objects.bulk_create(
+        list(unique.values()),
+        update_conflicts=True,
+        unique_fields=["ghl_id"],
+        update_fields=CONTACT_FIELDS,
+    )
+    pks = dict(Contact.objects.filter(ghl_id__in=list(unique)).values_list("ghl_id", "id"))
+
+    for index, contact in accepted:
+        results[index] = {"index": index, "ok": True, "ghl_id": contact.ghl_id, "contact_id": pks.get(contact.ghl_id)}
+    return results
+
+
+def upsert_contacts(contacts_data):
+    """
+    Guarda un lote de contactos del webhook de GHL con un solo upsert
+    (bulk_create con update_conflicts sobre ghl_id). Devuelve `created` por item.
+    """
+    objs = {}
+    for data in contacts_data:
+        contact = Contact(
+            ghl_id=data.get("id"),
+            first_name=data.get("firstName"),
+            last_name=data.get("lastName"),
+            email=data.get("email"),
+            phone=data.get("phone"),
+            location_id=data.get("locationId"),
+        )
+        # el último evento de un mismo contacto gana
+        objs[contact.ghl_id or id(contact)] = contact
+
+    ghl_ids = [c.ghl_id for c in objs.values() if c.ghl_id]
+    with transaction.atomic():
+        existing = set(Contact.objects.filter(ghl_id__in=ghl_ids).values_list("ghl_id", flat=True))
+        Contact.objects.bulk_create(
+            list(objs.values()),
+            update_conflicts=True,
+            unique_fields=["ghl_id"],
+            update_fields=CONTACT_FIELDS,
+        )
+    # solo la primera aparición de un ghl_id nuevo cuenta como creada
+    created = []
+    for data in contacts_data:
+        created.append(data.get("id") not in existing)
+        existing.add(data.get("id"))
+    return created
+
+
+def _flush_contacts(contacts_data):
+    close_old_connections()
+    try:
+        return upsert_contacts(contacts_data)
+    finally:
+        close_old_connections()
+
+
+# eventos sueltos del webhook: se agrupan unos milisegundos y se escriben juntos
+contact_batcher = MicroBatcher(
+    _flush_contacts,
+    max_size=settings.WEBHOOK_BATCH_MAX_SIZE,
+    max_wait=settings.WEBHOOK_BATCH_MAX_WAIT_MS / 1000,
+    name="contact-webhook-batcher",
+)
@@ -1,3 +1,154 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from ContactsCreate.models import Contact
+from ContactsCreate.resolver import contact_cache, resolve_contact, resolve_contacts
+from ghlmp_updates.ratelimit import RateLimitExceeded
+
+
+class ResolveContactsTests(TestCase):
+    def setUp(self):
+        contact_cache.clear()
+        self.addCleanup(contact_cache.clear)
+
+    def resolve(self, ghl_ids, location_id=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return resolve_contacts(ghl_ids, location_id)
+
+    def test_known_contacts_are_resolved_with_one_query(self):
+        pks = {f"g{i}": Contact.objects.create(ghl_id=f"g{i}").pk for i in range(3)}
+
+        with self.assertNumQueries(1):
+            resolved = self.resolve(["g0", "g1", "g2", None])
+
+        self.assertEqual(resolved, pks)
+
+    def test_cached_contacts_need_no_query(self):
+        Contact.objects.create(ghl_id="g1")
+        first = self.resolve(["g1"])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolve(["g1"]), first)
+
+    def test_missing_contacts_are_inserted_and_read_back(self):
+        known = Contact.objects.create(ghl_id="g1").pk
+
+        with self.assertNumQueries(3):  # SELECT, INSERT ... ON CONFLICT DO NOTHING, SELECT de los nuevos
+            resolved = self.resolve({"g1": None, "g2": "loc-2", "g3": None}, location_id="loc-1")
+
+        self.assertEqual(resolved["g1"], known)
+        self.assertEqual(
+            dict(Contact.objects.filter(ghl_id__in=["g2", "g3"]).values_list("ghl_id", "location_id")),
+            {"g2": "loc-2", "g3": "loc-1"},
+        )
+
+    def test_contact_created_concurrently_is_reused(self):
+        real_bulk_create = Contact.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # otro request crea el mismo contacto entre el SELECT y el INSERT
+            Contact.objects.create(ghl_id="g-new", first_name="Otro request")
+            return real_bulk_create(objs, **kwargs)
+
+        with mock.patch.object(Contact.objects, "bulk_create", side_effect=racing_bulk_create):
+            pk = resolve_contact("g-new")
+
+        self.assertEqual(Contact.objects.get(ghl_id="g-new").pk, pk)
+
+    def test_rolled_back_contacts_are_not_cached(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                resolve_contacts(["g-tmp"])
+                raise RuntimeError("falla la escritura de la cita")
+
+        self.assertEqual(callbacks, [])
+        self.assertIsNone(contact_cache.get("g-tmp"))
+        self.assertFalse(Contact.objects.filter(ghl_id="g-tmp").exists())
+
+    def test_deleted_contact_is_forgotten(self):
+        first = self.resolve(["g1"])["g1"]
+
+        Contact.objects.get(pk=first).delete()
+
+        self.assertIsNone(contact_cache.get("g1"))
+        self.assertNotEqual(self.resolve(["g1"])["g1"], first)
+
+
+class FakeGHLResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = body if isinstance(body, str) else json.dumps(body)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def ghl_contact(ghl_id, data):
+    return FakeGHLResponse(201, {"contact": {
+        "id": ghl_id, "firstName": data.get("first_name"), "email": data.get("email"), "locationId": "loc-1",
+    }})
+
+
+class BulkContactCreateTests(TestCase):
+    def post(self, body):
+        return self.client.post("/api/contacts/bulk/", body, content_type="application/json")
+
+    def ghl(self, outcomes):
+        """GHL falso: la respuesta (o excepción) de cada contacto se elige por su email."""
+        def push(data):
+            outcome = outcomes[data["email"]]
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome(data) if callable(outcome) else outcome
+        return mock.patch("ContactsCreate.services.push_contact_to_ghl", side_effect=push)
+
+    def test_failed_items_are_reported_and_the_rest_saved(self):
+        contacts = [{"first_name": name, "email": f"{name}@x.com"} for name in ("ana", "beto", "caro", "dani", "eva", "fede")]
+        outcomes = {
+            "ana@x.com": lambda data: ghl_contact("g-ana", data),
+            "beto@x.com": FakeGHLResponse(422, {"message": "email inválido"}),
+            "caro@x.com": requests.ConnectionError("timeout"),
+            "dani@x.com": FakeGHLResponse(200, "<html>"),
+            "eva@x.com": lambda data: ghl_contact("g-eva", data),
+            "fede@x.com": RateLimitExceeded("ghl", 30),
+        }
+
+        with self.ghl(outcomes):
+            body = self.post({"contacts": contacts}).json()
+
+        self.assertEqual((body["created"], body["failed"]), (2, 4))
+        self.assertEqual([r["index"] for r in body["results"]], list(range(6)))
+        self.assertEqual([r["ok"] for r in body["results"]], [True, False, False, False, True, False])
+        self.assertEqual(
+            [r.get("error") for r in body["results"] if not r["ok"]],
+            ["No se pudo crear contacto en GHL", "Error conexión GHL", "Respuesta inválida de GHL",
+             "Cupo de GHL agotado, reintentar"],
+        )
+        saved = dict(Contact.objects.values_list("ghl_id", "id"))
+        self.assertEqual(set(saved), {"g-ana", "g-eva"})
+        self.assertEqual(body["results"][0]["contact_id"], saved["g-ana"])
+
+    def test_existing_and_repeated_contacts_are_upserted_once(self):
+        existing = Contact.objects.create(ghl_id="g-ana", first_name="Vieja")
+        contacts = [{"first_name": "Ana", "email": "ana@x.com"}, {"first_name": "Ana", "email": "ana2@x.com"}]
+        outcomes = {email: lambda data: ghl_contact("g-ana", data) for email in ("ana@x.com", "ana2@x.com")}
+
+        with self.ghl(outcomes):
+            body = self.post(contacts).json()
+
+        self.assertEqual(body["created"], 2)
+        self.assertEqual({r["contact_id"] for r in body["results"]}, {existing.pk})
+        self.assertEqual(Contact.objects.get().first_name, "Ana")
+
+    @override_settings(CONTACTS_BULK_MAX_ITEMS=2)
+    def test_rejects_empty_and_oversized_batches(self):
+        with self.ghl({}) as push:
+            self.assertEqual(self.post({"contacts": []}).status_code, 400)
+            self.assertEqual(self.post({"contacts": "ana"}).status_code, 400)
+            self.assertEqual(self.post([{"email": f"{n}@x.com"} for n in range(3)]).status_code, 400)
+
+        push.assert_not_called()
@@ -3,5 +3,7 @@ from . import views
 
 urlpatterns = [
     path('create/', views.create_contact, name='create_contact'),
+    path('create/async/', views.create_contact_async, name='create_contact_async'),
+    path('bulk/', views.create_contacts_batch, name='create_contacts_batch'),
     path('webhook/', views.webhook_contact_created, name='webhook_contact_created'),
 ]
\ No newline at end of file
@@ -1,7 +1,7 @@
 # ContactsCreate/views.py
 from django.conf import settings
+from django.db import OperationalError
 from django.shortcuts import render
-from dotenv import load_dotenv
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
@@ -9,24 +9,20 @@ from django.utils.dateparse import parse_datetime
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
-import requests
 import json
-import os
+import httpx
 from .models import Contact
-
-# Cargar .env
-load_dotenv()
-
-# Constantes GHL
-GHL_BASE_URL = "https://services.leadconnectorhq.com"
-GHL_API_VERSION = os.getenv("GHL_API_VERSION", "2021-04-15")
-ACCESS_TOKEN = os.getenv("GHL_ACCESS_TOKEN")
-GHL_LOCATION_ID = os.getenv("GHL_LOCATION_ID")
-GHL_API_URL = f"{GHL_BASE_URL}/contacts/"
-GHL_TOKEN = ACCESS_TOKEN
-
-if not ACCESS_TOKEN:
-    raise Exception("Access Token de GHL no configurado en .env (GHL_ACCESS_TOKEN)")
+from .services import (
+    apush_contact_to_ghl,
+    contact_batcher,
+    contact_from_ghl,
+    create_contacts_bulk,
+    push_contact_to_ghl,
+    upsert_contacts,
+)
+from payments.idempotency import idempotent
+from ghlmp_updates.circuit import CircuitOpenError, busy_response, unavailable_response
+from ghlmp_updates.ratelimit import RateLimitExceeded, rate_limited_response
 
 
 # 🔹 Crear contacto en GHL y guardarlo localmente
@@ -34,21 +30,12 @@ if not ACCESS_TOKEN:
 def create_contact(request):
     data = request.data
 
-    ghl_payload = {
-        "firstName": data.get("first_name"),
-        "lastName": data.get("last_name"),
-        "email": data.get("email"),
-        "phone": data.get("phone"),
-        "locationId": data.get("location_id") or GHL_LOCATION_ID,
-    }
-
-    headers = {
-        "Authorization": f"Bearer {GHL_TOKEN}",
-        "Version": "2021-07-28"  # 👈 encabezado requerido por la API GHL v2
-    }
-
-
-    ghl_response = requests.post(GHL_API_URL, json=ghl_payload, headers=headers)
+    try:
+        ghl_response = push_contact_to_ghl(data)
+    except CircuitOpenError as e:
+        return unavailable_response(e)
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
     if ghl_response.status_code not in [200, 201]:
         return JsonResponse({
             "error": "No se pudo crear contacto en GHL",
@@ -59,14 +46,41 @@ def create_contact(request):
     ghl_contact = ghl_data.get("contact", {})
 
     # Guardar contacto localmente
-    contact = Contact.objects.create(
-        ghl_id=ghl_contact.get("id"),
-        first_name=ghl_contact.get("firstName"),
-        last_name=ghl_contact.get("lastName"),
-        email=ghl_contact.get("email"),
-        phone=ghl_contact.get("phone"),
-        location_id=ghl_contact.get("locationId"),
-    )
+    contact = contact_from_ghl(ghl_contact)
+    contact.save()
+
+    return JsonResponse({
+        "message": "Contacto creado correctamente",
+        "contact_id": contact.id
+    })
+
+
+# Versión async (ASGI): no bloquea un hilo durante el round trip a GHL
+@csrf_exempt
+async def create_contact_async(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+
+    try:
+        ghl_response = await apush_contact_to_ghl(data)
+    except CircuitOpenError as e:
+        return unavailable_response(e)
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+    except httpx.RequestError as e:
+        return JsonResponse({"error": "Error conexión GHL", "details": str(e)}, status=502)
+    if ghl_response.status_code not in [200, 201]:
+        return JsonResponse({
+            "error": "No se pudo crear contacto en GHL",
+            "details": ghl_response.text
+        }, status=400)
+
+    contact = contact_from_ghl(ghl_response.json().get("contact", {}))
+    await contact.asave()
 
     return JsonResponse({
         "message": "Contacto creado correctamente",
@@ -74,27 +88,51 @@ def create_contact(request):
     })
 
 
+# 🔹 Crear muchos contactos (onboarding de clínicas): {"contacts": [...]} o una lista
+@api_view(['POST'])
+def create_contacts_batch(request):
+    items = request.data.get("contacts") if isinstance(request.data, dict) else request.data
+    if not isinstance(items, list) or not items:
+        return JsonResponse({"error": "Se espera una lista de contactos"}, status=400)
+    if len(items) > settings.CONTACTS_BULK_MAX_ITEMS:
+        return JsonResponse({"error": f"Máximo {settings.CONTACTS_BULK_MAX_ITEMS} contactos por request"}, status=400)
+
+    results = create_contacts_bulk(items)
+    created = sum(1 for r in results if r["ok"])
+    return JsonResponse({
+        "created": created,
+        "failed": len(results) - created,
+        "results": results,
+    })
+
+
 # 🔔 Webhook para sincronizar contactos creados o actualizados en GHL
+# Acepta un evento ({"contact": {...}}) o una lista de eventos; todo se escribe con un upsert por lote
 @csrf_exempt
+@idempotent("ghl_contact")
 def webhook_contact_created(request):
     if request.method == "POST":
         payload = json.loads(request.body)
+        events = payload if isinstance(payload, list) else [payload]
 
-        contact_data = payload.get("contact", {})
-        if not contact_data:
+        contacts = [e.get("contact") for e in events if isinstance(e, dict) and e.get("contact")]
+        if not contacts:
             return JsonResponse({"error": "Payload sin contacto"}, status=400)
 
-        contact, created = Contact.objects.update_or_create(
-            ghl_id=contact_data.get("id"),
-            defaults={
-                "first_name": contact_data.get("firstName"),
-                "last_name": contact_data.get("lastName"),
-                "email": contact_data.get("email"),
-                "phone": contact_data.get("phone"),
-                "location_id": contact_data.get("locationId"),
-            },
-        )
-
+        try:
+            if isinstance(payload, list):
+                created = upsert_contacts(contacts)
+                return JsonResponse({
+                    "message": "Contactos sincronizados correctamente",
+                    "count": len(contacts),
+                    "created": sum(created),
+                    "skipped": len(events) - len(contacts),
+                })
+
+            created = contact_batcher.submit(contacts[0]).result(timeout=settings.WEBHOOK_BATCH_TIMEOUT_SECONDS)
+        except (OperationalError, TimeoutError) as e:
+            # BD ocupada (lock) o lote demorado: no es culpa del evento, GHL debe reintentar
+            return busy_response(e)
         return JsonResponse({
             "message": "Contacto sincronizado correctamente",
             "created": created,
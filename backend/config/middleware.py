@@ -0,0 +1,77 @@
+# config/middleware.py
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from ghlmp_updates.logs import CORRELATION_HEADER, correlation
+from ghlmp_updates.metrics import HTTP_REQUEST_DURATION
+
+
+def _incoming_correlation_id(request):
+    # el del llamador si lo manda (MP envía X-Request-Id); si no, uno nuevo
+    value = request.headers.get(CORRELATION_HEADER) or request.headers.get("X-Request-Id") or ""
+    return value.strip()[:64] or None
+
+
+class CorrelationIdMiddleware:
+    """
+    Fija el correlation id del request (contextvar) para que los logs, las filas de
+    la cola / outbox y las llamadas a GHL / MP lo lleven; se devuelve en la respuesta.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with correlation(_incoming_correlation_id(request)) as correlation_id:
+            response = self.get_response(request)
+        response[CORRELATION_HEADER] = correlation_id
+        return response
+
+    async def __acall__(self, request):
+        with correlation(_incoming_correlation_id(request)) as correlation_id:
+            response = await self.get_response(request)
+        response[CORRELATION_HEADER] = correlation_id
+        return response
+
+
+class RequestMetricsMiddleware:
+    """
+    Latencia de cada request en `http_request_duration_seconds`, etiquetada con la
+    ruta de la URL (no el path real, para no crear una serie por id), método y status.
+    Funciona en WSGI y en ASGI sin forzar el cambio de modo de las vistas async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    def _observe(self, request, response, started):
+        match = getattr(request, "resolver_match", None)
+        route = f"/{match.route}" if match is not None else "unmatched"
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - started, route=route, method=request.method, status=response.status_code
+        )
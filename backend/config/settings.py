@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.middleware.CorrelationIdMiddleware',  # correlation id de logs / cola / llamadas salientes
+    'config.middleware.RequestMetricsMiddleware',  # latencia por endpoint (/metrics)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,7 +86,14 @@ WSGI_APPLICATION = 'config.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('DATABASE_PATH') or BASE_DIR / 'db.sqlite3',
+        # IMMEDIATE: cada transacción toma el lock de escritura al empezar (si no, pasar de
+        # lectura a escritura a mitad de un upsert falla al instante con "database is locked");
+        # timeout: segundos que se espera ese lock antes de fallar
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': int(os.getenv('SQLITE_TIMEOUT_SECONDS', '20')),
+        },
     }
 }
 
@@ -129,7 +138,7 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-BASE_GHL_URL = 'https://services.leadconnectorhq.com'
+BASE_GHL_URL = os.getenv("GHL_SERVICES_URL", "https://services.leadconnectorhq.com")
 GHL_ACCESS_TOKEN = os.getenv("GHL_ACCESS_TOKEN") 
 
 GHL_CLIENT_ID = os.getenv("GHL_CLIENT_ID") 
@@ -149,4 +158,69 @@ CORS_ALLOWED_ORIGINS = [
     "https://*.trycloudflare.com",
     "http://localhost:3000",
     "http://127.0.0.1:3000",
-]
\ No newline at end of file
+]
+
+# Cola de webhooks (payments/jobs.py) y worker `process_webhooks`
+WEBHOOK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_QUEUE_MAX_ATTEMPTS", "8"))
+WEBHOOK_QUEUE_RETRY_BASE_SECONDS = int(os.getenv("WEBHOOK_QUEUE_RETRY_BASE_SECONDS", "5"))
+WEBHOOK_QUEUE_LOCK_TIMEOUT_SECONDS = int(os.getenv("WEBHOOK_QUEUE_LOCK_TIMEOUT_SECONDS", "300"))
+WEBHOOK_WORKER_CONCURRENCY = int(os.getenv("WEBHOOK_WORKER_CONCURRENCY", "4"))
+WEBHOOK_WORKER_BATCH_SIZE = int(os.getenv("WEBHOOK_WORKER_BATCH_SIZE", "50"))
+WEBHOOK_WORKER_POLL_SECONDS = float(os.getenv("WEBHOOK_WORKER_POLL_SECONDS", "1"))
+
+# Outbox de sincronización con GHL (payments/outbox.py) y `dispatch_outbox`
+GHL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("GHL_OUTBOX_MAX_ATTEMPTS", "10"))
+GHL_OUTBOX_RETRY_BASE_SECONDS = int(os.getenv("GHL_OUTBOX_RETRY_BASE_SECONDS", "10"))
+GHL_OUTBOX_RETRY_MAX_SECONDS = int(os.getenv("GHL_OUTBOX_RETRY_MAX_SECONDS", "3600"))
+GHL_OUTBOX_BATCH_SIZE = int(os.getenv("GHL_OUTBOX_BATCH_SIZE", "100"))
+GHL_OUTBOX_CONCURRENCY = int(os.getenv("GHL_OUTBOX_CONCURRENCY", "4"))
+
+# Alta masiva de contactos (ContactsCreate/services.py)
+GHL_BULK_CONCURRENCY = int(os.getenv("GHL_BULK_CONCURRENCY", "8"))
+CONTACTS_BULK_MAX_ITEMS = int(os.getenv("CONTACTS_BULK_MAX_ITEMS", "1000"))
+
+# Micro-batches de los webhooks de GHL (contactos / citas)
+WEBHOOK_BATCH_MAX_SIZE = int(os.getenv("WEBHOOK_BATCH_MAX_SIZE", "200"))
+WEBHOOK_BATCH_MAX_WAIT_MS = int(os.getenv("WEBHOOK_BATCH_MAX_WAIT_MS", "25"))
+WEBHOOK_BATCH_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_BATCH_TIMEOUT_SECONDS", "10"))
+
+# Idempotencia de webhooks (payments/idempotency.py) y `purge_webhook_receipts`
+WEBHOOK_DEDUPE_TTL_SECONDS = int(os.getenv("WEBHOOK_DEDUPE_TTL_SECONDS", str(3 * 24 * 3600)))
+
+# Links de pago automáticos para citas del webhook de GHL (payments/links.py)
+# Sin monto configurado no se generan links automáticos.
+PAYMENT_LINK_AMOUNT = os.getenv("PAYMENT_LINK_AMOUNT", "")
+PAYMENT_LINK_AMOUNTS_BY_CALENDAR = os.getenv("PAYMENT_LINK_AMOUNTS_BY_CALENDAR", "")  # {"calendarId": 80.0}
+PAYMENT_LINK_STATUSES = os.getenv("PAYMENT_LINK_STATUSES", "new,booked,confirmed").split(",")
+PAYMENT_LINK_BATCH_SIZE = int(os.getenv("PAYMENT_LINK_BATCH_SIZE", "50"))
+PAYMENT_LINK_CONCURRENCY = int(os.getenv("PAYMENT_LINK_CONCURRENCY", "8"))
+PAYMENT_LINK_FIELD_KEY = os.getenv("PAYMENT_LINK_FIELD_KEY", "payment_link")
+
+# Cache de ghl_id → id local de contactos (ContactsCreate/resolver.py)
+CONTACT_CACHE_SIZE = int(os.getenv("CONTACT_CACHE_SIZE", "10000"))
+CONTACT_CACHE_TTL_SECONDS = int(os.getenv("CONTACT_CACHE_TTL_SECONDS", "600"))
+
+# Logging estructurado (JSON) con handler no bloqueante (ghlmp_updates/logs.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")  # "payments.links=0.1,ghlmp_updates.http_client=0.5"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {
+        "sampling": {"()": "ghlmp_updates.logs.SamplingFilter", "rates": LOG_SAMPLE_RATES},
+        "correlation": {"()": "ghlmp_updates.logs.CorrelationIdFilter"},
+    },
+    "handlers": {
+        "json": {
+            "()": "ghlmp_updates.logs.AsyncJsonHandler",
+            "queue_size": LOG_QUEUE_SIZE,
+            "filters": ["sampling", "correlation"],
+        },
+    },
+    "root": {"handlers": ["json"], "level": LOG_LEVEL},
+    "loggers": {
+        "django": {"handlers": ["json"], "level": LOG_LEVEL, "propagate": False},
+    },
+}
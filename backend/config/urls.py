@@ -16,9 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from config.views import circuit_status, metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('health/circuits/', circuit_status, name='circuit_status'),
+    path('metrics', metrics, name='metrics'),
     path('api/appointments/', include('AppointmentCreate.urls')),
     path('api/contacts/', include('ContactsCreate.urls')),
     path('api/payments/', include('payments.urls')),
@@ -0,0 +1,16 @@
+# config/views.py
+from django.http import HttpResponse, JsonResponse
+from ghlmp_updates import http_client
+from ghlmp_updates.metrics import registry
+
+
+def circuit_status(request):
+    """Estado de los circuit breakers de los upstreams (GHL / MP) en este proceso."""
+    states = http_client.circuit_states()
+    degraded = [host for host, state in states.items() if state["state"] != "closed"]
+    return JsonResponse({"ok": not degraded, "degraded": degraded, "circuits": states})
+
+
+def metrics(request):
+    """Métricas en formato texto de Prometheus (todos los procesos si hay METRICS_DIR)."""
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -4,6 +4,7 @@ class GHLClient(models.Model):
     location_id = models.CharField(max_length=255, unique=True)
     access_token = models.TextField()
     refresh_token = models.TextField()
+    expires_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -1,3 +1,149 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from ghl_oauth.models import GHLClient
+from ghl_oauth.tokens import ghl_tokens
+from ghlmp_updates.ghl_client import contact_mutations, queue_custom_field, queue_tag
+from payments.models import GHLOutbox
+from payments.outbox import dispatch_pending
+
+
+class FakeResponse:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.text = "{}"
+
+
+# TransactionTestCase: el outbox envía desde hilos, que no ven una transacción de test abierta
+class GHLDeliveryTests(TransactionTestCase):
+    def setUp(self):
+        ghl_tokens.invalidate()
+        self.addCleanup(ghl_tokens.invalidate)
+        GHLClient.objects.create(
+            location_id="loc-a", access_token="tok-a", refresh_token="refresh-a",
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+        self.calls = []
+        self.sent = []
+
+    def send(self, *statuses):
+        """Parchea el cliente HTTP: registra cada llamada y responde los status dados en orden."""
+        statuses = list(statuses)
+
+        def request(method, url, tenant=None, headers=None, **kwargs):
+            self.calls.append((tenant, headers["Authorization"]))
+            self.sent.append((method, url.rsplit("/contacts/", 1)[1], kwargs.get("json")))
+            return FakeResponse(statuses.pop(0) if statuses else 200)
+
+        return mock.patch("ghlmp_updates.http_client.request", side_effect=request)
+
+    def test_each_location_is_sent_with_its_own_token(self):
+        GHLOutbox.objects.create(contact_id="c1", location_id="loc-a", operation="add_tag", payload={"tag": "pago_confirmado"})
+        GHLOutbox.objects.create(contact_id="c2", location_id="loc-b", operation="add_tag", payload={"tag": "pago_confirmado"})
+
+        with mock.patch.dict("os.environ", {"GHL_ACCESS_TOKEN": "env-token"}), self.send():
+            self.assertEqual(dispatch_pending(), (2, 2))
+
+        # loc-b no tiene instalación propia: usa el token del .env
+        self.assertCountEqual(self.calls, [("loc-a", "Bearer tok-a"), ("loc-b", "Bearer env-token")])
+        self.assertFalse(GHLOutbox.objects.exclude(status="sent").exists())
+
+    def test_unauthorized_refreshes_the_location_token_and_retries(self):
+        GHLOutbox.objects.create(contact_id="c1", location_id="loc-a", operation="add_tag", payload={"tag": "pago_confirmado"})
+
+        def refresh(row):
+            row.access_token = "tok-a2"
+            return True
+
+        with mock.patch.object(ghl_tokens, "refresh_row", side_effect=refresh), self.send(401, 200):
+            self.assertEqual(dispatch_pending(), (1, 1))
+
+        self.assertEqual(self.calls, [("loc-a", "Bearer tok-a"), ("loc-a", "Bearer tok-a2")])
+
+    def test_rejected_mutation_stays_pending_for_retry(self):
+        row = GHLOutbox.objects.create(contact_id="c1", location_id="loc-a", operation="add_tag", payload={"tag": "pago_confirmado"})
+
+        with self.send(500):
+            self.assertEqual(dispatch_pending(), (0, 1))
+
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ("pending", 1))
+        self.assertGreater(row.next_attempt_at, timezone.now())
+
+    def test_mutations_inside_the_window_go_out_as_one_call_per_kind(self):
+        with mock.patch.object(contact_mutations, "max_wait", 0.5), self.send():
+            pending = [
+                queue_tag("c1", "pago_confirmado", "loc-a"),
+                queue_custom_field("c1", "payment_status", "paid", "loc-a"),
+                queue_tag("c1", "cliente", "loc-a"),
+                queue_custom_field("c1", "payment_link", "https://mp.test/1", "loc-a"),
+                queue_custom_field("c1", "payment_status", "refunded", "loc-a"),
+                queue_tag("c2", "pago_confirmado", "loc-a"),
+            ]
+            self.assertTrue(all(future.result(timeout=5) for future in pending))
+
+        self.assertCountEqual(self.sent, [
+            ("POST", "c1/tags", {"tags": ["pago_confirmado", "cliente"]}),
+            ("PATCH", "c1", {"customFields": {"payment_status": "refunded", "payment_link": "https://mp.test/1"}}),
+            ("POST", "c2/tags", {"tags": ["pago_confirmado"]}),
+        ])
+
+
+class TokenRefreshTests(TransactionTestCase):
+    def setUp(self):
+        ghl_tokens.invalidate()
+        self.addCleanup(ghl_tokens.invalidate)
+        # vence dentro del margen de refresh: el próximo get() refresca
+        GHLClient.objects.create(
+            location_id="loc-a", access_token="tok-a", refresh_token="refresh-a",
+            expires_at=timezone.now() + timedelta(minutes=1),
+        )
+
+    def refresh(self, side_effect):
+        return mock.patch.object(ghl_tokens, "refresh_row", side_effect=side_effect)
+
+    def new_token(self, row, token):
+        row.access_token, row.refresh_token = token, f"refresh-{token}"
+        row.expires_at = timezone.now() + timedelta(hours=1)
+
+    def test_refresh_call_runs_outside_a_transaction_and_is_saved(self):
+        def refresh(row):
+            self.assertFalse(connection.in_atomic_block)  # sin lock de escritura durante la llamada
+            self.new_token(row, "tok-b")
+            return True
+
+        with self.refresh(refresh):
+            self.assertEqual(ghl_tokens.get("loc-a"), "tok-b")
+
+        row = GHLClient.objects.get()
+        self.assertEqual((row.access_token, row.refresh_token), ("tok-b", "refresh-tok-b"))
+
+    def test_token_saved_by_another_process_wins(self):
+        def refresh(row):
+            GHLClient.objects.update(access_token="tok-other", expires_at=timezone.now() + timedelta(hours=1))
+            self.new_token(row, "tok-mine")
+            return True
+
+        with self.refresh(refresh):
+            self.assertEqual(ghl_tokens.get("loc-a"), "tok-other")
+
+        self.assertEqual(GHLClient.objects.get().access_token, "tok-other")
+
+    def test_failed_refresh_uses_the_token_another_process_saved(self):
+        def refresh(row):
+            # el otro proceso gastó el refresh_token (de un solo uso) y guardó su token
+            GHLClient.objects.update(access_token="tok-other", expires_at=timezone.now() + timedelta(hours=1))
+            return False
+
+        with self.refresh(refresh):
+            self.assertEqual(ghl_tokens.get("loc-a"), "tok-other")
+
+    def test_failed_refresh_keeps_the_current_token(self):
+        with self.refresh(lambda row: False):
+            self.assertEqual(ghl_tokens.get("loc-a"), "tok-a")
+
+        self.assertEqual(GHLClient.objects.get().access_token, "tok-a")
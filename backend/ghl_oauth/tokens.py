@@ -0,0 +1,45 @@
+# backend/ghl_oauth/tokens.py
+import os
+from ghlmp_updates import http_client
+from ghlmp_updates.tokens import TokenProvider
+from .models import GHLClient
+from .utils import refresh_ghl_token
+
+
+# 🔹 Límites de la API de GHL por location: ráfaga (100 cada 10 s) y cupo diario
+GHL_RATE_LIMIT_PER_SECOND = float(os.getenv("GHL_RATE_LIMIT_PER_SECOND", "10"))
+GHL_RATE_LIMIT_BURST = int(os.getenv("GHL_RATE_LIMIT_BURST", "100"))
+GHL_DAILY_LIMIT = int(os.getenv("GHL_DAILY_LIMIT", "200000"))
+# GHL lento no debe retener un worker 15 s: timeout de lectura propio (fail-fast + circuit breaker)
+GHL_READ_TIMEOUT = float(os.getenv("GHL_READ_TIMEOUT", "8"))
+
+for _base in (os.getenv("GHL_SERVICES_URL", "https://services.leadconnectorhq.com"), os.getenv("GHL_BASE_URL", "https://api.gohighlevel.com/v1")):
+    http_client.configure_pool(_base, timeout=(http_client.HTTP_CONNECT_TIMEOUT, GHL_READ_TIMEOUT))
+    http_client.configure_rate_limit(
+        _base,
+        (GHL_RATE_LIMIT_PER_SECOND, GHL_RATE_LIMIT_BURST),
+        (GHL_DAILY_LIMIT / 86400, GHL_DAILY_LIMIT),
+    )
+
+
+def _load_client(location_id):
+    return GHLClient.objects.filter(location_id=location_id).first()
+
+
+# tokens de GHL por location_id (cache en memoria + refresh single-flight);
+# una location sin instalar usa el token del .env (instalación de una sola clínica)
+ghl_tokens = TokenProvider(
+    _load_client,
+    refresh_ghl_token,
+    default_token=lambda: os.getenv("GHL_ACCESS_TOKEN") or os.getenv("GHL_TOKEN"),
+    name="GHL",
+)
+
+
+def ghl_request(location_id, method, url, **kwargs):
+    """Request a GHL con el token de la location (pool propio, reintenta una vez ante 401)."""
+    return ghl_tokens.request(location_id or None, method, url, **kwargs)
+
+
+async def aghl_request(location_id, method, url, **kwargs):
+    return await ghl_tokens.arequest(location_id or None, method, url, **kwargs)
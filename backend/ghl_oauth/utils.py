@@ -1,11 +1,16 @@
+import logging
 from .models import GHLClient
-import requests
+from ghlmp_updates import http_client
 from django.conf import settings
+from ghlmp_updates.tokens import token_expiry
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 def refresh_ghl_token(client: GHLClient):
     """
-    Refresca el access_token de un cliente de GHL usando su refresh_token.
+    Pide un access_token nuevo para un cliente de GHL usando su refresh_token.
+    Solo actualiza `client`: TokenProvider lo guarda (compare-and-set).
     """
     url = "https://services.leadconnectorhq.com/oauth/token"
     payload = {
@@ -15,15 +20,15 @@ def refresh_ghl_token(client: GHLClient):
         "refresh_token": client.refresh_token,
     }
 
-    response = requests.post(url, data=payload)
+    response = http_client.post(url, data=payload)
 
     if response.status_code == 200:
         data = response.json()
         client.access_token = data["access_token"]
         client.refresh_token = data.get("refresh_token", client.refresh_token)
-        client.save()
-        print(f"🔁 Token actualizado para {client.location_id}")
+        client.expires_at = token_expiry(data)
+        logger.info("🔁 Token actualizado para %s", client.location_id)
         return True
     else:
-        print(f"⚠️ Error al refrescar token ({client.location_id}): {response.text}")
+        logger.warning("⚠️ Error al refrescar token (%s): %s", client.location_id, response.text)
         return False
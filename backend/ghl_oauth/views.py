@@ -1,9 +1,15 @@
 # backend/ghl_oauth/views.py
 from django.shortcuts import render
-import os, requests
+import logging
+import os
 from django.http import JsonResponse, HttpResponseRedirect
 from django.conf import settings
 from .models import GHLClient
+from .tokens import ghl_tokens
+from ghlmp_updates.tokens import token_expiry
+from ghlmp_updates import http_client
+
+logger = logging.getLogger(__name__)
 
 
 # Lee variables desde settings.py (o .env)
@@ -38,7 +44,7 @@ def ghl_callback(request):
     }
 
     # ✅ IMPORTANTE: usar files= para multipart/form-data
-    token_res = requests.post(token_url, data=payload)
+    token_res = http_client.post(token_url, data=payload)
 
     try:
         token_data = token_res.json()
@@ -50,7 +56,7 @@ def ghl_callback(request):
         }, status=400)
 
     if "access_token" not in token_data:
-        print("Error en token response:", token_data)
+        logger.error("Error en token response: %s", token_data)
         return JsonResponse({"error": "invalid_token_response", "details": token_data}, status=400)
 
     access_token = token_data.get("access_token")
@@ -69,7 +75,7 @@ def ghl_callback(request):
             "Version": "2021-07-28",   # 👈 obligatorio
             "Accept": "application/json"
             }
-        me_res = requests.get(me_url, headers=headers)
+        me_res = http_client.get(me_url, headers=headers)
         me_data = me_res.json()
         locations = me_data.get("company", {}).get("locations", [])
         location_id = locations[0].get("id") if locations else None
@@ -88,7 +94,7 @@ def ghl_callback(request):
     location_id = locations[0].get("id") if locations else None
     '''
     if not location_id:
-        print("Error: no se pudo obtener location_id:", me_data)
+        logger.error("Error: no se pudo obtener location_id: %s", me_data)
         return JsonResponse({"error": "missing_location_id", "details": me_data}, status=400)
 
     # Paso 3: Guardar en la base de datos
@@ -97,13 +103,16 @@ def ghl_callback(request):
         defaults={
             "access_token": access_token,
             "refresh_token": refresh_token,
+            "expires_at": token_expiry(token_data),
         },
     )
 
     if not created:
         client.access_token = access_token
         client.refresh_token = refresh_token
+        client.expires_at = token_expiry(token_data)
         client.save()
+    ghl_tokens.invalidate(location_id)
 
     return JsonResponse({
         "status": "ok",
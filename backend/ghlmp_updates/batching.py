@@ -0,0 +1,68 @@
+# batching.py
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Agrupa items enviados desde varios hilos (requests concurrentes) y los
+    procesa juntos con `flush(items) -> resultados` en un hilo propio.
+    Se vacía al llegar a `max_size` items o tras `max_wait` segundos.
+    Si el flush del lote falla, cada item se reintenta solo: uno inválido no
+    arrastra a los demás y cada Future recibe su propio resultado o error.
+    """
+
+    def __init__(self, flush, max_size=100, max_wait=0.05, name="micro-batcher"):
+        self.flush = flush
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.name = name
+        self._items = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, item):
+        """Encola un item; el Future se resuelve con su resultado tras el flush."""
+        future = Future()
+        with self._cond:
+            self._items.append((item, future))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return future
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_wait
+            while len(self._items) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._items = self._items[:self.max_size], self._items[self.max_size:]
+        return batch
+
+    def _flush_one(self, item):
+        try:
+            return self.flush([item])[0]
+        except Exception as e:
+            return e
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            items = [item for item, _ in batch]
+            try:
+                results = self.flush(items)
+            except Exception as e:
+                results = [e] if len(items) == 1 else [self._flush_one(item) for item in items]
+            for (_, future), result in zip(batch, results):
+                # un item puede fallar sin tumbar el lote: su resultado es la excepción
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
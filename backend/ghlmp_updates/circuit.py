@@ -0,0 +1,126 @@
+# circuit.py
+import logging
+import os
+import threading
+import time
+from django.http import JsonResponse
+from dotenv import load_dotenv
+from requests.exceptions import RequestException
+
+# Cargar variables de entorno (.env)
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 🔹 Circuit breaker por upstream (host)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(RequestException):
+    """El upstream está caído (breaker abierto): se falla sin hacer la llamada."""
+
+    def __init__(self, name, retry_in):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"Circuito abierto para {name}; reintentar en {retry_in:.0f}s")
+
+
+def unavailable_response(error):
+    """503 inmediato para una vista cuando el circuito del upstream está abierto."""
+    response = JsonResponse(
+        {"error": "Servicio externo no disponible", "details": str(error), "retry_in": round(error.retry_in)},
+        status=503,
+    )
+    response["Retry-After"] = str(max(1, round(error.retry_in)))
+    return response
+
+
+def busy_response(error, retry_in=1):
+    """503 cuando la BD está ocupada (lock de SQLite, lote demorado): el emisor debe reintentar."""
+    response = JsonResponse({"error": "Servicio ocupado, reintentar", "details": str(error)}, status=503)
+    response["Retry-After"] = str(retry_in)
+    return response
+
+
+class CircuitBreaker:
+    """
+    closed → open tras `failure_threshold` fallos seguidos (errores de conexión,
+    timeouts o 5xx). Abierto, toda llamada falla al instante durante `reset_timeout`;
+    luego pasa a half_open y deja pasar `half_open_probes` llamadas de prueba:
+    si salen bien se cierra, si fallan vuelve a abrirse.
+    `clock` (segundos monótonos) se puede reemplazar en tests.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout=CIRCUIT_RESET_SECONDS, half_open_probes=CIRCUIT_HALF_OPEN_PROBES,
+                 clock=time.monotonic):
+        self.name = name
+        self.clock = clock
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.total_failures = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def retry_in(self):
+        """Segundos hasta el próximo intento de prueba (0 si no está abierto)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def before_call(self):
+        """Lanza CircuitOpenError si la llamada no debe hacerse."""
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.retry_in())
+                self.state = HALF_OPEN
+                self.probes = 0
+                logger.warning("🟡 Circuito %s: half-open (probando)", self.name)
+            if self.state == HALF_OPEN:
+                if self.probes >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self.probes += 1
+
+    def release_probe(self):
+        """La llamada autorizada por `before_call` no se hizo (ej. rate limit): libera su lugar de prueba."""
+        with self._lock:
+            if self.state == HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("🟢 Circuito %s: cerrado", self.name)
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.total_failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.error("🔴 Circuito %s: abierto tras %s fallos", self.name, self.failures)
+                self.state = OPEN
+                self.opened_at = self.clock()
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "total_failures": self.total_failures,
+            "rejected": self.rejected,
+            "retry_in": round(self.retry_in(), 1),
+        }
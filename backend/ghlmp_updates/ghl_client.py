@@ -1,20 +1,31 @@
 # ghl_client.py
+import logging
 import os
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from django.db import close_old_connections
 from dotenv import load_dotenv
+from ghl_oauth.tokens import ghl_request
+from ghlmp_updates.batching import MicroBatcher
+from ghlmp_updates.logs import correlation, get_correlation_id
 
 
 # Cargar variables de entorno (.env)
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # 🔹 Configuración base de la API de GoHighLevel
-GHL_TOKEN = os.getenv("GHL_TOKEN")
+# El token se resuelve por location (GHLClient); sin location se usa el del .env
 GHL_BASE = os.getenv("GHL_BASE_URL", "https://api.gohighlevel.com/v1")
 HEADERS = {
-    "Authorization": f"Bearer {GHL_TOKEN}",
     "Content-Type": "application/json"
 }
 
+# 🔹 Buffer de mutaciones por contacto (tags + campos personalizados)
+GHL_MUTATION_WINDOW_MS = float(os.getenv("GHL_MUTATION_WINDOW_MS", "50"))
+GHL_MUTATION_BATCH_SIZE = int(os.getenv("GHL_MUTATION_BATCH_SIZE", "200"))
+GHL_MUTATION_CONCURRENCY = int(os.getenv("GHL_MUTATION_CONCURRENCY", "4"))
+
 # --------------------------------------------------------------------------
 # 🔹 CONTACTOS
 # --------------------------------------------------------------------------
@@ -32,14 +43,14 @@ def create_contact(contact):
         "locationId": contact.location_id,
     }
 
-    r = requests.post(f"{GHL_BASE}/contacts/", json=payload, headers=HEADERS)
+    r = ghl_request(contact.location_id, "POST", f"{GHL_BASE}/contacts/", json=payload, headers=HEADERS)
     if r.status_code in (200, 201):
         data = r.json()
         contact.ghl_id = data.get("contact", {}).get("id") or data.get("id")
         contact.save()
         return contact.ghl_id
     else:
-        print(f"[GHL ERROR create_contact] {r.text}")
+        logger.error("[GHL ERROR create_contact] %s", r.text)
         return None
 
 
@@ -48,7 +59,7 @@ def update_contact(contact):
     Actualiza los datos de un contacto existente en GHL.
     """
     if not contact.ghl_id:
-        print("[GHL WARNING] No se puede actualizar, contacto sin ghl_id.")
+        logger.warning("[GHL WARNING] No se puede actualizar, contacto sin ghl_id.")
         return False
 
     payload = {
@@ -58,43 +69,149 @@ def update_contact(contact):
         "phone": contact.phone,
     }
 
-    r = requests.patch(f"{GHL_BASE}/contacts/{contact.ghl_id}", json=payload, headers=HEADERS)
+    r = ghl_request(contact.location_id, "PATCH", f"{GHL_BASE}/contacts/{contact.ghl_id}", json=payload, headers=HEADERS)
     if r.status_code in (200, 201):
         return True
     else:
-        print(f"[GHL ERROR update_contact] {r.text}")
+        logger.error("[GHL ERROR update_contact] %s", r.text)
         return False
 
 
-def add_tag_to_contact(contact_id, tag_name):
+def add_tags_to_contact(contact_id, tags, location_id=None):
     """
-    Agrega un tag (etiqueta) a un contacto en GHL.
+    Agrega uno o más tags (etiquetas) a un contacto en GHL con una sola llamada.
     """
-    r = requests.post(
+    r = ghl_request(
+        location_id,
+        "POST",
         f"{GHL_BASE}/contacts/{contact_id}/tags",
-        json={"tagName": tag_name},
+        json={"tags": list(tags)},
         headers=HEADERS,
     )
     if r.status_code in (200, 201):
         return True
     else:
-        print(f"[GHL ERROR add_tag_to_contact] {r.text}")
+        logger.error("[GHL ERROR add_tags_to_contact] %s", r.text, extra={"contact_id": contact_id})
         return False
 
 
-def set_custom_field(contact_id, field_key, value):
+def add_tag_to_contact(contact_id, tag_name, location_id=None):
     """
-    Actualiza un campo personalizado del contacto.
+    Agrega un tag (etiqueta) a un contacto en GHL.
+    """
+    return add_tags_to_contact(contact_id, [tag_name], location_id)
+
+
+def set_custom_fields(contact_id, fields, location_id=None):
     """
-    payload = {"customFields": {field_key: value}}
-    r = requests.patch(f"{GHL_BASE}/contacts/{contact_id}", json=payload, headers=HEADERS)
+    Actualiza varios campos personalizados del contacto con una sola llamada.
+    """
+    payload = {"customFields": dict(fields)}
+    r = ghl_request(location_id, "PATCH", f"{GHL_BASE}/contacts/{contact_id}", json=payload, headers=HEADERS)
     if r.status_code in (200, 201):
         return True
     else:
-        print(f"[GHL ERROR set_custom_field] {r.text}")
+        logger.error("[GHL ERROR set_custom_fields] %s", r.text, extra={"contact_id": contact_id})
         return False
 
 
+def set_custom_field(contact_id, field_key, value, location_id=None):
+    """
+    Actualiza un campo personalizado del contacto.
+    """
+    return set_custom_fields(contact_id, {field_key: value}, location_id)
+
+
+# --------------------------------------------------------------------------
+# 🔹 MUTACIONES AGRUPADAS POR CONTACTO
+# --------------------------------------------------------------------------
+
+def _apply_contact_mutations(key, tags, fields, correlation_id=None):
+    """Envía lo acumulado de un contacto: un POST de tags y/o un PATCH de campos."""
+    location_id, contact_id = key
+    results = {}
+    close_old_connections()
+    try:
+        with correlation(correlation_id):
+            for kind, pending, send in (
+                ("add_tag", tags, add_tags_to_contact),
+                ("set_custom_field", fields, set_custom_fields),
+            ):
+                if not pending:
+                    continue
+                try:
+                    results[kind] = send(contact_id, pending, location_id)
+                except Exception as e:
+                    results[kind] = e
+    finally:
+        close_old_connections()
+    return results
+
+
+def send_contact_mutations(mutations, concurrency=GHL_MUTATION_CONCURRENCY):
+    """
+    Envía a GHL una lista de mutaciones {contact_id, location_id, operation, payload}
+    (operation: add_tag | set_custom_field) con el mínimo de llamadas: se agrupan por
+    contacto y cada contacto cuesta como mucho un POST de tags y un PATCH de campos
+    (si un campo se repite gana el último). Los tags no se mandan en el PATCH porque
+    ahí reemplazarían los que el contacto ya tiene.
+    Las llamadas de cada contacto llevan el `correlation_id` de su primera mutación.
+    Devuelve un resultado por mutación, en orden: True, False (GHL la rechazó) o la excepción.
+    """
+    groups = {}  # (location_id, contact_id) -> (tags, fields, correlation_id)
+    for m in mutations:
+        tags, fields, _ = groups.setdefault(
+            (m.get("location_id"), m["contact_id"]), ([], {}, m.get("correlation_id"))
+        )
+        if m["operation"] == "add_tag" and m["payload"]["tag"] not in tags:
+            tags.append(m["payload"]["tag"])
+        elif m["operation"] == "set_custom_field":
+            fields[m["payload"]["field_key"]] = m["payload"]["value"]
+
+    outcomes = {}
+    if groups:
+        workers = max(1, min(concurrency, len(groups)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {key: pool.submit(_apply_contact_mutations, key, *group) for key, group in groups.items()}
+        outcomes = {key: future.result() for key, future in futures.items()}
+
+    results = []
+    for m in mutations:
+        outcome = outcomes[(m.get("location_id"), m["contact_id"])]
+        if m["operation"] not in ("add_tag", "set_custom_field"):
+            results.append(LookupError(f"Operación desconocida: {m['operation']}"))
+        else:
+            results.append(outcome[m["operation"]])
+    return results
+
+
+# mutaciones sueltas (varios requests / hilos): se juntan unos ms y salen agrupadas por contacto
+contact_mutations = MicroBatcher(
+    send_contact_mutations,
+    max_size=GHL_MUTATION_BATCH_SIZE,
+    max_wait=GHL_MUTATION_WINDOW_MS / 1000,
+    name="ghl-contact-mutations",
+)
+
+
+def queue_tag(contact_id, tag_name, location_id=None):
+    """Como `add_tag_to_contact`, pero agrupado con el resto de cambios del contacto. Devuelve un Future."""
+    return contact_mutations.submit({
+        "contact_id": contact_id, "location_id": location_id,
+        "operation": "add_tag", "payload": {"tag": tag_name},
+        "correlation_id": get_correlation_id(),
+    })
+
+
+def queue_custom_field(contact_id, field_key, value, location_id=None):
+    """Como `set_custom_field`, pero agrupado con el resto de cambios del contacto. Devuelve un Future."""
+    return contact_mutations.submit({
+        "contact_id": contact_id, "location_id": location_id,
+        "operation": "set_custom_field", "payload": {"field_key": field_key, "value": value},
+        "correlation_id": get_correlation_id(),
+    })
+
+
 # --------------------------------------------------------------------------
 # 🔹 CITAS (Appointments)
 # --------------------------------------------------------------------------
@@ -116,14 +233,16 @@ def create_appointment(appointment):
         "locationId": appointment.location_id,
     }
 
-    r = requests.post(f"{GHL_BASE}/calendars/events/appointments/", json=payload, headers=HEADERS)
+    r = ghl_request(
+        appointment.location_id, "POST", f"{GHL_BASE}/calendars/events/appointments/", json=payload, headers=HEADERS
+    )
     if r.status_code in (200, 201):
         data = r.json()
         appointment.ghl_id = data.get("appointment", {}).get("id") or data.get("id")
         appointment.save()
         return appointment.ghl_id
     else:
-        print(f"[GHL ERROR create_appointment] {r.text}")
+        logger.error("[GHL ERROR create_appointment] %s", r.text)
         return None
 
 
@@ -132,11 +251,13 @@ def update_appointment_status(appointment, new_status):
     Actualiza el estado de una cita en GHL.
     """
     if not appointment.ghl_id:
-        print("[GHL WARNING] No se puede actualizar, cita sin ghl_id.")
+        logger.warning("[GHL WARNING] No se puede actualizar, cita sin ghl_id.")
         return False
 
     payload = {"appointmentStatus": new_status}
-    r = requests.patch(
+    r = ghl_request(
+        appointment.location_id,
+        "PATCH",
         f"{GHL_BASE}/calendars/events/appointments/{appointment.ghl_id}",
         json=payload,
         headers=HEADERS,
@@ -146,5 +267,5 @@ def update_appointment_status(appointment, new_status):
         appointment.save()
         return True
     else:
-        print(f"[GHL ERROR update_appointment_status] {r.text}")
+        logger.error("[GHL ERROR update_appointment_status] %s", r.text)
         return False
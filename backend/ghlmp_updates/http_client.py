@@ -0,0 +1,407 @@
+# http_client.py
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+import weakref
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from ghlmp_updates.circuit import CircuitBreaker, CircuitOpenError
+from ghlmp_updates.logs import CORRELATION_HEADER, get_correlation_id
+from ghlmp_updates.metrics import RETRIES, UPSTREAM_DURATION, UPSTREAM_REQUESTS
+from ghlmp_updates.ratelimit import RateLimiter, RateLimitExceeded, retry_after_seconds
+
+
+# Cargar variables de entorno (.env)
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 🔹 Configuración del pool de conexiones (keep-alive) y timeouts por defecto
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+HTTP_POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "False").lower() in ("1", "true", "yes")
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "15"))
+# cliente async (vistas ASGI): conexiones simultáneas por host y por event loop
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv("HTTP_ASYNC_MAX_CONNECTIONS", "200"))
+# 429: reintentos respetando Retry-After; si el upstream pide esperar más que el tope, se devuelve el 429
+HTTP_429_MAX_RETRIES = int(os.getenv("HTTP_429_MAX_RETRIES", "3"))
+HTTP_429_MAX_WAIT = float(os.getenv("HTTP_429_MAX_WAIT", "60"))
+# espera total de una llamada (rate limit + reintentos de 429): un request web falla rápido
+# (503 / el 429) y solo los workers en segundo plano (`run_in_background`) esperan más
+HTTP_MAX_WAIT = float(os.getenv("HTTP_MAX_WAIT", "2"))
+HTTP_BACKGROUND_MAX_WAIT = float(os.getenv("HTTP_BACKGROUND_MAX_WAIT", "60"))
+
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+_sessions = {}
+_pool_overrides = {}
+_rate_limits = {}  # host -> [(rate, burst), ...]
+_limiters = {}  # host#tenant -> RateLimiter
+_breakers = {}  # host -> CircuitBreaker (una caída afecta a todos los tenants)
+_lock = threading.Lock()
+_background = False
+# event loop -> {host: httpx.AsyncClient}; un AsyncClient no puede cambiar de loop
+_async_clients = weakref.WeakKeyDictionary()
+_loop_sentinels = weakref.WeakKeyDictionary()  # event loop -> generador que cierra sus clientes
+
+
+class PooledSession(requests.Session):
+    """
+    Sesión HTTP con pool keep-alive propio y timeout (connect, read) por defecto.
+    No guarda cookies: la misma sesión se comparte entre hilos y clientes.
+    """
+
+    def __init__(self, pool_maxsize=HTTP_POOL_MAXSIZE, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+        self.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_CONNECTIONS,
+            pool_maxsize=pool_maxsize,
+            pool_block=HTTP_POOL_BLOCK,
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().request(method, url, **kwargs)
+
+
+def _host_key(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _pool_key(url, tenant=None):
+    """Un pool por host y, si se indica, por tenant (ej. location de GHL)."""
+    key = _host_key(url)
+    return f"{key}#{tenant}" if tenant else key
+
+
+def configure_pool(base_url, pool_maxsize=None, timeout=None):
+    """
+    Ajusta el tamaño del pool y/o el timeout para un host concreto
+    (ej. GHL con más conexiones que Mercado Pago). Reemplaza la sesión existente.
+    """
+    key = _host_key(base_url)
+    with _lock:
+        _pool_overrides[key] = {
+            "pool_maxsize": pool_maxsize or HTTP_POOL_MAXSIZE,
+            "timeout": timeout or DEFAULT_TIMEOUT,
+        }
+        old = [_sessions.pop(k) for k in list(_sessions) if k == key or k.startswith(key + "#")]
+    for session in old:
+        session.close()
+
+
+def configure_rate_limit(base_url, *limits):
+    """
+    Límite de requests para un host, aplicado por separado a cada tenant
+    (ej. GHL: 100 cada 10 s por location). Cada límite es (por_segundo, ráfaga).
+    """
+    key = _host_key(base_url)
+    with _lock:
+        _rate_limits[key] = list(limits)
+        for k in [k for k in _limiters if k == key or k.startswith(key + "#")]:
+            del _limiters[k]
+
+
+def get_limiter(url, tenant=None):
+    """RateLimiter del host/tenant de `url`, o None si el host no tiene límite configurado."""
+    limits = _rate_limits.get(_host_key(url))
+    if not limits:
+        return None
+    key = _pool_key(url, tenant)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _lock:
+            limiter = _limiters.setdefault(key, RateLimiter(limits, name=key))
+    return limiter
+
+
+def get_breaker(url):
+    """Circuit breaker del upstream de `url`."""
+    key = _host_key(url)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.setdefault(key, CircuitBreaker(key))
+    return breaker
+
+
+def circuit_states():
+    """Estado de los breakers de este proceso (para monitoreo)."""
+    return {key: breaker.snapshot() for key, breaker in sorted(_breakers.items())}
+
+
+def _record(breaker, response):
+    # 5xx = upstream con problemas; 4xx/429 = el upstream responde
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _observe(method, url, started, status):
+    """Métricas de la llamada: conteo por status (o error) y latencia, por upstream."""
+    upstream = _host_key(url)
+    UPSTREAM_REQUESTS.inc(upstream=upstream, method=method, status=status)
+    if started is not None:
+        UPSTREAM_DURATION.observe(time.perf_counter() - started, upstream=upstream, method=method)
+
+
+def _with_correlation(kwargs):
+    """Propaga el correlation id del request / evento actual en las llamadas salientes."""
+    correlation_id = get_correlation_id()
+    if correlation_id:
+        kwargs["headers"] = {CORRELATION_HEADER: correlation_id, **(kwargs.get("headers") or {})}
+    return kwargs
+
+
+def run_in_background():
+    """
+    Marca el proceso como worker (process_webhooks, dispatch_outbox, comandos): sus llamadas
+    pueden esperar el rate limit hasta HTTP_BACKGROUND_MAX_WAIT en vez de fallar a los HTTP_MAX_WAIT.
+    """
+    global _background
+    _background = True
+
+
+def _wait_budget():
+    return HTTP_BACKGROUND_MAX_WAIT if _background else HTTP_MAX_WAIT
+
+
+def _acquire_or_raise(limiter, breaker, method, url, remaining):
+    """Espera el rate limit (hasta `remaining` s); si no alcanza, libera la prueba del breaker y relanza."""
+    try:
+        return limiter.reserve(max_wait=max(0.0, remaining))
+    except RateLimitExceeded:
+        breaker.release_probe()
+        _observe(method, url, None, "rate_limited")
+        raise
+
+
+def _retry_delay(response, attempt, limiter, remaining):
+    """Segundos a esperar antes de reintentar un 429, o None si no conviene (o no alcanza la espera)."""
+    if response.status_code != 429 or attempt >= HTTP_429_MAX_RETRIES:
+        return None
+    delay = retry_after_seconds(response.headers.get("Retry-After"), attempt, maximum=HTTP_429_MAX_WAIT)
+    if delay > min(HTTP_429_MAX_WAIT, remaining):
+        return None
+    if limiter is not None:
+        limiter.pause(delay)  # el resto de hilos de este tenant también espera
+    RETRIES.inc(kind="http_429", upstream=_host_key(str(response.url)))
+    return delay
+
+
+def get_session(url, tenant=None):
+    """
+    Devuelve la sesión compartida del host de `url` (una por upstream y tenant),
+    creándola la primera vez.
+    """
+    key = _pool_key(url, tenant)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = PooledSession(**_pool_overrides.get(_host_key(url), {}))
+                _sessions[key] = session
+    return session
+
+
+def close_all():
+    """Cierra todas las conexiones abiertas (ej. al terminar un worker)."""
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+atexit.register(close_all)  # workers y comandos: cerrar los keep-alive al salir
+
+
+# --------------------------------------------------------------------------
+# 🔹 Atajos con la misma firma que `requests`
+# --------------------------------------------------------------------------
+
+def request(method, url, tenant=None, **kwargs):
+    """
+    Request por el pool del host/tenant, esperando el rate limit y reintentando los 429
+    (en total, como mucho `_wait_budget()` segundos). Con el circuito del upstream
+    abierto lanza CircuitOpenError, y si el cupo no alcanza RateLimitExceeded, sin llamar.
+    """
+    session = get_session(url, tenant)
+    kwargs = _with_correlation(kwargs)
+    limiter = get_limiter(url, tenant)
+    breaker = get_breaker(url)
+    budget, waited = _wait_budget(), 0.0
+    attempt = 0
+    while True:
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            _observe(method, url, None, "circuit_open")
+            raise
+        if limiter is not None:
+            wait = _acquire_or_raise(limiter, breaker, method, url, budget - waited)
+            if wait > 0:
+                time.sleep(wait)
+            waited += wait
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            breaker.record_failure()
+            _observe(method, url, started, "error")
+            raise
+        _observe(method, url, started, response.status_code)
+        _record(breaker, response)
+        delay = _retry_delay(response, attempt, limiter, budget - waited)
+        if delay is None:
+            return response
+        logger.warning("⏳ 429 de %s (%s); reintento en %.1fs", _host_key(url), tenant or "-", delay)
+        response.close()
+        if limiter is None:  # con limiter la pausa se espera (y se cuenta) en el próximo acquire
+            time.sleep(delay)
+            waited += delay
+        attempt += 1
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request("PUT", url, **kwargs)
+
+
+def patch(url, **kwargs):
+    return request("PATCH", url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
+
+
+# --------------------------------------------------------------------------
+# 🔹 Cliente async (httpx) para las vistas async bajo ASGI
+# --------------------------------------------------------------------------
+
+def get_async_client(url, tenant=None):
+    """
+    Devuelve el httpx.AsyncClient compartido del host de `url` (y tenant) para el
+    event loop actual (bajo ASGI hay un loop por worker, así que el pool se reutiliza).
+    """
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.get(loop)
+    if clients is None:
+        clients = _async_clients[loop] = {}
+        _loop_sentinels[loop] = _close_with_loop(clients)
+    key = _pool_key(url, tenant)
+    client = clients.get(key)
+    if client is None:
+        override = _pool_overrides.get(_host_key(url), {})
+        connect, read = override.get("timeout", DEFAULT_TIMEOUT)
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=override.get("pool_maxsize", HTTP_POOL_MAXSIZE),
+            ),
+            timeout=httpx.Timeout(read, connect=connect),
+        )
+        clients[key] = client
+    return client
+
+
+async def _close_clients(clients):
+    """
+    Centinela del loop: asyncio.run() (uvicorn, y asgiref en cada async_to_sync) llama a
+    loop.shutdown_asyncgens() antes de cerrar el loop, que ejecuta este finally dentro del loop.
+    """
+    try:
+        yield
+    finally:
+        for client in list(clients.values()):
+            await client.aclose()
+        clients.clear()
+
+
+def _close_with_loop(clients):
+    """Arranca el centinela hasta su `yield` para que el loop actual lo registre y lo cierre al terminar."""
+    sentinel = _close_clients(clients)
+    try:
+        sentinel.asend(None).send(None)
+    except StopIteration:
+        pass
+    return sentinel
+
+
+async def arequest(method, url, tenant=None, **kwargs):
+    client = get_async_client(url, tenant)
+    kwargs = _with_correlation(kwargs)
+    limiter = get_limiter(url, tenant)
+    breaker = get_breaker(url)
+    budget, waited = _wait_budget(), 0.0
+    attempt = 0
+    while True:
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            _observe(method, url, None, "circuit_open")
+            raise
+        if limiter is not None:
+            wait = _acquire_or_raise(limiter, breaker, method, url, budget - waited)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            waited += wait
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            breaker.record_failure()
+            _observe(method, url, started, "error")
+            raise
+        _observe(method, url, started, response.status_code)
+        _record(breaker, response)
+        delay = _retry_delay(response, attempt, limiter, budget - waited)
+        if delay is None:
+            return response
+        logger.warning("⏳ 429 de %s (%s); reintento en %.1fs", _host_key(url), tenant or "-", delay)
+        await response.aclose()
+        if limiter is None:  # con limiter la pausa se espera (y se cuenta) en el próximo acquire
+            await asyncio.sleep(delay)
+            waited += delay
+        attempt += 1
+
+
+async def aget(url, **kwargs):
+    return await arequest("GET", url, **kwargs)
+
+
+async def apost(url, **kwargs):
+    return await arequest("POST", url, **kwargs)
+
+
+async def aput(url, **kwargs):
+    return await arequest("PUT", url, **kwargs)
+
+
+async def apatch(url, **kwargs):
+    return await arequest("PATCH", url, **kwargs)
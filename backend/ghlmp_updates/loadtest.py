@@ -0,0 +1,476 @@
+# loadtest.py
+import itertools
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import requests
+
+# 🔹 Prueba de carga de punta a punta (comando `python manage.py loadtest`):
+# servidores locales que imitan a Mercado Pago y GHL (con latencia y errores
+# configurables) y un generador de carga a RPS fijo contra los endpoints reales.
+
+
+# --------------------------------------------------------------------------
+# 🔹 UPSTREAMS FALSOS
+# --------------------------------------------------------------------------
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # el default (5) rechaza conexiones bajo carga
+
+    def handle_error(self, request, client_address):
+        # el cliente cortó la conexión (timeout, fin de la prueba): no es un error del fake
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeUpstream:
+    """
+    Servidor HTTP local con rutas [(método, regex, handler)]. Cada handler recibe
+    (match, query, body) y devuelve (status, json). Antes de responder espera
+    `latency_ms` ± `jitter_ms` y, con probabilidad `error_rate`, responde `error_status`.
+    """
+
+    def __init__(self, name, routes, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=500, port=0):
+        self.name = name
+        self.routes = [(method, re.compile(pattern), handler) for method, pattern, handler in routes]
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls = defaultdict(int)  # (método, patrón, status) -> llamadas
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"fake-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _delay(self):
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def handle(self, method, path, body):
+        """Resuelve la ruta y devuelve (status, json, headers extra)."""
+        parts = urlsplit(path)
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(parts.path)
+            if route_method != method or not match:
+                continue
+            self._delay()
+            if self.error_rate and random.random() < self.error_rate:
+                status, data = self.error_status, {"error": "injected", "status": self.error_status}
+                headers = {"Retry-After": "1"} if self.error_status == 429 else {}
+            else:
+                status, data = handler(match, parse_qs(parts.query), body)
+                headers = {}
+            with self._lock:
+                self.calls[(method, pattern.pattern, status)] += 1
+            return status, data, headers
+
+        with self._lock:
+            self.calls[(method, parts.path, 404)] += 1
+        return 404, {"error": "not found", "path": parts.path}, {}
+
+    def _handler_class(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, como el upstream real
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    body = {}
+                status, data, headers = upstream.handle(self.command, self.path, body)
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+        return Handler
+
+
+def _mp_date(dt):
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
+def _parse_mp_date(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def fake_mp(search_results=200, **options):
+    """
+    Mercado Pago falso: preferencias, detalle de pago y búsqueda paginada.
+    Cada pago consultado apunta (en ronda) a una de las preferencias creadas, así el
+    webhook recorre el camino completo (preferencia → pagada → outbox a GHL).
+    """
+    references = []
+    counter = itertools.count(1)
+    lock = threading.Lock()
+
+    def create_preference(match, query, body):
+        n = next(counter)
+        with lock:
+            references.append(body.get("external_reference"))
+        return 201, {
+            "id": f"lt-pref-{n}",
+            "init_point": f"https://www.mercadopago.com/checkout/v1/redirect?pref_id=lt-pref-{n}",
+            "sandbox_init_point": f"https://sandbox.mercadopago.com/checkout/v1/redirect?pref_id=lt-pref-{n}",
+            "external_reference": body.get("external_reference"),
+        }
+
+    def get_payment(match, query, body):
+        payment_id = int(match.group(1))
+        with lock:
+            reference = references[payment_id % len(references)] if references else None
+        return 200, {
+            "id": payment_id,
+            "status": "approved",
+            "status_detail": "accredited",
+            "external_reference": reference,
+            "transaction_amount": 100.0,
+            "date_created": _mp_date(datetime.now(timezone.utc)),
+        }
+
+    def search(match, query, body):
+        # `search_results` pagos repartidos uniformemente en el rango pedido
+        begin = _parse_mp_date(query["begin_date"][0])
+        end = _parse_mp_date(query["end_date"][0])
+        offset = int(query.get("offset", ["0"])[0])
+        limit = int(query.get("limit", ["30"])[0])
+        step = (end - begin) / max(search_results, 1)
+        base = int(begin.timestamp())
+        results = [
+            {
+                "id": base * 1000 + i,
+                "status": "approved",
+                "external_reference": f"appointment_lt-search-{base}-{i}",
+                "transaction_amount": 100.0,
+                "date_created": _mp_date(begin + step * i),
+            }
+            for i in range(offset, min(offset + limit, search_results))
+        ]
+        return 200, {"paging": {"total": search_results, "offset": offset, "limit": limit}, "results": results}
+
+    return FakeUpstream("mp", [
+        ("POST", r"/checkout/preferences/?", create_preference),
+        ("GET", r"/v1/payments/search/?", search),
+        ("GET", r"/v1/payments/(\d+)/?", get_payment),
+    ], **options)
+
+
+def fake_ghl(**options):
+    """GHL falso (API v1 y v2 en la misma raíz): contactos, tags, campos y citas."""
+    counter = itertools.count(1)
+
+    # ids con prefijo propio: no chocan con los contactos que inventan los escenarios
+    def create_contact(match, query, body):
+        return 201, {"contact": dict(body, id=f"ghl-contact-{next(counter)}")}
+
+    def create_appointment(match, query, body):
+        return 201, dict(body, id=f"ghl-appt-{next(counter)}")
+
+    def ok(match, query, body):
+        return 200, {"succeded": True}
+
+    return FakeUpstream("ghl", [
+        ("POST", r"/contacts/?", create_contact),
+        ("POST", r"/contacts/([^/]+)/tags/?", ok),
+        ("PATCH", r"/contacts/([^/]+)/?", ok),
+        ("PUT", r"/contacts/([^/]+)/?", ok),
+        ("POST", r"/calendars/events/appointments/?", create_appointment),
+        ("PATCH", r"/calendars/events/appointments/([^/]+)/?", ok),
+        ("PUT", r"/calendars/events/appointments/([^/]+)/?", ok),
+    ], **options)
+
+
+# --------------------------------------------------------------------------
+# 🔹 ESCENARIOS (endpoints propios)
+# --------------------------------------------------------------------------
+
+def _slot(n):
+    start = datetime(2030, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=30 * n)
+    return start.isoformat(), (start + timedelta(minutes=30)).isoformat()
+
+
+def _payment_create(n, ctx):
+    return "POST", "/payments/create/", {
+        "appointmentId": f"lt-{ctx['run']}-{n}",
+        "contactId": f"lt-contact-{n % 500}",
+        "locationId": ctx["location"](n),
+        "amount": "100.00",
+        "description": "Consulta (load test)",
+    }
+
+
+def _mp_webhook(n, ctx):
+    # ids únicos: los repetidos se descartan antes de encolar (idempotencia)
+    payment_id = ctx["run"] * 10_000_000 + n
+    return "POST", "/payments/webhooks/mp", {"type": "payment", "action": "payment.updated", "data": {"id": payment_id}}
+
+
+def _contact_create(n, ctx):
+    return "POST", "/api/contacts/create/", {
+        "first_name": "Carga",
+        "last_name": str(n),
+        "email": f"lt-{ctx['run']}-{n}@example.com",
+        "phone": f"+5491100{n % 1_000_000:06d}",
+        "location_id": ctx["location"](n),
+    }
+
+
+def _appointment_create(n, ctx):
+    start, end = _slot(n)
+    return "POST", "/api/appointments/create/", {
+        "calendarId": "lt-calendar",
+        "contactId": f"lt-contact-{n % 500}",
+        "locationId": ctx["location"](n),
+        "startTime": start,
+        "endTime": end,
+        "title": "Cita (load test)",
+    }
+
+
+def _appointment_webhook(n, ctx):
+    start, end = _slot(n)
+    return "POST", "/api/appointments/webhooks/ghl/appointments/", {
+        "type": "AppointmentCreate",
+        "id": f"lt-wh-{ctx['run']}-{n}",
+        "calendarId": "lt-calendar",
+        "contactId": f"lt-contact-{n % 500}",
+        "locationId": ctx["location"](n),
+        "appointmentStatus": "booked",
+        "startTime": start,
+        "endTime": end,
+    }
+
+
+def _appointment_list(n, ctx):
+    return "GET", f"/api/appointments/?limit=50&location_id={ctx['location'](n)}", None
+
+
+def _reconcile(n, ctx):
+    return "POST", "/payments/reconcile/", {"days": 1}
+
+
+# nombre -> generador (n, ctx) -> (método, path, json)
+SCENARIOS = {
+    "payment_create": _payment_create,
+    "mp_webhook": _mp_webhook,
+    "contact_create": _contact_create,
+    "appointment_create": _appointment_create,
+    "appointment_webhook": _appointment_webhook,
+    "appointment_list": _appointment_list,
+    "reconcile": _reconcile,
+}
+
+DEFAULT_MIX = "payment_create=3,mp_webhook=3,contact_create=1,appointment_create=1,appointment_webhook=2,appointment_list=2"
+
+
+def parse_mix(value):
+    """Convierte "payment_create=3,mp_webhook=1" (o "payment_create,mp_webhook") en {nombre: peso}."""
+    mix = {}
+    for item in (value or "").split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if not name:
+            continue
+        if name not in SCENARIOS:
+            raise ValueError(f"Escenario desconocido: {name} (opciones: {', '.join(SCENARIOS)})")
+        mix[name] = float(weight) if weight.strip() else 1.0
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("El mix de escenarios está vacío")
+    return mix
+
+
+# --------------------------------------------------------------------------
+# 🔹 GENERADOR DE CARGA (lazo abierto)
+# --------------------------------------------------------------------------
+
+class LoadRunner:
+    """
+    Lanza requests a `rps` fijo durante `duration` segundos, repartidos según `mix`.
+    Es de lazo abierto: el ritmo no depende de lo que tarde el servidor y la latencia
+    se mide desde el momento en que el request *debía* salir, así las colas (de
+    hilos o del servidor) cuentan como latencia en vez de bajar el RPS en silencio.
+    """
+
+    def __init__(self, base_url, rps, duration, mix, warmup=0, concurrency=64, locations=1, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.rps = rps
+        self.duration = duration
+        self.warmup = warmup
+        self.concurrency = concurrency
+        self.timeout = timeout
+        names = list(mix)
+        self._names = names
+        self._cum_weights = list(itertools.accumulate(mix[name] for name in names))
+        self._ctx = {
+            "run": int(time.time()) % 100_000,
+            "location": lambda n: f"lt-location-{n % max(locations, 1)}",
+        }
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)  # endpoint -> [(latencia, status)]
+        self.error_bodies = {}  # (endpoint, status) -> inicio de la primera respuesta con error
+        self.late = 0  # requests que salieron con más de 1 s de atraso (faltan hilos)
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _fire(self, name, n, scheduled, record):
+        method, path, body = SCENARIOS[name](n, self._ctx)
+        if time.perf_counter() - scheduled > 1:
+            with self._lock:
+                self.late += 1
+        try:
+            r = self._session().request(method, self.base_url + path, json=body, timeout=self.timeout)
+            status, detail = r.status_code, r.text
+        except requests.RequestException as e:
+            status, detail = type(e).__name__, str(e)
+        latency = time.perf_counter() - scheduled
+        if record:
+            endpoint = f"{method} {path.split('?')[0]}"
+            with self._lock:
+                self.samples[endpoint].append((latency, status))
+                if not (isinstance(status, int) and status < 400):
+                    self.error_bodies.setdefault((endpoint, str(status)), detail[:200])
+
+    def run(self):
+        """Ejecuta warmup + medición y devuelve el reporte (ver `report`)."""
+        rng = random.Random(1)
+        total = int(self.rps * (self.warmup + self.duration))
+        warmup_count = int(self.rps * self.warmup)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="loadtest") as pool:
+            start = time.perf_counter()
+            measure_start = start + self.warmup
+            for i in range(total):
+                scheduled = start + i / self.rps
+                wait = scheduled - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                name = rng.choices(self._names, cum_weights=self._cum_weights)[0]
+                pool.submit(self._fire, name, i, scheduled, i >= warmup_count)
+        elapsed = time.perf_counter() - measure_start
+        return report(self.samples, elapsed, self.rps, self.late, self.error_bodies)
+
+
+def percentile(sorted_values, q):
+    """Percentil por rango más cercano (0 < q <= 100) de una lista ya ordenada."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def report(samples, elapsed, target_rps, late=0, error_bodies=None):
+    """
+    {"endpoints": {endpoint: métricas}, "total": métricas} con latencias en ms;
+    cada endpoint con errores trae un ejemplo de respuesta por status en "error_samples".
+    """
+    error_bodies = error_bodies or {}
+
+    def summarize(items, endpoint=None):
+        latencies = sorted(latency for latency, _ in items)
+        statuses = defaultdict(int)
+        for _, status in items:
+            statuses[str(status)] += 1
+        ok = sum(n for status, n in statuses.items() if status.isdigit() and 200 <= int(status) < 400)
+        return {
+            "requests": len(items),
+            "ok": ok,
+            "errors": len(items) - ok,
+            "throughput_rps": round(len(items) / elapsed, 2) if elapsed > 0 else 0,
+            "p50_ms": _ms(percentile(latencies, 50)),
+            "p95_ms": _ms(percentile(latencies, 95)),
+            "p99_ms": _ms(percentile(latencies, 99)),
+            "max_ms": _ms(latencies[-1] if latencies else None),
+            "statuses": dict(sorted(statuses.items())),
+            "error_samples": {
+                status: body for (name, status), body in sorted(error_bodies.items()) if name == endpoint
+            },
+        }
+
+    everything = [item for items in samples.values() for item in items]
+    return {
+        "target_rps": target_rps,
+        "elapsed_s": round(elapsed, 2),
+        "late_requests": late,
+        "endpoints": {endpoint: summarize(items, endpoint) for endpoint, items in sorted(samples.items())},
+        "total": summarize(everything),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def format_report(result, upstreams=()):
+    """Tabla de texto del reporte (y llamadas recibidas por cada upstream falso)."""
+    header = f"{'endpoint':<52} {'reqs':>6} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    lines = [
+        f"Objetivo: {result['target_rps']} rps · medido durante {result['elapsed_s']} s",
+        header,
+        "-" * len(header),
+    ]
+    rows = list(result["endpoints"].items()) + [("TOTAL", result["total"])]
+    for endpoint, m in rows:
+        lines.append(
+            f"{endpoint:<52} {m['requests']:>6} {m['errors']:>5} {m['throughput_rps']:>8} "
+            f"{_fmt(m['p50_ms']):>8} {_fmt(m['p95_ms']):>8} {_fmt(m['p99_ms']):>8} {_fmt(m['max_ms']):>8}"
+        )
+    for endpoint, m in rows:
+        if m["errors"]:
+            lines.append(f"  {endpoint}: {m['statuses']}")
+            for status, body in m["error_samples"].items():
+                lines.append(f"    {status}: {body}")
+    if result["late_requests"]:
+        lines.append(
+            f"⚠️ {result['late_requests']} requests salieron con más de 1 s de atraso: subir --concurrency"
+        )
+    for upstream in upstreams:
+        lines.append(f"Upstream {upstream.name} ({upstream.url}):")
+        for (method, route, status), n in sorted(upstream.calls.items(), key=str):
+            lines.append(f"  {method:<6} {route:<45} {status} × {n}")
+    return "\n".join(lines)
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.1f}"
@@ -0,0 +1,158 @@
+# logs.py
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from ghlmp_updates.metrics import registry
+
+# 🔹 Logging estructurado (JSON) sin bloquear el request: los handlers solo encolan
+# y un hilo aparte escribe en stdout. Se configura en settings.LOGGING.
+
+CORRELATION_HEADER = "X-Correlation-ID"
+
+_correlation_id = contextvars.ContextVar("correlation_id", default=None)
+
+LOG_RECORDS_DROPPED = registry.counter(
+    "log_records_dropped_total", "Logs descartados porque la cola del logger estaba llena."
+)
+
+# atributos estándar de LogRecord (el resto viene de `extra=` y va al JSON)
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "correlation_id"}
+
+
+def get_correlation_id():
+    """Correlation id del request / evento actual (None fuera de uno)."""
+    return _correlation_id.get()
+
+
+def new_correlation_id():
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def correlation(correlation_id=None):
+    """Fija el correlation id (o uno nuevo) mientras dura el bloque."""
+    token = _correlation_id.set(correlation_id or new_correlation_id())
+    try:
+        yield _correlation_id.get()
+    finally:
+        _correlation_id.reset(token)
+
+
+def with_correlation(func):
+    """
+    Envuelve `func` para ejecutarla en otro hilo (ThreadPoolExecutor) con el
+    correlation id de quien la envuelve: los contextvars no pasan solos a otros hilos.
+    """
+    correlation_id = get_correlation_id()
+
+    def wrapper(*args, **kwargs):
+        token = _correlation_id.set(correlation_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _correlation_id.reset(token)
+    return wrapper
+
+
+class CorrelationIdFilter(logging.Filter):
+    """Agrega `correlation_id` al record (en el hilo que loguea, antes de encolar)."""
+
+    def filter(self, record):
+        record.correlation_id = get_correlation_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Muestreo de eventos de alto volumen: `rates` = {prefijo de logger: fracción}
+    o el mismo mapa como texto "payments.links=0.1,ghlmp_updates.http_client=0.5".
+    WARNING o más nunca se descarta.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        if isinstance(rates, str):
+            rates = parse_sample_rates(rates)
+        # el prefijo más largo gana
+        self.rates = sorted((rates or {}).items(), key=lambda item: -len(item[0]))
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                return rate >= 1 or random.random() < rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por record: ts, level, logger, msg, correlation_id y los `extra=`."""
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "correlation_id": getattr(record, "correlation_id", None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class AsyncJsonHandler(QueueHandler):
+    """
+    Handler no bloqueante: encola el record (cola acotada, `put_nowait`) y un
+    QueueListener lo escribe como JSON en `stream`. Si la cola se llena el record
+    se descarta y se cuenta en `log_records_dropped_total`; nunca espera.
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        target = logging.StreamHandler(stream or sys.stdout)
+        target.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, target, respect_handler_level=False)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def prepare(self, record):
+        # se resuelve el mensaje y el traceback aquí: los args y el exc_info
+        # pueden cambiar o no ser seguros de usar desde el hilo del listener
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def parse_sample_rates(value):
+    """Convierte "logger=0.1,otro=0.5" en {"logger": 0.1, "otro": 0.5}."""
+    rates = {}
+    for item in (value or "").split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
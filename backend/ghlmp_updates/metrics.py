@@ -0,0 +1,253 @@
+# metrics.py
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+# Cargar variables de entorno (.env)
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 🔹 Métricas en memoria, expuestas en /metrics (formato texto de Prometheus)
+# Con METRICS_DIR cada proceso (workers de gunicorn/uvicorn, process_webhooks, ...)
+# vuelca sus valores a METRICS_DIR/<pid>.json y /metrics suma los de los procesos vivos:
+# cada proceso borra su archivo al salir y los de procesos muertos (ej. SIGKILL) se descartan.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+COUNTER, HISTOGRAM, GAUGE = "counter", "histogram", "gauge"
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def inc(self, amount=1, **labels):
+        self.registry._add(self.name, _labels_key(labels), amount)
+
+
+class Histogram:
+    def __init__(self, registry, name, buckets):
+        self.registry = registry
+        self.name = name
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        self.registry._observe(self.name, _labels_key(labels), value, self.buckets)
+
+
+class Registry:
+    """
+    Contadores e histogramas del proceso. Los gauges (ej. profundidad de colas) se
+    registran como `collector`: se calculan al momento de cada scrape.
+    """
+
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_SECONDS):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._defs = {}  # name -> (tipo, help, buckets)
+        self._values = {}  # name -> {labels: valor | [conteo por bucket..., +Inf, sum]}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    # -- definición -----------------------------------------------------------
+
+    def counter(self, name, help):
+        self._defs[name] = (COUNTER, help, None)
+        return Counter(self, name)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        self._defs[name] = (HISTOGRAM, help, tuple(buckets))
+        return Histogram(self, name, tuple(buckets))
+
+    def collector(self, func):
+        """Decorador: `func()` devuelve [(nombre, help, {labels: valor})] de gauges."""
+        self._collectors.append(func)
+        return func
+
+    # -- registro -------------------------------------------------------------
+
+    def _add(self, name, key, amount):
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+        self._ensure_flusher()
+
+    def _observe(self, name, key, value, buckets):
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * (len(buckets) + 1) + [0.0]
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            counts[index] += 1
+            counts[-1] += value
+        self._ensure_flusher()
+
+    # -- multiproceso ---------------------------------------------------------
+
+    def _ensure_flusher(self):
+        if not self.directory or (self._flusher is not None and self._flusher.is_alive()):
+            return
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                if self._flusher is None:
+                    atexit.register(self.discard)
+                self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flusher", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error("[METRICS ERROR] %s", e)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: [[list(key), list(value) if isinstance(value, list) else value]
+                       for key, value in series.items()]
+                for name, series in self._values.items()
+            }
+
+    def flush(self):
+        """Escribe los valores de este proceso en METRICS_DIR/<pid>.json (escritura atómica)."""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def discard(self):
+        """Borra el archivo de este proceso (al salir): sus valores dejan de sumarse en /metrics."""
+        if self.directory:
+            try:
+                os.remove(os.path.join(self.directory, f"{os.getpid()}.json"))
+            except FileNotFoundError:
+                pass
+
+    def _is_dead(self, path):
+        """Archivo de un proceso que ya terminó: su PID no existe o dejó de volcar valores."""
+        try:
+            pid = int(os.path.basename(path)[:-len(".json")])
+        except ValueError:
+            return False
+        if pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass  # existe, de otro usuario
+        # PID reutilizado por otro proceso: el dueño original ya no refresca el archivo
+        return time.time() - os.path.getmtime(path) > max(60, 10 * self.flush_interval)
+
+    def collect(self):
+        """Valores de todos los procesos (o solo de este, sin METRICS_DIR), sumados."""
+        if not self.directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            for path in glob.glob(os.path.join(self.directory, "*.json")):
+                try:
+                    if self._is_dead(path):
+                        os.remove(path)
+                        continue
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # archivo a medio escribir por otro proceso
+
+        merged = {}
+        for snapshot in snapshots:
+            for name, series in snapshot.items():
+                target = merged.setdefault(name, {})
+                for key, value in series:
+                    key = tuple(tuple(pair) for pair in key)
+                    if isinstance(value, list):
+                        current = target.get(key)
+                        target[key] = value if current is None else [a + b for a, b in zip(current, value)]
+                    else:
+                        target[key] = target.get(key, 0) + value
+        return merged
+
+    # -- exposición -----------------------------------------------------------
+
+    def render(self):
+        """Métricas en formato texto de Prometheus (text/plain; version=0.0.4)."""
+        lines = []
+        merged = self.collect()
+        for name, (kind, help, buckets) in sorted(self._defs.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(merged.get(name, {}).items()):
+                if kind == COUNTER:
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ("+Inf",), value[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {value[-1]}")
+                lines.append(f"{name}_count{_format_labels(key)} {cumulative}")
+
+        for collector in self._collectors:
+            try:
+                gauges = collector()
+            except Exception as e:
+                logger.exception("[METRICS ERROR] %s: %s", collector.__name__, e)
+                continue
+            for name, help, values in gauges:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {GAUGE}")
+                for labels, value in sorted(values.items()):
+                    lines.append(f"{name}{_format_labels(_labels_key(dict(labels)))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# métricas comunes a todo el proyecto
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Latencia de los endpoints propios (por ruta, método y status)."
+)
+UPSTREAM_REQUESTS = registry.counter(
+    "upstream_requests_total", "Llamadas salientes a GHL / MP por upstream, método y status (o error)."
+)
+UPSTREAM_DURATION = registry.histogram(
+    "upstream_request_duration_seconds", "Latencia de las llamadas salientes a GHL / MP."
+)
+RETRIES = registry.counter(
+    "retries_total", "Reintentos: 429 de upstreams, eventos de la cola y mutaciones del outbox."
+)
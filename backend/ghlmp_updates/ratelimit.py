@@ -0,0 +1,119 @@
+# ratelimit.py
+import math
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from django.http import JsonResponse
+from requests.exceptions import RequestException
+
+
+class RateLimitExceeded(RequestException):
+    """
+    Esperar el cupo del tenant superaría el tope permitido: se falla sin llamar.
+    No es una caída del upstream (el breaker no se toca): las vistas responden 429
+    y las colas difieren el trabajo.
+    """
+
+    def __init__(self, name, retry_in):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"Rate limit de {name} agotado; reintentar en {retry_in:.0f}s")
+
+
+def rate_limited_response(error):
+    """429 inmediato para una vista cuando se agotó el cupo propio hacia el upstream."""
+    response = JsonResponse(
+        {"error": "Cupo de la API externa agotado", "details": str(error), "retry_in": math.ceil(error.retry_in)},
+        status=429,
+    )
+    response["Retry-After"] = str(max(1, math.ceil(error.retry_in)))
+    return response
+
+
+class TokenBucket:
+    """
+    Token bucket: `rate` tokens por segundo con ráfagas de hasta `burst`.
+    `reserve()` toma un token (aunque haya que esperarlo) y devuelve cuántos
+    segundos debe esperar el llamador; así sirve igual para hilos y para asyncio.
+    Con `max_wait` no toma el token si habría que esperar más: la deuda queda acotada.
+    `clock` (segundos monótonos) se puede reemplazar en tests.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.clock = clock
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait=None):
+        """Devuelve (segundos a esperar, si tomó el token)."""
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+            wait = max(wait, self.blocked_until - now)
+            if max_wait is not None and wait > max_wait:
+                return wait, False
+            self.tokens -= 1
+            return wait, True
+
+    def refund(self):
+        """Devuelve un token tomado que al final no se usó."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds):
+        """El upstream respondió 429: nadie usa este bucket durante `seconds`."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+
+class RateLimiter:
+    """Varios buckets a la vez (ej. ráfaga por 10 s + cupo diario); hay que pasar todos."""
+
+    def __init__(self, limits, name="rate-limit", clock=time.monotonic):
+        self.name = name
+        self.buckets = [TokenBucket(rate, burst, clock) for rate, burst in limits]
+
+    def reserve(self, max_wait=None):
+        """
+        Toma un token de cada bucket y devuelve los segundos a esperar. Si alguno haría
+        esperar más de `max_wait`, devuelve los ya tomados y lanza RateLimitExceeded.
+        """
+        taken, wait = [], 0.0
+        for bucket in self.buckets:
+            needed, granted = bucket.reserve(max_wait)
+            if not granted:
+                for other in taken:
+                    other.refund()
+                raise RateLimitExceeded(self.name, needed)
+            taken.append(bucket)
+            wait = max(wait, needed)
+        return wait
+
+    def pause(self, seconds):
+        for bucket in self.buckets:
+            bucket.pause(seconds)
+
+
+def retry_after_seconds(value, attempt, base=1.0, maximum=60.0):
+    """
+    Segundos a esperar tras un 429: `Retry-After` (segundos o fecha HTTP) si viene,
+    si no backoff exponencial base * 2^intento (con tope `maximum`).
+    """
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+            return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    return min(base * (2 ** attempt), maximum)
@@ -0,0 +1,183 @@
+# tokens.py
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from dotenv import load_dotenv
+from ghlmp_updates import http_client
+
+# Cargar variables de entorno (.env)
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# refrescar este margen antes de que venza el token
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+# tokens sin expires_at (filas antiguas): releer de la BD cada cierto tiempo
+TOKEN_CACHE_MAX_AGE_SECONDS = int(os.getenv("TOKEN_CACHE_MAX_AGE_SECONDS", "3600"))
+# claves sin fila (location aún no instalada): cuánto recordar que no existe
+TOKEN_MISSING_CACHE_SECONDS = int(os.getenv("TOKEN_MISSING_CACHE_SECONDS", "60"))
+
+
+def token_expiry(token_data):
+    """`expires_at` a partir del `expires_in` (segundos) de la respuesta OAuth."""
+    expires_in = token_data.get("expires_in")
+    if not expires_in:
+        return None
+    return timezone.now() + timedelta(seconds=int(expires_in))
+
+
+class TokenProvider:
+    """
+    Cache en memoria de access tokens OAuth por clave (location_id, user_id...).
+
+    - `load(key)` devuelve la fila con access_token / expires_at (o None).
+    - `refresh(row)` pide el token nuevo al endpoint OAuth y lo deja en la fila, sin guardarla:
+      se guarda con compare-and-set para no retener el lock de escritura durante la llamada.
+    - Refresca de forma proactiva antes de `expires_at` y con un lock por clave
+      (single-flight): los requests concurrentes esperan un único refresh.
+    - `default_token()` se usa cuando no hay fila para la clave (ej. token del .env);
+      ese resultado también se cachea un rato para no consultar la BD en cada llamada.
+    - Cada clave usa su propio pool de conexiones (`tenant` en http_client).
+    """
+
+    def __init__(self, load, refresh, default_token=None, name="oauth"):
+        self.load = load
+        self.refresh_row = refresh
+        self.default_token = default_token
+        self.name = name
+        self._cache = {}  # key -> (token, expires_at, cached_at)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _is_fresh(self, entry):
+        token, expires_at, cached_at = entry
+        if token is None:
+            return time.monotonic() - cached_at < TOKEN_MISSING_CACHE_SECONDS
+        if expires_at is None:
+            return time.monotonic() - cached_at < TOKEN_CACHE_MAX_AGE_SECONDS
+        return expires_at - timedelta(seconds=TOKEN_REFRESH_MARGIN_SECONDS) > timezone.now()
+
+    def _store(self, key, row):
+        self._cache[key] = (row.access_token, row.expires_at, time.monotonic())
+        return row.access_token
+
+    def _needs_refresh(self, row):
+        return row.expires_at is not None and not self._is_fresh((row.access_token, row.expires_at, 0))
+
+    def _default(self):
+        return self.default_token() if self.default_token else None
+
+    def get(self, key):
+        """Token vigente para `key`, refrescándolo si está por vencer."""
+        if key is None:
+            return self._default()
+
+        entry = self._cache.get(key)
+        if entry and self._is_fresh(entry):
+            return entry[0] or self._default()
+
+        with self._lock(key):
+            entry = self._cache.get(key)
+            if entry and self._is_fresh(entry):
+                return entry[0] or self._default()
+
+            row = self.load(key)
+            if row is None:
+                self._cache[key] = (None, None, time.monotonic())
+                return self._default()
+            if self._needs_refresh(row):
+                row = self._refresh(key, stale_token=row.access_token) or row
+            return self._store(key, row)
+
+    def _refresh(self, key, stale_token):
+        """
+        Refresca sin transacción abierta (con SQLite IMMEDIATE un lock de escritura durante la
+        llamada OAuth frenaría a todos los demás escritores) y guarda el token nuevo solo si la
+        fila sigue con el que se refrescó (compare-and-set). Si otro proceso ganó, usa el suyo.
+        """
+        row = self.load(key)
+        if row is None:
+            return None
+        if row.access_token != stale_token and not self._needs_refresh(row):
+            return row
+        old_token = row.access_token
+        if not self.refresh_row(row):
+            # refresh_token de un solo uso: si otro proceso lo gastó primero, su token ya está guardado
+            current = self.load(key)
+            if current is not None and current.access_token != old_token and not self._needs_refresh(current):
+                return current
+            logger.warning("⚠️ No se pudo refrescar el token %s de %s", self.name, key)
+            return None
+        if self._save_if_unchanged(row, old_token):
+            return row
+        logger.info("🔁 Token %s de %s ya refrescado por otro proceso", self.name, key)
+        return self.load(key)
+
+    @staticmethod
+    def _save_if_unchanged(row, previous_token):
+        """UPDATE ... WHERE access_token = previous_token (un solo statement, lock mínimo)."""
+        fields = {
+            field.attname: field.pre_save(row, add=False)
+            for field in row._meta.concrete_fields
+            if not field.primary_key
+        }
+        return type(row)._default_manager.filter(pk=row.pk, access_token=previous_token).update(**fields) == 1
+
+    def refresh_after_unauthorized(self, key, stale_token):
+        """Tras un 401: un único refresh por token vencido, aunque haya muchos requests fallando."""
+        if key is None:
+            return None
+        with self._lock(key):
+            entry = self._cache.get(key)
+            if entry and entry[0] is None and self._is_fresh(entry):
+                return None  # sin fila propia: no hay nada que refrescar
+            if entry and entry[0] and entry[0] != stale_token:
+                return entry[0]
+            row = self._refresh(key, stale_token)
+            if row is None:
+                self._cache.pop(key, None)
+                return None
+            return self._store(key, row)
+
+    def invalidate(self, key=None):
+        """Olvida el token cacheado (ej. al reinstalar la app en una location)."""
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+
+    # ----------------------------------------------------------------------
+    # 🔹 Requests autenticados con un reintento transparente ante 401
+    # ----------------------------------------------------------------------
+
+    def request(self, key, method, url, headers=None, **kwargs):
+        token = self.get(key)
+        headers = dict(headers or {})
+        headers["Authorization"] = f"Bearer {token}"
+        response = http_client.request(method, url, tenant=key, headers=headers, **kwargs)
+        if response.status_code == 401:
+            new_token = self.refresh_after_unauthorized(key, token)
+            if new_token and new_token != token:
+                headers["Authorization"] = f"Bearer {new_token}"
+                response = http_client.request(method, url, tenant=key, headers=headers, **kwargs)
+        return response
+
+    async def arequest(self, key, method, url, headers=None, **kwargs):
+        token = await sync_to_async(self.get)(key)
+        headers = dict(headers or {})
+        headers["Authorization"] = f"Bearer {token}"
+        response = await http_client.arequest(method, url, tenant=key, headers=headers, **kwargs)
+        if response.status_code == 401:
+            new_token = await sync_to_async(self.refresh_after_unauthorized)(key, token)
+            if new_token and new_token != token:
+                headers["Authorization"] = f"Bearer {new_token}"
+                response = await http_client.arequest(method, url, tenant=key, headers=headers, **kwargs)
+        return response
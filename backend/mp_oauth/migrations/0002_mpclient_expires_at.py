@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mp_oauth', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mpclient',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
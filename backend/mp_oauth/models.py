@@ -6,6 +6,7 @@ class MPClient(models.Model):
     access_token = models.TextField()
     refresh_token = models.TextField()
     public_key = models.TextField(blank=True, null=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -0,0 +1,38 @@
+# backend/mp_oauth/tokens.py
+import os
+from ghlmp_updates import http_client
+from ghlmp_updates.tokens import TokenProvider
+from .models import MPClient
+from .utils import refresh_mp_token
+
+# vendedor cuyo token OAuth se usa para cobrar; sin él se usa MP_ACCESS_TOKEN del .env
+MP_USER_ID = os.getenv("MP_USER_ID")
+
+# 🔹 Límite de requests a la API de MP (por vendedor)
+MP_RATE_LIMIT_PER_SECOND = float(os.getenv("MP_RATE_LIMIT_PER_SECOND", "20"))
+MP_RATE_LIMIT_BURST = int(os.getenv("MP_RATE_LIMIT_BURST", "40"))
+http_client.configure_rate_limit(
+    os.getenv("MP_BASE_URL", "https://api.mercadopago.com"), (MP_RATE_LIMIT_PER_SECOND, MP_RATE_LIMIT_BURST)
+)
+
+
+def _load_client(user_id):
+    return MPClient.objects.filter(user_id=user_id).first()
+
+
+# tokens de Mercado Pago por user_id (vendedor)
+mp_tokens = TokenProvider(
+    _load_client,
+    refresh_mp_token,
+    default_token=lambda: os.getenv("MP_ACCESS_TOKEN"),
+    name="MP",
+)
+
+
+def mp_request(method, url, **kwargs):
+    """Request a la API de MP con el token del vendedor (reintenta una vez ante 401)."""
+    return mp_tokens.request(MP_USER_ID, method, url, **kwargs)
+
+
+async def amp_request(method, url, **kwargs):
+    return await mp_tokens.arequest(MP_USER_ID, method, url, **kwargs)
@@ -1,10 +1,13 @@
-import os, requests
+import os
 from .models import MPClient
+from ghlmp_updates import http_client
+from ghlmp_updates.tokens import token_expiry
 
 MP_CLIENT_ID = os.getenv("MP_CLIENT_ID")
 MP_CLIENT_SECRET = os.getenv("MP_CLIENT_SECRET")
 
 def refresh_mp_token(client: MPClient):
+    """Pide un access_token nuevo con el refresh_token; solo actualiza `client` (lo guarda TokenProvider)."""
     url = "https://api.mercadopago.com/oauth/token"
     payload = {
         "grant_type": "refresh_token",
@@ -14,11 +17,11 @@ def refresh_mp_token(client: MPClient):
     }
     headers = {"content-type": "application/x-www-form-urlencoded"}
 
-    res = requests.post(url, data=payload, headers=headers)
+    res = http_client.post(url, data=payload, headers=headers)
     if res.status_code == 200:
         data = res.json()
         client.access_token = data.get("access_token")
-        client.refresh_token = data.get("refresh_token")
-        client.save()
+        client.refresh_token = data.get("refresh_token", client.refresh_token)
+        client.expires_at = token_expiry(data)
         return True
     return False
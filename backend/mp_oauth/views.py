@@ -1,8 +1,11 @@
 # backend/mp_oauth/views.py
 from django.shortcuts import render
-import os, requests
+import os
 from django.http import JsonResponse
 from .models import MPClient
+from .tokens import mp_tokens
+from ghlmp_updates.tokens import token_expiry
+from ghlmp_updates import http_client
 
 MP_CLIENT_ID = os.getenv("MP_CLIENT_ID")
 MP_CLIENT_SECRET = os.getenv("MP_CLIENT_SECRET")
@@ -39,7 +42,7 @@ def mp_callback(request):
 
     headers = {"accept": "application/json", "content-type": "application/x-www-form-urlencoded"}
 
-    res = requests.post(token_url, data=payload, headers=headers)
+    res = http_client.post(token_url, data=payload, headers=headers)
     if res.status_code != 200:
         return JsonResponse({"error": "Error al obtener tokens", "details": res.json()}, status=res.status_code)
 
@@ -49,14 +52,16 @@ def mp_callback(request):
     user_id = data.get("user_id")
 
     # Obtener public_key
-    user_info = requests.get(f"https://api.mercadopago.com/users/me", headers={"Authorization": f"Bearer {access_token}"})
+    user_info = http_client.get(f"https://api.mercadopago.com/users/me", headers={"Authorization": f"Bearer {access_token}"})
     public_key = user_info.json().get("public_key") if user_info.status_code == 200 else None
 
     client, created = MPClient.objects.get_or_create(user_id=user_id)
     client.access_token = access_token
     client.refresh_token = refresh_token
     client.public_key = public_key
+    client.expires_at = token_expiry(data)
     client.save()
+    mp_tokens.invalidate(str(user_id))
 
     return JsonResponse({
         "status": "success",
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PaymentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'payments'
+
+    def ready(self):
+        # registra los handlers de la cola (payments.jobs.HANDLERS) y los gauges de /metrics
+        from . import links, outbox, reconcile, webhooks  # noqa: F401
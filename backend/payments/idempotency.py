@@ -0,0 +1,138 @@
+# payments/idempotency.py
+# Deduplicación de webhooks: cada evento se registra una vez en WebhookReceipt
+import functools
+import hashlib
+import inspect
+import json
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.http import JsonResponse
+from django.utils import timezone
+from ghlmp_updates.metrics import registry
+from payments.models import WebhookReceipt
+
+
+def payload_hash(payload):
+    """Hash estable del payload (mismo JSON con otro orden de claves = mismo hash)."""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def mp_event_key(payload):
+    """
+    Notificaciones de MP (webhooks v2) traen su propio id además de data.id;
+    el formato IPN viejo ({"id": <payment_id>, "topic": ...}) no, así que se usa el hash.
+    """
+    if isinstance(payload, dict) and isinstance(payload.get("data"), dict) and payload.get("id"):
+        return f"{payload['id']}:{payload.get('action', '')}"
+    return payload_hash(payload)
+
+
+def claim(source, key, ttl=None):
+    """
+    Registra el evento; devuelve False si ya se había recibido (y cuenta el duplicado).
+    Un recibo vencido se reutiliza como si fuera nuevo.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl or settings.WEBHOOK_DEDUPE_TTL_SECONDS)
+    try:
+        with transaction.atomic():
+            WebhookReceipt.objects.create(source=source, key=key, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        pass
+
+    if WebhookReceipt.objects.filter(source=source, key=key, expires_at__lte=now).update(
+        expires_at=expires_at, duplicates=0
+    ):
+        return True
+    WebhookReceipt.objects.filter(source=source, key=key).update(duplicates=F("duplicates") + 1)
+    return False
+
+
+def release(source, key):
+    """Olvida el evento (falló el procesamiento: el reintento del emisor debe entrar)."""
+    WebhookReceipt.objects.filter(source=source, key=key).delete()
+
+
+def purge_expired():
+    return WebhookReceipt.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def duplicate_stats():
+    """source -> (eventos registrados, duplicados absorbidos)."""
+    rows = WebhookReceipt.objects.values("source").annotate(events=Count("id"), absorbed=Sum("duplicates"))
+    return {row["source"]: (row["events"], row["absorbed"] or 0) for row in rows.order_by("source")}
+
+
+@registry.collector
+def duplicate_gauges():
+    """duplicate_stats() como gauges de /metrics (recibos aún no purgados, por source)."""
+    stats = duplicate_stats()
+    return [
+        ("webhook_receipts", "Eventos de webhook registrados para dedupe (sin los purgados).",
+         {(("source", source),): events for source, (events, _) in stats.items()}),
+        ("webhook_duplicates_absorbed", "Reenvíos de webhooks respondidos sin procesar (sin los purgados).",
+         {(("source", source),): absorbed for source, (_, absorbed) in stats.items()}),
+    ]
+
+
+def _request_key(request, key_func):
+    try:
+        payload = json.loads(request.body or b"{}")
+    except ValueError:
+        return None  # JSON inválido: que la vista responda el error
+    return key_func(payload)
+
+
+def _duplicate_response():
+    return JsonResponse({"ok": True, "duplicate": True}, status=200)
+
+
+def idempotent(source, key_func=payload_hash):
+    """
+    Decorador para vistas de webhook (funciones sync/async o métodos vía method_decorator):
+    un evento repetido responde 200 sin llamar a la vista (ni APIs externas ni escrituras).
+    Si la vista falla (status >= 400 o excepción) el recibo se borra para aceptar el reintento.
+    """
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method != "POST":
+                    return await view(request, *args, **kwargs)
+                key = _request_key(request, key_func)
+                if key and not await sync_to_async(claim)(source, key):
+                    return _duplicate_response()
+                try:
+                    response = await view(request, *args, **kwargs)
+                except Exception:
+                    if key:
+                        await sync_to_async(release)(source, key)
+                    raise
+                if key and response.status_code >= 400:
+                    await sync_to_async(release)(source, key)
+                return response
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != "POST":
+                return view(request, *args, **kwargs)
+            key = _request_key(request, key_func)
+            if key and not claim(source, key):
+                return _duplicate_response()
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                if key:
+                    release(source, key)
+                raise
+            if key and response.status_code >= 400:
+                release(source, key)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,154 @@
+# payments/jobs.py
+# Cola de trabajos durable sobre la BD (sin broker externo)
+import logging
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, F
+from django.utils import timezone
+from payments.models import WebhookEvent
+from ghlmp_updates.circuit import CircuitOpenError
+from ghlmp_updates.ratelimit import RateLimitExceeded
+from ghlmp_updates.logs import correlation
+from ghlmp_updates.metrics import RETRIES, registry
+
+logger = logging.getLogger(__name__)
+
+# source -> función que procesa el payload
+HANDLERS = {}
+
+
+def register(source):
+    """Decorador: registra el handler que procesa los eventos de `source`."""
+    def decorator(func):
+        HANDLERS[source] = func
+        return func
+    return decorator
+
+
+def enqueue(source, payload, delay=0):
+    """Guarda el evento en la cola; es lo único que hace el request del webhook."""
+    available_at = timezone.now() + timedelta(seconds=delay)
+    return WebhookEvent.objects.create(source=source, payload=payload, available_at=available_at)
+
+
+def enqueue_many(source, payloads, delay=0):
+    """Encola varios eventos con un solo INSERT."""
+    available_at = timezone.now() + timedelta(seconds=delay)
+    return WebhookEvent.objects.bulk_create(
+        [WebhookEvent(source=source, payload=payload, available_at=available_at) for payload in payloads]
+    )
+
+
+async def aenqueue(source, payload, delay=0):
+    """Igual que `enqueue`, para vistas async."""
+    available_at = timezone.now() + timedelta(seconds=delay)
+    return await WebhookEvent.objects.acreate(source=source, payload=payload, available_at=available_at)
+
+
+def release_stale():
+    """Devuelve a `pending` los eventos bloqueados por un worker que murió."""
+    limit = timezone.now() - timedelta(seconds=settings.WEBHOOK_QUEUE_LOCK_TIMEOUT_SECONDS)
+    return WebhookEvent.objects.filter(status="processing", locked_at__lt=limit).update(
+        status="pending", locked_by=None, locked_at=None
+    )
+
+
+def claim_batch(limit):
+    """
+    Reserva hasta `limit` eventos pendientes para este worker.
+    El UPDATE condicional (status=pending) evita que dos workers tomen el mismo evento.
+    """
+    now = timezone.now()
+    ids = list(
+        WebhookEvent.objects.filter(status="pending", available_at__lte=now)
+        .order_by("available_at", "id")
+        .values_list("id", flat=True)[:limit]
+    )
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    WebhookEvent.objects.filter(id__in=ids, status="pending").update(
+        status="processing", locked_by=token, locked_at=now, attempts=F("attempts") + 1
+    )
+    return list(WebhookEvent.objects.filter(locked_by=token, status="processing").order_by("id"))
+
+
+def complete(event):
+    WebhookEvent.objects.filter(pk=event.pk).update(
+        status="done", locked_by=None, locked_at=None, last_error=None, processed_at=timezone.now()
+    )
+
+
+def fail(event, error):
+    """Reprograma el evento con backoff exponencial o lo deja en `failed` al agotar intentos."""
+    if event.attempts >= settings.WEBHOOK_QUEUE_MAX_ATTEMPTS:
+        WebhookEvent.objects.filter(pk=event.pk).update(
+            status="failed", locked_by=None, locked_at=None, last_error=str(error)
+        )
+        RETRIES.inc(kind="queue_failed", source=event.source)
+        return
+
+    RETRIES.inc(kind="queue_retry", source=event.source)
+    delay = settings.WEBHOOK_QUEUE_RETRY_BASE_SECONDS * (2 ** (event.attempts - 1))
+    WebhookEvent.objects.filter(pk=event.pk).update(
+        status="pending",
+        locked_by=None,
+        locked_at=None,
+        last_error=str(error),
+        available_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def defer(event, seconds):
+    """Upstream caído (circuito abierto) o cupo agotado: se reprograma sin contar el intento."""
+    RETRIES.inc(kind="queue_deferred", source=event.source)
+    WebhookEvent.objects.filter(pk=event.pk).update(
+        status="pending",
+        locked_by=None,
+        locked_at=None,
+        attempts=F("attempts") - 1,
+        available_at=timezone.now() + timedelta(seconds=max(seconds, 1)),
+    )
+
+
+def process_event(event):
+    """
+    Ejecuta el handler del evento (en un hilo del worker) y registra el resultado.
+    Los logs y las llamadas salientes llevan el correlation id del request que lo encoló.
+    """
+    close_old_connections()
+    try:
+        with correlation(event.correlation_id):
+            try:
+                handler = HANDLERS.get(event.source)
+                if handler is None:
+                    raise LookupError(f"Sin handler para source={event.source}")
+                handler(event.payload)
+                complete(event)
+                return True
+            except (CircuitOpenError, RateLimitExceeded) as e:
+                logger.warning("⏸️ Evento %s (%s) diferido: %s", event.pk, event.source, e)
+                defer(event, e.retry_in)
+                return False
+            except Exception as e:
+                logger.exception("❌ Error procesando evento %s (%s): %s", event.pk, event.source, e)
+                fail(event, e)
+                return False
+    finally:
+        close_old_connections()
+
+
+@registry.collector
+def queue_depth():
+    """Eventos de la cola por source y estado (gauge de /metrics, una consulta por scrape)."""
+    rows = (
+        WebhookEvent.objects.filter(status__in=["pending", "processing", "failed"])
+        .values_list("source", "status")
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    values = {(("source", source), ("status", status)): n for source, status, n in rows}
+    return [("webhook_queue_depth", "Eventos en la cola de webhooks (sin los `done`).", values)]
@@ -0,0 +1,92 @@
+# payments/links.py
+# Links de pago automáticos para las citas que llegan por el webhook de GHL
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.conf import settings
+from django.db import close_old_connections
+from payments.jobs import enqueue_many, register
+from payments.models import PaymentPreference
+from payments.preferences import create_preference
+from ghlmp_updates.logs import with_correlation
+
+logger = logging.getLogger(__name__)
+
+
+def link_amount(calendar_id):
+    """Monto a cobrar por una cita de `calendar_id` (None = sin link automático)."""
+    amounts = json.loads(settings.PAYMENT_LINK_AMOUNTS_BY_CALENDAR or "{}")
+    amount = amounts.get(calendar_id) or settings.PAYMENT_LINK_AMOUNT
+    return Decimal(str(amount)) if amount else None
+
+
+def enqueue_payment_links(rows):
+    """
+    Encola (en lotes) la creación de links para las citas nuevas o confirmadas.
+    Se llama dentro de la transacción del upsert del webhook: no hace llamadas externas.
+    """
+    items = [
+        {
+            "appointment_id": row["ghl_id"],
+            "contact_id": row["contact_ghl_id"],
+            "location_id": row["location_id"],
+            "calendar_id": row["calendar_id"],
+            "title": row["title"],
+        }
+        for row in rows
+        if row.get("contact_ghl_id")
+        and row.get("appointment_status") in settings.PAYMENT_LINK_STATUSES
+        and link_amount(row.get("calendar_id")) is not None
+    ]
+    size = settings.PAYMENT_LINK_BATCH_SIZE
+    batches = [{"appointments": items[i:i + size]} for i in range(0, len(items), size)]
+    return enqueue_many("payment_links", batches)
+
+
+def _create_link(item):
+    """
+    Crea (o reutiliza) la preferencia de una cita y encola el link hacia el contacto en GHL:
+    en la misma transacción que la preferencia nueva, o con `dedupe_key` si se reutilizó
+    (puede venir de /payments/create, que no lo encola).
+    """
+    close_old_connections()
+    try:
+        data = {
+            "appointmentId": item["appointment_id"],
+            "contactId": item["contact_id"],
+            "locationId": item["location_id"],
+            "amount": link_amount(item["calendar_id"]),
+            "description": item["title"] or "Cita",
+        }
+        pref, reused = create_preference(data, on_create=PaymentPreference.queue_link_push)
+        if reused:
+            pref.queue_link_push()
+        return None
+    except Exception as e:
+        return e
+    finally:
+        close_old_connections()
+
+
+@register("payment_links")
+def process_payment_links(payload):
+    """Crea los links de un lote de citas con concurrencia acotada; si alguno falla se reintenta el lote."""
+    items = payload.get("appointments") or []
+    paid = set(
+        PaymentPreference.objects.filter(
+            appointment_id__in=[item["appointment_id"] for item in items], status="paid"
+        ).values_list("appointment_id", flat=True)
+    )
+    items = [item for item in items if item["appointment_id"] not in paid]
+    if not items:
+        return
+
+    workers = max(1, min(settings.PAYMENT_LINK_CONCURRENCY, len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        errors = [e for e in pool.map(with_correlation(_create_link), items) if e is not None]
+
+    logger.info("🔗 Links de pago: %s/%s creados o reutilizados", len(items) - len(errors), len(items))
+    if errors:
+        # los ya creados se reutilizan en el reintento (create_preference es idempotente)
+        raise errors[0]
@@ -0,0 +1,77 @@
+# payments/management/commands/bench_webhook_lookup.py
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from payments.models import PaymentPreference
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la latencia del lookup del webhook (PaymentPreference por appointment_id) "
+        "sin y con índice. Los datos de prueba se insertan en una transacción que se revierte."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--lookups", type=int, default=200)
+        parser.add_argument("--batch-size", type=int, default=20_000)
+
+    def handle(self, *args, **options):
+        rows, lookups = options["rows"], options["lookups"]
+        index = next(i for i in PaymentPreference._meta.indexes if i.fields == ["appointment_id"])
+        editor = connection.schema_editor()
+        editor.deferred_sql = []  # solo se usa para generar el SQL, no como context manager
+
+        try:
+            with transaction.atomic():
+                self._seed(rows, options["batch_size"])
+                targets = [f"bench-A{random.randrange(rows)}" for _ in range(lookups)]
+
+                with connection.cursor() as cursor:
+                    cursor.execute(str(index.remove_sql(PaymentPreference, editor)))
+                self._report("sin índice", self._measure(targets))
+
+                with connection.cursor() as cursor:
+                    cursor.execute(str(index.create_sql(PaymentPreference, editor)))
+                self._report(f"con índice {index.name}", self._measure(targets))
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write("Datos de prueba revertidos.")
+
+    def _seed(self, rows, batch_size):
+        started = time.perf_counter()
+        for offset in range(0, rows, batch_size):
+            PaymentPreference.objects.bulk_create([
+                PaymentPreference(
+                    appointment_id=f"bench-A{i}",
+                    contact_id=f"bench-C{i % 5000}",
+                    preference_id=f"bench-P{i}",
+                    init_point="https://www.mercadopago.com/checkout",
+                    amount=50,
+                    status="paid" if i % 3 else "pending",
+                )
+                for i in range(offset, min(offset + batch_size, rows))
+            ])
+        self.stdout.write(f"{rows} filas insertadas en {time.perf_counter() - started:.1f}s")
+
+    def _measure(self, targets):
+        timings = []
+        for appointment_id in targets:
+            started = time.perf_counter()
+            PaymentPreference.objects.filter(appointment_id=appointment_id).first()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def _report(self, label, timings):
+        timings = sorted(timings)
+        pct = lambda p: timings[min(len(timings) - 1, int(len(timings) * p))]
+        self.stdout.write(
+            f"{label}: p50={pct(0.50):.3f}ms p95={pct(0.95):.3f}ms p99={pct(0.99):.3f}ms "
+            f"media={statistics.mean(timings):.3f}ms (n={len(timings)})"
+        )
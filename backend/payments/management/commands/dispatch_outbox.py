@@ -0,0 +1,36 @@
+# payments/management/commands/dispatch_outbox.py
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from payments import outbox
+from ghlmp_updates import http_client
+
+
+class Command(BaseCommand):
+    help = "Entrega a GHL las mutaciones pendientes del outbox (payments.GHLOutbox)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.GHL_OUTBOX_BATCH_SIZE)
+        parser.add_argument("--concurrency", type=int, default=settings.GHL_OUTBOX_CONCURRENCY)
+        parser.add_argument("--poll-interval", type=float, default=settings.WEBHOOK_WORKER_POLL_SECONDS)
+        parser.add_argument("--once", action="store_true", help="Vacía el outbox una vez y termina.")
+        parser.add_argument("--requeue-dead", action="store_true", help="Reencola las filas en dead-letter.")
+
+    def handle(self, *args, **options):
+        http_client.run_in_background()  # puede esperar el rate limit en vez de fallar rápido
+        if options["requeue_dead"]:
+            count = outbox.requeue_dead()
+            self.stdout.write(f"{count} filas reencoladas desde dead-letter")
+
+        try:
+            while True:
+                outbox.release_stale()
+                sent, total = outbox.dispatch_pending(options["batch_size"], options["concurrency"])
+                if total:
+                    self.stdout.write(f"Enviadas {sent}/{total} mutaciones a GHL")
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Dispatcher detenido.")
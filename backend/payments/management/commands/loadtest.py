@@ -0,0 +1,172 @@
+# payments/management/commands/loadtest.py
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ghlmp_updates.loadtest import DEFAULT_MIX, LoadRunner, fake_ghl, fake_mp, format_report, parse_mix
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de punta a punta: levanta MP y GHL falsos (latencia y errores "
+        "configurables), arranca el servidor contra ellos con una BD temporal y lo "
+        "carga a RPS fijo. Reporta throughput y p50/p95/p99 por endpoint."
+    )
+    # los checks importan las URLs (y exigen MP_ACCESS_TOKEN); el servidor hace los suyos
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rps", type=float, default=50)
+        parser.add_argument("--duration", type=float, default=30, help="Segundos medidos.")
+        parser.add_argument("--warmup", type=float, default=5, help="Segundos previos que no se miden.")
+        parser.add_argument("--concurrency", type=int, default=64, help="Hilos del generador de carga.")
+        parser.add_argument("--mix", default=DEFAULT_MIX,
+                            help=f"Escenarios y pesos: \"nombre=peso,...\" (default: {DEFAULT_MIX}).")
+        parser.add_argument("--locations", type=int, default=10,
+                            help="Locations distintas (el rate limit de GHL es por location).")
+        parser.add_argument("--latency-ms", type=float, default=50, help="Latencia de MP y GHL falsos.")
+        parser.add_argument("--jitter-ms", type=float, default=10)
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas con error.")
+        parser.add_argument("--error-status", type=int, default=500)
+        parser.add_argument("--mp-latency-ms", type=float, default=None)
+        parser.add_argument("--mp-error-rate", type=float, default=None)
+        parser.add_argument("--ghl-latency-ms", type=float, default=None)
+        parser.add_argument("--ghl-error-rate", type=float, default=None)
+        parser.add_argument("--search-results", type=int, default=200,
+                            help="Pagos que devuelve /v1/payments/search por ventana.")
+        parser.add_argument("--target", default=None,
+                            help="URL de un servidor ya levantado (apuntado a los upstreams falsos).")
+        parser.add_argument("--server-cmd", default=None,
+                            help="Comando del servidor ({port} se reemplaza). Default: runserver --noreload.")
+        parser.add_argument("--workers", action="store_true",
+                            help="Levanta también process_webhooks y dispatch_outbox.")
+        parser.add_argument("--env", action="append", default=[], metavar="CLAVE=VALOR",
+                            help="Variables extra para el servidor y los workers (repetible).")
+        parser.add_argument("--mp-port", type=int, default=0)
+        parser.add_argument("--ghl-port", type=int, default=0)
+        parser.add_argument("--json", action="store_true", help="Imprime el reporte como JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options["mix"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        def upstream_options(prefix):
+            latency = options[f"{prefix}_latency_ms"]
+            error_rate = options[f"{prefix}_error_rate"]
+            return {
+                "latency_ms": options["latency_ms"] if latency is None else latency,
+                "jitter_ms": options["jitter_ms"],
+                "error_rate": options["error_rate"] if error_rate is None else error_rate,
+                "error_status": options["error_status"],
+                "port": options[f"{prefix}_port"],
+            }
+
+        mp = fake_mp(search_results=options["search_results"], **upstream_options("mp")).start()
+        ghl = fake_ghl(**upstream_options("ghl")).start()
+        self.stderr.write(f"MP falso en {mp.url} · GHL falso en {ghl.url}")
+
+        processes = []
+        try:
+            base_url = options["target"]
+            if not base_url:
+                base_url = self._start_stack(options, mp, ghl, processes)
+
+            runner = LoadRunner(
+                base_url,
+                rps=options["rps"],
+                duration=options["duration"],
+                mix=mix,
+                warmup=options["warmup"],
+                concurrency=options["concurrency"],
+                locations=options["locations"],
+            )
+            self.stderr.write(
+                f"Cargando {base_url} a {options['rps']} rps "
+                f"({options['warmup']} s de warmup + {options['duration']} s medidos)..."
+            )
+            result = runner.run()
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            mp.stop()
+            ghl.stop()
+
+        if options["json"]:
+            calls = {
+                upstream.name: [
+                    {"method": method, "route": route, "status": status, "calls": n}
+                    for (method, route, status), n in sorted(upstream.calls.items(), key=str)
+                ]
+                for upstream in (mp, ghl)
+            }
+            self.stdout.write(json.dumps(dict(result, upstreams=calls), indent=2))
+        else:
+            self.stdout.write(format_report(result, (mp, ghl)))
+
+    def _start_stack(self, options, mp, ghl, processes):
+        """BD temporal migrada + servidor (y workers) apuntados a los upstreams falsos."""
+        workdir = tempfile.mkdtemp(prefix="loadtest-")
+        port = _free_port()
+        env = dict(
+            os.environ,
+            DATABASE_PATH=os.path.join(workdir, "db.sqlite3"),
+            MP_BASE_URL=mp.url,
+            GHL_BASE_URL=ghl.url,
+            GHL_SERVICES_URL=ghl.url,
+            MP_ACCESS_TOKEN="loadtest-mp-token",
+            GHL_ACCESS_TOKEN="loadtest-ghl-token",
+            METRICS_DIR=os.path.join(workdir, "metrics"),
+        )
+        for item in options["env"]:
+            key, sep, value = item.partition("=")
+            if not sep:
+                raise CommandError(f"--env espera CLAVE=VALOR: {item}")
+            env[key] = value
+
+        manage = [sys.executable, str(settings.BASE_DIR / "manage.py")]
+        migrate = subprocess.run(manage + ["migrate", "-v0"], env=env, capture_output=True, text=True)
+        if migrate.returncode:
+            raise CommandError(f"No se pudo migrar la BD temporal:\n{migrate.stderr}")
+
+        log = open(os.path.join(workdir, "server.log"), "w")
+        if options["server_cmd"]:
+            cmd = shlex.split(options["server_cmd"].format(port=port))
+        else:
+            cmd = manage + ["runserver", f"127.0.0.1:{port}", "--noreload"]
+        processes.append(subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT))
+        if options["workers"]:
+            for command in ("process_webhooks", "dispatch_outbox"):
+                processes.append(subprocess.Popen(manage + [command], env=env, stdout=log, stderr=subprocess.STDOUT))
+        self.stderr.write(f"Servidor en el puerto {port} · BD y logs en {workdir}")
+
+        base_url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if processes[0].poll() is not None:
+                raise CommandError(f"El servidor terminó al arrancar (ver {log.name})")
+            try:
+                requests.get(f"{base_url}/metrics", timeout=1)
+                return base_url
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise CommandError(f"El servidor no respondió en 30 s (ver {log.name})")
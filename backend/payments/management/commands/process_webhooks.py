@@ -0,0 +1,38 @@
+# payments/management/commands/process_webhooks.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from payments import jobs
+from ghlmp_updates import http_client
+
+
+class Command(BaseCommand):
+    help = "Procesa la cola de webhooks (payments.WebhookEvent) con concurrencia configurable."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=settings.WEBHOOK_WORKER_CONCURRENCY)
+        parser.add_argument("--batch-size", type=int, default=settings.WEBHOOK_WORKER_BATCH_SIZE)
+        parser.add_argument("--poll-interval", type=float, default=settings.WEBHOOK_WORKER_POLL_SECONDS)
+        parser.add_argument("--once", action="store_true", help="Vacía la cola una vez y termina.")
+
+    def handle(self, *args, **options):
+        http_client.run_in_background()  # puede esperar el rate limit en vez de fallar rápido
+        concurrency = max(1, options["concurrency"])
+        self.stdout.write(f"Worker iniciado (concurrencia={concurrency})")
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            try:
+                while True:
+                    jobs.release_stale()
+                    events = jobs.claim_batch(options["batch_size"])
+                    if events:
+                        results = list(pool.map(jobs.process_event, events))
+                        ok = sum(results)
+                        self.stdout.write(f"Procesados {ok}/{len(events)} eventos")
+                        continue
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+            except KeyboardInterrupt:
+                self.stdout.write("Worker detenido.")
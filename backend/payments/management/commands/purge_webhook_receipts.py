@@ -0,0 +1,19 @@
+# payments/management/commands/purge_webhook_receipts.py
+from django.core.management.base import BaseCommand
+from payments.idempotency import duplicate_stats, purge_expired
+from payments.preferences import purge_requests
+
+
+class Command(BaseCommand):
+    help = "Borra los recibos de webhooks y reservas de links vencidos (dedupe) y muestra los duplicados absorbidos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stats-only", action="store_true", help="Solo mostrar contadores, sin borrar")
+
+    def handle(self, *args, **options):
+        for source, (events, absorbed) in duplicate_stats().items():
+            self.stdout.write(f"{source}: {events} eventos, {absorbed} duplicados absorbidos")
+        if options["stats_only"]:
+            return
+        self.stdout.write(f"Recibos vencidos borrados: {purge_expired()}")
+        self.stdout.write(f"Reservas de links vencidas borradas: {purge_requests()}")
@@ -0,0 +1,23 @@
+# payments/management/commands/reconcile_payments.py
+from datetime import datetime, timedelta, timezone
+from django.core.management.base import BaseCommand
+from payments.models import ReconciliationRun
+from payments.reconcile import run_reconciliation
+from ghlmp_updates import http_client
+
+
+class Command(BaseCommand):
+    help = "Ejecuta la reconciliación MP vs BD en este proceso (útil desde cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=1)
+
+    def handle(self, *args, **options):
+        http_client.run_in_background()  # puede esperar el rate limit en vez de fallar rápido
+        date_to = datetime.now(timezone.utc)
+        run = ReconciliationRun.objects.create(date_from=date_to - timedelta(days=options["days"]), date_to=date_to)
+        run_reconciliation(run)
+        run.refresh_from_db()
+        self.stdout.write(
+            f"Reconciliación #{run.pk}: {run.remote_count} pagos MP, {run.discrepancy_count} discrepancias {run.counters}"
+        )
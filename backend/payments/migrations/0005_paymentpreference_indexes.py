@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_reconciliationrun'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paymentpreference',
+            index=models.Index(fields=['appointment_id'], name='payments_pa_appoint_cdc573_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentpreference',
+            index=models.Index(fields=['status', 'created_at'], name='payments_pa_status_553583_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentpreference',
+            index=models.Index(fields=['updated_at'], name='payments_pa_updated_4c95b4_idx'),
+        ),
+    ]
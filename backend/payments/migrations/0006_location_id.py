@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_paymentpreference_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ghloutbox',
+            name='location_id',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymentpreference',
+            name='location_id',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_location_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=32)),
+                ('key', models.CharField(max_length=128)),
+                ('duplicates', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='payments_we_expires_96bf79_idx')],
+                'constraints': [models.UniqueConstraint(fields=('source', 'key'), name='uniq_webhook_receipt')],
+            },
+        ),
+    ]
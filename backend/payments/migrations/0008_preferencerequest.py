@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_webhookreceipt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentpreference',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymentpreference',
+            name='sandbox_init_point',
+            field=models.URLField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='PreferenceRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=80, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('preference', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='payments.paymentpreference')),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:03
+
+import ghlmp_updates.logs
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0008_preferencerequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ghloutbox',
+            name='correlation_id',
+            field=models.CharField(blank=True, default=ghlmp_updates.logs.get_correlation_id, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='correlation_id',
+            field=models.CharField(blank=True, default=ghlmp_updates.logs.get_correlation_id, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0009_correlation_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ghloutbox',
+            name='dedupe_key',
+            field=models.CharField(blank=True, max_length=191, null=True, unique=True),
+        ),
+    ]
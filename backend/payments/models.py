@@ -1,30 +1,184 @@
 # payments/models.py
-from django.db import models
-from ghlmp_updates.ghl_client import add_tag_to_contact, set_custom_field
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+from ghlmp_updates.logs import get_correlation_id
 
 class PaymentPreference(models.Model):
     '''Model to store payment preferences for appointments.'''
 
     appointment_id = models.CharField(max_length=128)
     contact_id = models.CharField(max_length=128)
+    location_id = models.CharField(max_length=128, null=True, blank=True)  # location GHL del contacto
     preference_id = models.CharField(max_length=128, unique=True)
     init_point = models.URLField()
+    sandbox_init_point = models.URLField(null=True, blank=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=32, default="pending")  # pending | paid | failed
     payment_id = models.CharField(max_length=128, null=True, blank=True, unique=True)
+    expires_at = models.DateTimeField(null=True, blank=True)  # vencimiento del link en MP
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["appointment_id"]),  # lookup del webhook
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["updated_at"]),  # alcance local de la reconciliación
+        ]
+
     def mark_paid(self, payment_id):
-        if not self.payment_id:
-            self.payment_id = payment_id
-            self.status = "paid"
-            self.save()
-
-        # 🔹 Sincronizar con GoHighLevel
-        try:
-            add_tag_to_contact(self.contact_id, "pago_confirmado")
-            set_custom_field(self.contact_id, "payment_status", "paid")
-            print(f"[GHL] Contacto {self.contact_id} actualizado correctamente.")
-        except Exception as e:
-            print(f"[ERROR GHL Sync] {e}")
+        """
+        Marca la preferencia como pagada con un UPDATE condicional (`status != 'paid'`)
+        y, solo si este llamador hizo la transición, encola en la misma transacción
+        la sincronización del contacto en GHL (la envía `dispatch_outbox`).
+        Devuelve True si ganó; notificaciones concurrentes del mismo pago reciben False.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            won = PaymentPreference.objects.filter(pk=self.pk).exclude(status="paid").update(
+                status="paid", payment_id=payment_id, updated_at=now
+            )
+            if not won:
+                return False
+
+            GHLOutbox.objects.bulk_create([
+                GHLOutbox(contact_id=self.contact_id, location_id=self.location_id, operation="add_tag",
+                          payload={"tag": "pago_confirmado"}),
+                GHLOutbox(contact_id=self.contact_id, location_id=self.location_id, operation="set_custom_field",
+                          payload={"field_key": "payment_status", "value": "paid"}),
+            ])
+        self.status, self.payment_id, self.updated_at = "paid", payment_id, now
+        return True
+
+    def queue_link_push(self):
+        """
+        Encola el link de pago hacia el campo `PAYMENT_LINK_FIELD_KEY` del contacto en GHL.
+        Una sola vez por preferencia (`dedupe_key`): llamarlo de nuevo con un link reutilizado no duplica el envío.
+        """
+        GHLOutbox.objects.bulk_create([
+            GHLOutbox(contact_id=self.contact_id, location_id=self.location_id, operation="set_custom_field",
+                      payload={"field_key": settings.PAYMENT_LINK_FIELD_KEY, "value": self.init_point},
+                      dedupe_key=f"payment_link:{self.preference_id}"),
+        ], ignore_conflicts=True)
+
+    def set_status(self, status):
+        """
+        Cambia a un estado no final (pending, rejected, ...) con un UPDATE condicional:
+        nunca pisa un `paid` ni reescribe la fila si el estado no cambia. Devuelve True si cambió.
+        """
+        now = timezone.now()
+        changed = PaymentPreference.objects.filter(pk=self.pk).exclude(status="paid").exclude(status=status).update(
+            status=status, updated_at=now
+        )
+        if changed:
+            self.status, self.updated_at = status, now
+        return bool(changed)
+
+
+class PreferenceRequest(models.Model):
+    '''Reserva por request de creación de link (Idempotency-Key o cita+contacto+monto); ver payments/preferences.py.'''
+
+    key = models.CharField(max_length=80, unique=True)
+    preference = models.ForeignKey(PaymentPreference, null=True, blank=True, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+
+class WebhookEvent(models.Model):
+    '''Cola local (en BD) de notificaciones recibidas por webhook, procesadas por `process_webhooks`.'''
+
+    source = models.CharField(max_length=32, default="mp")  # origen / handler (mp, ...)
+    payload = models.JSONField()
+    status = models.CharField(max_length=16, default="pending")  # pending | processing | done | failed
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    correlation_id = models.CharField(max_length=64, null=True, blank=True, default=get_correlation_id)  # del request que lo encoló
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "available_at"])]
+
+    def __str__(self):
+        return f"{self.source} #{self.pk} ({self.status})"
+
+
+class GHLOutbox(models.Model):
+    '''Mutaciones pendientes hacia GHL (outbox transaccional), entregadas por `dispatch_outbox`.'''
+
+    contact_id = models.CharField(max_length=128)
+    location_id = models.CharField(max_length=128, null=True, blank=True)  # token GHL a usar
+    operation = models.CharField(max_length=32)  # add_tag | set_custom_field
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, default="pending")  # pending | sending | sent | dead
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    correlation_id = models.CharField(max_length=64, null=True, blank=True, default=get_correlation_id)  # del request que lo encoló
+    dedupe_key = models.CharField(max_length=191, null=True, blank=True, unique=True)  # mutaciones que se encolan una sola vez
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.operation} {self.contact_id} ({self.status})"
+
+
+class WebhookReceipt(models.Model):
+    '''Webhooks ya recibidos (id del evento o hash del payload) para descartar duplicados; ver payments/idempotency.py.'''
+
+    source = models.CharField(max_length=32)  # mp | ghl_contact | ghl_appointment ...
+    key = models.CharField(max_length=128)
+    duplicates = models.PositiveIntegerField(default=0)  # reenvíos absorbidos
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["source", "key"], name="uniq_webhook_receipt")]
+        indexes = [models.Index(fields=["expires_at"])]
+
+    def __str__(self):
+        return f"{self.source}:{self.key}"
+
+
+class ReconciliationRun(models.Model):
+    '''Ejecución de la reconciliación MP vs BD local; la procesa el worker de la cola.'''
+
+    status = models.CharField(max_length=16, default="pending")  # pending | running | done | failed
+    date_from = models.DateTimeField()
+    date_to = models.DateTimeField()
+    remote_count = models.PositiveIntegerField(default=0)
+    discrepancy_count = models.PositiveIntegerField(default=0)
+    counters = models.JSONField(default=dict)  # discrepancias por tipo
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Reconciliación #{self.pk} ({self.status})"
+
+
+class ReconciliationDiscrepancy(models.Model):
+    '''Diferencia encontrada en una ReconciliationRun.'''
+
+    run = models.ForeignKey(ReconciliationRun, on_delete=models.CASCADE, related_name="discrepancies")
+    kind = models.CharField(max_length=32)  # status_mismatch | amount_mismatch | missing_local | missing_remote
+    payment_id = models.CharField(max_length=128)
+    local_status = models.CharField(max_length=32, null=True, blank=True)
+    mp_status = models.CharField(max_length=32, null=True, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    local_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.payment_id}"
@@ -0,0 +1,143 @@
+# payments/outbox.py
+# Entrega de las mutaciones GHL guardadas en GHLOutbox (reintentos + dead-letter)
+import logging
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count, F
+from django.utils import timezone
+from payments.models import GHLOutbox
+from ghlmp_updates import http_client
+from ghlmp_updates.circuit import CircuitOpenError
+from ghlmp_updates.ratelimit import RateLimitExceeded
+from ghlmp_updates.ghl_client import GHL_BASE, send_contact_mutations
+from ghlmp_updates.metrics import RETRIES, registry
+
+logger = logging.getLogger(__name__)
+
+
+def release_stale():
+    """Devuelve a `pending` las filas bloqueadas por un dispatcher que murió."""
+    limit = timezone.now() - timedelta(seconds=settings.WEBHOOK_QUEUE_LOCK_TIMEOUT_SECONDS)
+    return GHLOutbox.objects.filter(status="sending", locked_at__lt=limit).update(
+        status="pending", locked_by=None, locked_at=None
+    )
+
+
+def claim_batch(limit):
+    """Reserva hasta `limit` mutaciones pendientes (UPDATE condicional, seguro entre procesos)."""
+    now = timezone.now()
+    ids = list(
+        GHLOutbox.objects.filter(status="pending", next_attempt_at__lte=now)
+        .order_by("next_attempt_at", "id")
+        .values_list("id", flat=True)[:limit]
+    )
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    GHLOutbox.objects.filter(id__in=ids, status="pending").update(
+        status="sending", locked_by=token, locked_at=now, attempts=F("attempts") + 1
+    )
+    return list(GHLOutbox.objects.filter(locked_by=token, status="sending").order_by("id"))
+
+
+def backoff_seconds(attempts):
+    """Backoff exponencial: base * 2^(intentos-1), con tope."""
+    delay = settings.GHL_OUTBOX_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    return min(delay, settings.GHL_OUTBOX_RETRY_MAX_SECONDS)
+
+
+def _mark_sent(row):
+    GHLOutbox.objects.filter(pk=row.pk).update(
+        status="sent", locked_by=None, locked_at=None, last_error=None, sent_at=timezone.now()
+    )
+
+
+def _mark_failed(row, error):
+    if row.attempts >= settings.GHL_OUTBOX_MAX_ATTEMPTS:
+        logger.error("☠️ Outbox %s (%s %s) pasa a dead-letter: %s", row.pk, row.operation, row.contact_id, error)
+        GHLOutbox.objects.filter(pk=row.pk).update(
+            status="dead", locked_by=None, locked_at=None, last_error=str(error)
+        )
+        RETRIES.inc(kind="outbox_dead", operation=row.operation)
+        return
+
+    RETRIES.inc(kind="outbox_retry", operation=row.operation)
+    GHLOutbox.objects.filter(pk=row.pk).update(
+        status="pending",
+        locked_by=None,
+        locked_at=None,
+        last_error=str(error),
+        next_attempt_at=timezone.now() + timedelta(seconds=backoff_seconds(row.attempts)),
+    )
+
+
+def _defer(row, seconds):
+    """GHL caído (circuito abierto) o cupo agotado: se reprograma sin gastar un intento."""
+    RETRIES.inc(kind="outbox_deferred", operation=row.operation)
+    GHLOutbox.objects.filter(pk=row.pk).update(
+        status="pending",
+        locked_by=None,
+        locked_at=None,
+        attempts=F("attempts") - 1,
+        next_attempt_at=timezone.now() + timedelta(seconds=max(seconds, 1)),
+    )
+
+
+def _mutation(row):
+    return {
+        "contact_id": row.contact_id,
+        "location_id": row.location_id,
+        "operation": row.operation,
+        "payload": row.payload,
+        "correlation_id": row.correlation_id,
+    }
+
+
+def settle(row, result):
+    """Actualiza el estado de una fila según el resultado de su envío a GHL."""
+    if result is True:
+        _mark_sent(row)
+        return True
+    if isinstance(result, (CircuitOpenError, RateLimitExceeded)):
+        _defer(row, result.retry_in)
+    elif isinstance(result, Exception):
+        _mark_failed(row, result)
+    else:
+        _mark_failed(row, RuntimeError("GHL rechazó la actualización"))
+    return False
+
+
+def dispatch_pending(batch_size=None, concurrency=None):
+    """
+    Entrega un lote de mutaciones pendientes. Las filas de un mismo contacto se
+    envían juntas (un POST de tags y un PATCH de campos, ver `send_contact_mutations`).
+    Devuelve (enviadas, total).
+    """
+    if http_client.get_breaker(GHL_BASE).retry_in() > 0:
+        return 0, 0  # GHL caído: las filas esperan en el outbox
+    rows = claim_batch(batch_size or settings.GHL_OUTBOX_BATCH_SIZE)
+    if not rows:
+        return 0, 0
+
+    results = send_contact_mutations(
+        [_mutation(row) for row in rows], concurrency or settings.GHL_OUTBOX_CONCURRENCY
+    )
+    sent = sum(settle(row, result) for row, result in zip(rows, results))
+    return sent, len(rows)
+
+
+def requeue_dead():
+    """Vuelve a poner en cola las filas en dead-letter (tras resolver la causa)."""
+    return GHLOutbox.objects.filter(status="dead").update(
+        status="pending", attempts=0, next_attempt_at=timezone.now()
+    )
+
+
+@registry.collector
+def outbox_depth():
+    """Mutaciones del outbox por estado, sin las ya enviadas (gauge de /metrics)."""
+    rows = GHLOutbox.objects.filter(status__in=["pending", "sending", "dead"]).values_list("status").annotate(n=Count("id")).order_by()
+    values = {(("status", status),): n for status, n in rows}
+    return [("ghl_outbox_depth", "Mutaciones pendientes / en envío / dead-letter del outbox GHL.", values)]
@@ -0,0 +1,195 @@
+# payments/preferences.py
+# Creación de preferencias de MP reutilizando los links pendientes aún vigentes
+import hashlib
+import os
+import time
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from dotenv import load_dotenv, find_dotenv
+from payments.models import PaymentPreference, PreferenceRequest
+from mp_oauth.tokens import mp_request
+
+# Cargar variables .env
+load_dotenv(find_dotenv())
+
+MP_BASE = os.getenv("MP_BASE_URL", "https://api.mercadopago.com")
+
+# 🔹 Vigencia de los links de pago y reutilización
+PAYMENT_LINK_TTL_HOURS = float(os.getenv("PAYMENT_LINK_TTL_HOURS", "24"))
+# no reutilizar un link al que le queda menos que esto
+PAYMENT_LINK_MIN_REMAINING_MINUTES = float(os.getenv("PAYMENT_LINK_MIN_REMAINING_MINUTES", "30"))
+# un request que creó la reserva y murió sin terminar la libera tras este tiempo
+PREFERENCE_LOCK_TIMEOUT_SECONDS = float(os.getenv("PREFERENCE_LOCK_TIMEOUT_SECONDS", "30"))
+# cuánto espera un request idéntico a que termine el primero
+PREFERENCE_WAIT_SECONDS = float(os.getenv("PREFERENCE_WAIT_SECONDS", "10"))
+
+
+class PreferenceInProgress(Exception):
+    """Otro request idéntico sigue creando la preferencia."""
+
+
+def build_preference_payload(data, expires_at):
+    """Payload de la preferencia de MP para una cita."""
+    items = [{
+        "title": data["description"],
+        "quantity": 1,
+        "unit_price": float(data["amount"]),
+        "currency_id": "PEN"
+    }]
+    return {
+        "items": items,
+        "external_reference": f"appointment_{data['appointmentId']}",
+        "metadata": {
+            "appointment_id": data["appointmentId"],
+            "contact_id": data["contactId"]
+        },
+        "back_urls": {
+            "success": f"{os.getenv('APP_PUBLIC_URL')}/payments/success",
+            "failure": f"{os.getenv('APP_PUBLIC_URL')}/payments/failure",
+            "pending": f"{os.getenv('APP_PUBLIC_URL')}/payments/pending"
+        },
+        "auto_return": "approved",
+        "notification_url": f"{os.getenv('APP_PUBLIC_URL')}/payments/webhooks/mp",
+        # el link vence: así se sabe hasta cuándo se puede reutilizar
+        "expires": True,
+        "expiration_date_to": expires_at.isoformat(timespec="milliseconds"),
+    }
+
+
+def mp_headers():
+    # Authorization lo agrega mp_request con el token vigente del vendedor
+    return {
+        "Content-Type": "application/json"
+    }
+
+
+def preference_fields(data, resp, expires_at):
+    """Campos de PaymentPreference a partir de la respuesta de MP."""
+    return {
+        "appointment_id": data["appointmentId"],
+        "contact_id": data["contactId"],
+        "location_id": data.get("locationId") or os.getenv("GHL_LOCATION_ID") or None,
+        "preference_id": resp.get("id"),
+        "init_point": resp.get("init_point") or resp.get("sandbox_init_point"),
+        "sandbox_init_point": resp.get("sandbox_init_point"),
+        "amount": data["amount"],
+        "status": "pending",
+        "expires_at": expires_at,
+    }
+
+
+def preference_response(pref, reused=False):
+    # ✅ Devuelve ambos (para pruebas y producción)
+    return {
+        "sandbox_init_point": pref.sandbox_init_point,
+        "init_point": pref.init_point,
+        "preference_id": pref.preference_id,
+        "reused": reused,
+    }
+
+
+def link_expiry():
+    return timezone.now() + timedelta(hours=PAYMENT_LINK_TTL_HOURS)
+
+
+def _reusable_qs():
+    min_expiry = timezone.now() + timedelta(minutes=PAYMENT_LINK_MIN_REMAINING_MINUTES)
+    return PaymentPreference.objects.filter(status="pending", expires_at__gt=min_expiry)
+
+
+def find_reusable(data):
+    """Link pendiente y vigente de la misma cita, contacto y monto (o None)."""
+    return _reusable_qs().filter(
+        appointment_id=data["appointmentId"], contact_id=data["contactId"], amount=data["amount"]
+    ).order_by("-expires_at").first()
+
+
+def request_key(data, idempotency_key=None):
+    """Clave del request: el header Idempotency-Key o (cita, contacto, monto)."""
+    if idempotency_key:
+        return "key:" + hashlib.sha256(idempotency_key.encode()).hexdigest()
+    raw = f"{data['appointmentId']}|{data['contactId']}|{data['amount']}"
+    return "auto:" + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def reserve(data, key):
+    """
+    Devuelve (preferencia_existente, None) o (None, reserva) si este request debe crearla.
+    La reserva es una fila con `key` único: entre requests idénticos concurrentes
+    solo uno llama a MP y los demás esperan su resultado.
+    """
+    deadline = time.monotonic() + PREFERENCE_WAIT_SECONDS
+    explicit = key.startswith("key:")
+    while True:
+        pref = find_reusable(data)
+        if pref is not None:
+            return pref, None
+
+        try:
+            with transaction.atomic():
+                return None, PreferenceRequest.objects.create(key=key)
+        except IntegrityError:
+            pass
+
+        claim = PreferenceRequest.objects.select_related("preference").filter(key=key).first()
+        if claim is None:
+            continue
+        if claim.preference is not None:
+            if explicit or _reusable_qs().filter(pk=claim.preference.pk).exists():
+                return claim.preference, None
+            # link vencido o ya pagado: se libera la clave para crear uno nuevo
+            PreferenceRequest.objects.filter(pk=claim.pk, preference=claim.preference).delete()
+            continue
+        if claim.created_at < timezone.now() - timedelta(seconds=PREFERENCE_LOCK_TIMEOUT_SECONDS):
+            PreferenceRequest.objects.filter(pk=claim.pk, preference__isnull=True).delete()
+            continue
+        if time.monotonic() >= deadline:
+            raise PreferenceInProgress(key)
+        time.sleep(0.05)
+
+
+def complete(claim, fields, on_create=None):
+    """
+    Guarda la preferencia creada en MP y la asocia a la reserva.
+    `on_create(pref)` corre en la misma transacción (ej. encolar el link en el outbox).
+    """
+    with transaction.atomic():
+        pref = PaymentPreference.objects.create(**fields)
+        PreferenceRequest.objects.filter(pk=claim.pk).update(preference=pref)
+        if on_create is not None:
+            on_create(pref)
+    return pref
+
+
+def release(claim):
+    """MP falló: se libera la reserva para que un reintento pueda crearla."""
+    PreferenceRequest.objects.filter(pk=claim.pk, preference__isnull=True).delete()
+
+
+def create_preference(data, idempotency_key=None, on_create=None):
+    """
+    Devuelve (preferencia, reutilizada). Reutiliza el link pendiente vigente de la
+    cita o crea la preferencia en MP (una sola vez aunque lleguen requests idénticos).
+    `on_create(pref)` corre en la transacción que guarda una preferencia nueva.
+    Lanza requests.HTTPError si MP rechaza la preferencia.
+    """
+    pref, claim = reserve(data, request_key(data, idempotency_key))
+    if pref is not None:
+        return pref, True
+
+    try:
+        expires_at = link_expiry()
+        r = mp_request("POST", f"{MP_BASE}/checkout/preferences",
+                       json=build_preference_payload(data, expires_at), headers=mp_headers())
+        r.raise_for_status()
+        return complete(claim, preference_fields(data, r.json(), expires_at), on_create), False
+    except BaseException:
+        release(claim)
+        raise
+
+
+def purge_requests():
+    """Borra reservas cuyo link ya venció (las de Idempotency-Key solo sirven mientras tanto)."""
+    limit = timezone.now() - timedelta(hours=PAYMENT_LINK_TTL_HOURS)
+    return PreferenceRequest.objects.filter(created_at__lt=limit).delete()[0]
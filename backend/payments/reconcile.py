@@ -1,69 +1,350 @@
 #payments/reconcile.py
 # reconciliacion diaria
+import logging
 import os
-import csv
-import json
-import requests
-from datetime import datetime, timedelta
-from django.conf import settings
-from payments.models import PaymentPreference
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from django.utils import timezone as dj_timezone
+from django.utils.dateparse import parse_datetime
+from payments.jobs import enqueue, register
+from payments.models import PaymentPreference, ReconciliationRun, ReconciliationDiscrepancy
+from mp_oauth.tokens import mp_request
+from ghlmp_updates.logs import with_correlation
 
-# Cargar tokens de entorno
-MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN")
+logger = logging.getLogger(__name__)
 
 # URL base de Mercado Pago
-MP_BASE_URL = "https://api.mercadopago.com/v1/payments/search"
+MP_BASE = os.getenv("MP_BASE_URL", "https://api.mercadopago.com")
+MP_SEARCH_URL = f"{MP_BASE}/v1/payments/search"
+
+# 🔹 Paginación / ventanas de búsqueda
+MP_SEARCH_PAGE_SIZE = int(os.getenv("MP_SEARCH_PAGE_SIZE", "100"))
+MP_SEARCH_MAX_RESULTS = int(os.getenv("MP_SEARCH_MAX_RESULTS", "10000"))  # tope offset+limit de MP por consulta
+MP_SEARCH_WINDOW_HOURS = float(os.getenv("MP_SEARCH_WINDOW_HOURS", "6"))
+MP_SEARCH_MIN_WINDOW_SECONDS = 60
+MP_SEARCH_WORKERS = int(os.getenv("MP_SEARCH_WORKERS", "4"))
+
+_DONE = object()
+
+
+def _mp_date(dt):
+    """Formato de fecha que acepta payments/search (UTC con milisegundos)."""
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
+def split_windows(date_from, date_to, window):
+    """Divide [date_from, date_to) en ventanas consecutivas de tamaño `window`."""
+    start = date_from
+    while start < date_to:
+        end = min(start + window, date_to)
+        yield start, end
+        start = end
+
+
+def _search_page(begin, end, offset, limit):
+    params = {
+        "sort": "date_created",
+        "criteria": "asc",
+        "range": "date_created",
+        # el rango de MP es inclusivo en ambos extremos
+        "begin_date": _mp_date(begin),
+        "end_date": _mp_date(end - timedelta(milliseconds=1)),
+        "offset": offset,
+        "limit": limit,
+    }
+    res = mp_request("GET", MP_SEARCH_URL, params=params)
+    res.raise_for_status()
+    return res.json()
+
+
+def iter_window_pages(begin, end, page_size=MP_SEARCH_PAGE_SIZE):
+    """
+    Recorre todas las páginas (offset/limit) de una ventana.
+    Si la ventana supera el tope de resultados de MP, se parte en dos.
+    """
+    offset = 0
+    while True:
+        data = _search_page(begin, end, offset, page_size)
+        results = data.get("results", [])
+        total = data.get("paging", {}).get("total", 0)
+
+        if (offset == 0 and total > MP_SEARCH_MAX_RESULTS
+                and (end - begin).total_seconds() > MP_SEARCH_MIN_WINDOW_SECONDS):
+            middle = begin + (end - begin) / 2
+            yield from iter_window_pages(begin, middle, page_size)
+            yield from iter_window_pages(middle, end, page_size)
+            return
+
+        if offset == 0 and total > MP_SEARCH_MAX_RESULTS:
+            logger.warning("⚠️ Ventana %s - %s con %s pagos; solo se leen %s", begin, end, total, MP_SEARCH_MAX_RESULTS)
+
+        if results:
+            yield results
+        offset += len(results)
+        if not results or offset >= min(total, MP_SEARCH_MAX_RESULTS):
+            return
+
+
+def iter_payments(date_from, date_to=None, window=None, max_workers=MP_SEARCH_WORKERS):
+    """
+    Generador con todos los pagos de MP creados en [date_from, date_to).
+    Las ventanas se consultan en paralelo (pool acotado) y las páginas se
+    entregan a medida que llegan; la cola acotada mantiene la memoria plana.
+    """
+    date_to = date_to or datetime.now(timezone.utc)
+    window = window or timedelta(hours=MP_SEARCH_WINDOW_HOURS)
+    windows = list(split_windows(date_from, date_to, window))
+    if not windows:
+        return
+
+    pages = queue.Queue(maxsize=max_workers * 2)
+    cancelled = threading.Event()
+
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fetch(begin, end):
+        try:
+            for page in iter_window_pages(begin, end):
+                if not put(page):
+                    return
+            put(_DONE)
+        except Exception as e:
+            put(e)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows))))
+    try:
+        for begin, end in windows:
+            pool.submit(with_correlation(fetch), begin, end)
+
+        pending = len(windows)
+        while pending:
+            item = pages.get()
+            if item is _DONE:
+                pending -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield from item
+    finally:
+        cancelled.set()
+        pool.shutdown(wait=False, cancel_futures=True)
 
 
 def fetch_recent_payments(days=1):
-    """Obtiene los pagos de MP en las últimas 24 horas"""
-    date_from = (datetime.utcnow() - timedelta(days=days)).isoformat() + "Z"
-    headers = {"Authorization": f"Bearer {MP_ACCESS_TOKEN}"}
-    params = {"date_created_from": date_from, "limit": 50}
-    
-    res = requests.get(MP_BASE_URL, headers=headers, params=params)
-    data = res.json()
-    return data.get("results", [])
+    """Obtiene (en streaming) todos los pagos de MP de los últimos `days` días"""
+    date_to = datetime.now(timezone.utc)
+    return iter_payments(date_to - timedelta(days=days), date_to)
+
+
+# 🔹 Motor de comparación
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "2000"))
+RECONCILE_GRACE_MINUTES = int(os.getenv("RECONCILE_GRACE_MINUTES", "60"))
+
+# estado MP -> estado local esperado (el resto se guarda tal cual)
+MP_TO_LOCAL_STATUS = {"approved": "paid"}
+
+REPORT_FIELDS = ["kind", "payment_id", "local_status", "mp_status", "amount", "local_amount"]
+
+
+def _expected_local_status(mp_status):
+    return MP_TO_LOCAL_STATUS.get(mp_status, mp_status)
+
 
+def _to_amount(value):
+    if value is None:
+        return None
+    return Decimal(str(value)).quantize(Decimal("0.01"))
 
-def reconcile_payments():
-    """Compara pagos de MP con los registrados localmente"""
-    mp_payments = fetch_recent_payments()
-    local_payments = PaymentPreference.objects.all()
 
-    discrepancies = []
+def _appointment_from_reference(external_ref):
+    if external_ref and external_ref.startswith("appointment_"):
+        return external_ref.replace("appointment_", "")
+    return None
 
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _compare(mp_id, remote, local_status, local_amount, check_status=True):
+    """Discrepancias entre un pago de MP y su fila local."""
+    mp_status, mp_amount, *_ = remote
+    if check_status and local_status != _expected_local_status(mp_status):
+        yield {"kind": "status_mismatch", "payment_id": mp_id, "local_status": local_status,
+               "mp_status": mp_status, "amount": mp_amount, "local_amount": local_amount}
+    if mp_amount is not None and local_amount != mp_amount:
+        yield {"kind": "amount_mismatch", "payment_id": mp_id, "local_status": local_status,
+               "mp_status": mp_status, "amount": mp_amount, "local_amount": local_amount}
+
+
+def _group_by(remote, field):
+    """valor de `field` (cita o preferencia) -> ids de MP que aún no tienen fila local."""
+    groups = {}
+    for mp_id, entry in remote.items():
+        if entry[field]:
+            groups.setdefault(entry[field], []).append(mp_id)
+    return groups
+
+
+def _attempt_order(mp_id, entry):
+    created = parse_datetime(entry[4] or "")
+    return (created.timestamp() if created else 0, int(mp_id) if mp_id.isdigit() else 0)
+
+
+def _compare_attempts(mp_ids, remote, payment_id, local_status, local_amount):
+    """
+    Intentos de pago de una misma preferencia. El estado local refleja el último, así
+    que solo ese se compara entero (y ninguno si la preferencia ya quedó pagada por
+    otro pago); de los anteriores solo se revisa el monto.
+    """
+    attempts = sorted(mp_ids, key=lambda mp_id: _attempt_order(mp_id, remote[mp_id]), reverse=True)
+    for i, mp_id in enumerate(attempts):
+        check_status = i == 0 and payment_id is None
+        yield from _compare(mp_id, remote.pop(mp_id), local_status, local_amount, check_status)
+
+
+def compare_payments(mp_payments, local_qs, chunk_size=RECONCILE_CHUNK_SIZE):
+    """
+    Generador de discrepancias entre los pagos de MP y PaymentPreference.
+
+    1. Indexa en memoria los pagos remotos (id -> estado, monto, cita), compactos.
+    2. Recorre `local_qs` en chunks con .iterator() y los empareja contra el índice:
+       las filas locales sin pago en MP son huérfanas (`missing_remote`).
+    3. Los remotos que no aparecieron en `local_qs` se buscan por lotes (payment_id,
+       preference_id y luego appointment_id); los que siguen sin fila local son `missing_local`.
+    """
+    remote = {}
     for mp in mp_payments:
-        mp_id = str(mp["id"])
-        mp_status = mp["status"]
-        mp_amount = mp["transaction_amount"]
+        remote[str(mp["id"])] = (
+            mp.get("status"),
+            _to_amount(mp.get("transaction_amount")),
+            _appointment_from_reference(mp.get("external_reference")),
+            mp.get("preference_id"),
+            mp.get("date_created"),
+        )
+
+    rows = local_qs.exclude(payment_id=None).values_list("payment_id", "status", "amount")
+    for payment_id, local_status, local_amount in rows.iterator(chunk_size=chunk_size):
+        entry = remote.pop(payment_id, None)
+        if entry is None:
+            yield {"kind": "missing_remote", "payment_id": payment_id, "local_status": local_status,
+                   "mp_status": "not_found", "amount": None, "local_amount": local_amount}
+        else:
+            yield from _compare(payment_id, entry, local_status, local_amount)
+
+    for chunk in _chunks(list(remote), chunk_size):
+        found = PaymentPreference.objects.filter(payment_id__in=chunk).values_list("payment_id", "status", "amount")
+        for payment_id, local_status, local_amount in found:
+            yield from _compare(payment_id, remote.pop(payment_id), local_status, local_amount)
+
+    # pagos no aprobados: la preferencia local no guarda su payment_id, se cruzan por
+    # preference_id (lo trae el pago) y, si no, por cita; una preferencia puede tener
+    # varios intentos (ej. dos rechazados) y todos quedan emparejados con ella
+    by_preference = _group_by(remote, 3)
+    for chunk in _chunks(list(by_preference), chunk_size):
+        found = (PaymentPreference.objects.filter(preference_id__in=chunk)
+                 .values_list("preference_id", "payment_id", "status", "amount"))
+        for preference_id, payment_id, local_status, local_amount in found:
+            yield from _compare_attempts(by_preference[preference_id], remote, payment_id, local_status, local_amount)
+
+    by_appointment = _group_by(remote, 2)
+    for chunk in _chunks(list(by_appointment), chunk_size):
+        # varias preferencias de la misma cita: cuenta la más reciente (igual que el webhook)
+        found = (PaymentPreference.objects.filter(appointment_id__in=chunk)
+                 .order_by("appointment_id", "-created_at", "-id")
+                 .values_list("appointment_id", "payment_id", "status", "amount"))
+        for appointment_id, payment_id, local_status, local_amount in found:
+            mp_ids = by_appointment.pop(appointment_id, None)
+            if mp_ids:
+                yield from _compare_attempts(mp_ids, remote, payment_id, local_status, local_amount)
+
+    for mp_id, (mp_status, mp_amount, *_) in remote.items():
+        yield {"kind": "missing_local", "payment_id": mp_id, "local_status": "not_found",
+               "mp_status": mp_status, "amount": mp_amount, "local_amount": None}
+
+
+def _counting(payments, run, every=500):
+    """Cuenta los pagos remotos leídos y guarda el progreso de la ejecución cada `every`."""
+    count = 0
+    for mp in payments:
+        count += 1
+        if count % every == 0:
+            ReconciliationRun.objects.filter(pk=run.pk).update(remote_count=count)
+        yield mp
+    run.remote_count = count
+
+
+def run_reconciliation(run, batch_size=1000):
+    """Ejecuta una ReconciliationRun y guarda las discrepancias en lotes."""
+    ReconciliationRun.objects.filter(pk=run.pk).update(status="running", started_at=dj_timezone.now())
+
+    try:
+        mp_payments = _counting(iter_payments(run.date_from, run.date_to), run)
+
+        # filas locales tocadas en el periodo (con margen para webhooks que llegan tarde)
+        local_payments = PaymentPreference.objects.filter(
+            updated_at__gte=run.date_from + timedelta(minutes=RECONCILE_GRACE_MINUTES),
+            updated_at__lt=run.date_to,
+        )
+
+        counters = {}
+        for chunk in _chunks(compare_payments(mp_payments, local_payments), batch_size):
+            ReconciliationDiscrepancy.objects.bulk_create(
+                [ReconciliationDiscrepancy(run=run, **d) for d in chunk]
+            )
+            for d in chunk:
+                counters[d["kind"]] = counters.get(d["kind"], 0) + 1
+            ReconciliationRun.objects.filter(pk=run.pk).update(
+                remote_count=run.remote_count, discrepancy_count=sum(counters.values()), counters=counters
+            )
+
+        ReconciliationRun.objects.filter(pk=run.pk).update(
+            status="done",
+            remote_count=run.remote_count,
+            discrepancy_count=sum(counters.values()),
+            counters=counters,
+            finished_at=dj_timezone.now(),
+        )
+        logger.info("✅ Reconciliación #%s completada: %s discrepancias", run.pk, sum(counters.values()))
+    except Exception as e:
+        ReconciliationRun.objects.filter(pk=run.pk).update(
+            status="failed", error=str(e), finished_at=dj_timezone.now()
+        )
+        raise
+
+
+def start_reconciliation(days=1):
+    """Crea una ReconciliationRun de los últimos `days` días y la encola para el worker."""
+    date_to = datetime.now(timezone.utc)
+    run = ReconciliationRun.objects.create(date_from=date_to - timedelta(days=days), date_to=date_to)
+    enqueue("reconcile", {"run_id": run.pk})
+    return run
+
 
+@register("reconcile")
+def process_reconcile_job(payload):
+    run = ReconciliationRun.objects.get(pk=payload["run_id"])
+    if run.status in ("pending", "running"):
+        # no reintentar desde la cola: una ejecución fallida queda en `failed`
         try:
-            local = local_payments.get(payment_id=mp_id)
-            if local.status != mp_status:
-                discrepancies.append({
-                    "payment_id": mp_id,
-                    "local_status": local.status,
-                    "mp_status": mp_status,
-                    "amount": mp_amount
-                })
-        except PaymentPreference.DoesNotExist:
-            discrepancies.append({
-                "payment_id": mp_id,
-                "local_status": "not_found",
-                "mp_status": mp_status,
-                "amount": mp_amount
-            })
-
-    # Exportar diferencias
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    export_path = os.path.join(settings.BASE_DIR, f"reconcile_report_{timestamp}.csv")
-
-    with open(export_path, "w", newline="", encoding="utf-8") as csvfile:
-        fieldnames = ["payment_id", "local_status", "mp_status", "amount"]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(discrepancies)
-
-    print(f"✅ Reconciliación completada. Reporte: {export_path}")
-    return discrepancies
+            ReconciliationDiscrepancy.objects.filter(run=run).delete()
+            run_reconciliation(run)
+        except Exception as e:
+            logger.exception("❌ Reconciliación #%s falló: %s", run.pk, e)
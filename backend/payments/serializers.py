@@ -1,10 +1,11 @@
 # payments/serializers.py
 from rest_framework import serializers
-from .models import PaymentPreference
+from .models import PaymentPreference, ReconciliationRun, ReconciliationDiscrepancy
 
 class CreatePaymentSerializer(serializers.Serializer):
     appointmentId = serializers.CharField()
     contactId = serializers.CharField()
+    locationId = serializers.CharField(required=False, allow_blank=True)
     amount = serializers.DecimalField(max_digits=10, decimal_places=2)
     description = serializers.CharField()
 
@@ -12,3 +13,13 @@ class PaymentPreferenceSerializer(serializers.ModelSerializer):
     class Meta:
         model = PaymentPreference
         fields = '__all__'
+
+class ReconciliationRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReconciliationRun
+        fields = '__all__'
+
+class ReconciliationDiscrepancySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReconciliationDiscrepancy
+        exclude = ['run']
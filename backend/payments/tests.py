@@ -1,3 +1,756 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import requests
+from asgiref.sync import async_to_sync
+from django.http import JsonResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from ghlmp_updates import http_client
+from ghlmp_updates.circuit import CircuitBreaker, CircuitOpenError
+from ghlmp_updates.metrics import Registry
+from ghlmp_updates.ratelimit import RateLimiter, RateLimitExceeded, TokenBucket
+from payments import jobs, outbox
+from payments.idempotency import claim, idempotent, mp_event_key, payload_hash, purge_expired
+from payments.models import GHLOutbox, PaymentPreference, PreferenceRequest, WebhookEvent, WebhookReceipt
+from payments.preferences import request_key
+from payments.reconcile import compare_payments
+from payments.webhooks import process_mp_notification
+
+
+def make_preference(**fields):
+    data = {
+        "appointment_id": "appt-1",
+        "contact_id": "contact-1",
+        "location_id": "loc-1",
+        "preference_id": "pref-1",
+        "init_point": "https://mp.test/pref-1",
+        "amount": "100.00",
+    }
+    data.update(fields)
+    return PaymentPreference.objects.create(**data)
+
+
+class MarkPaidTests(TestCase):
+    def test_first_call_wins_and_queues_ghl_sync(self):
+        pref = make_preference()
+
+        self.assertTrue(pref.mark_paid("pay-1"))
+
+        pref.refresh_from_db()
+        self.assertEqual((pref.status, pref.payment_id), ("paid", "pay-1"))
+        self.assertEqual(GHLOutbox.objects.filter(contact_id="contact-1").count(), 2)
+
+    def test_second_call_returns_false_and_queues_nothing(self):
+        pref = make_preference()
+        stale = PaymentPreference.objects.get(pk=pref.pk)  # otra notificación leyó la fila antes
+        pref.mark_paid("pay-1")
+
+        self.assertFalse(stale.mark_paid("pay-2"))
+
+        self.assertEqual(GHLOutbox.objects.count(), 2)
+        self.assertEqual(PaymentPreference.objects.get(pk=pref.pk).payment_id, "pay-1")
+
+    def test_set_status_never_overwrites_paid(self):
+        pref = make_preference()
+        stale = PaymentPreference.objects.get(pk=pref.pk)
+        pref.mark_paid("pay-1")
+
+        self.assertFalse(stale.set_status("rejected"))
+        self.assertEqual(PaymentPreference.objects.get(pk=pref.pk).status, "paid")
+
+    def test_set_status_skips_unchanged_status(self):
+        pref = make_preference()
+
+        self.assertTrue(pref.set_status("in_process"))
+        self.assertFalse(pref.set_status("in_process"))
+
+
+class MPNotificationTests(TestCase):
+    payment = {"id": 555, "status": "approved", "preference_id": "pref-1", "external_reference": "appointment_appt-1"}
+
+    def test_repeated_approved_notification_is_a_noop(self):
+        make_preference()
+        with mock.patch("payments.webhooks.fetch_payment", return_value=self.payment):
+            process_mp_notification({"data": {"id": 555}})
+            process_mp_notification({"data": {"id": 555}})
+
+        self.assertEqual(PaymentPreference.objects.get().status, "paid")
+        self.assertEqual(GHLOutbox.objects.count(), 2)
+
+    def test_duplicate_webhook_is_queued_once(self):
+        body = {"id": 9001, "action": "payment.updated", "data": {"id": 555}}
+
+        first = self.client.post("/api/payments/webhooks/mp", body, content_type="application/json")
+        second = self.client.post("/api/payments/webhooks/mp", body, content_type="application/json")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.json(), {"ok": True, "duplicate": True})
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+
+def mp_payment(mp_id, status, created, **fields):
+    data = {
+        "id": mp_id, "status": status, "transaction_amount": 100, "preference_id": "pref-1",
+        "external_reference": "appointment_appt-1", "date_created": f"2026-01-01T{created}:00.000-04:00",
+    }
+    data.update(fields)
+    return data
+
+
+class ComparePaymentsTests(TestCase):
+    def compare(self, payments):
+        return list(compare_payments(payments, PaymentPreference.objects.all()))
+
+    def test_several_attempts_on_one_preference_are_all_matched(self):
+        make_preference(status="rejected")
+
+        found = self.compare([mp_payment(1, "rejected", "10:00"), mp_payment(2, "rejected", "10:05")])
+
+        self.assertEqual(found, [])
+
+    def test_only_the_latest_attempt_is_checked_against_the_local_status(self):
+        make_preference(status="pending")
+
+        found = self.compare([mp_payment(2, "rejected", "10:05"), mp_payment(1, "in_process", "10:00")])
+
+        self.assertEqual([(d["kind"], d["payment_id"]) for d in found], [("status_mismatch", "2")])
+
+    def test_attempts_before_the_approved_payment_belong_to_the_paid_preference(self):
+        pref = make_preference()
+        pref.mark_paid("3")
+
+        found = self.compare([
+            mp_payment(1, "rejected", "10:00"),
+            mp_payment(2, "rejected", "10:05", preference_id=None),
+            mp_payment(3, "approved", "10:10"),
+        ])
+
+        self.assertEqual(found, [])
+
+    def test_appointment_fallback_uses_the_newest_preference(self):
+        make_preference(preference_id="pref-old", status="expired")
+        make_preference(preference_id="pref-new", status="rejected")
+
+        found = self.compare([
+            mp_payment(1, "rejected", "10:00", preference_id=None),
+            mp_payment(2, "rejected", "10:05", preference_id=None),
+            mp_payment(9, "rejected", "10:05", preference_id=None, external_reference="appointment_otra"),
+        ])
+
+        self.assertEqual([(d["kind"], d["payment_id"]) for d in found], [("missing_local", "9")])
+
+
+def racing_claim(claim_batch, limit, other_limit):
+    """
+    Corre `claim_batch(limit)` con otro worker reservando `other_limit` filas justo
+    entre el SELECT de ids y el UPDATE condicional (donde se genera el token).
+    """
+    real_uuid4, other = uuid.uuid4, []
+
+    def uuid4():
+        if not other:
+            other.append(None)
+            other.extend(claim_batch(other_limit))
+        return real_uuid4()
+
+    with mock.patch("uuid.uuid4", side_effect=uuid4):
+        mine = claim_batch(limit)
+    return mine, other[1:]
+
+
+@override_settings(WEBHOOK_QUEUE_MAX_ATTEMPTS=3, WEBHOOK_QUEUE_RETRY_BASE_SECONDS=5)
+class WebhookQueueTests(TestCase):
+    def claim_one(self):
+        WebhookEvent.objects.filter(status="pending").update(available_at=timezone.now())
+        (event,) = jobs.claim_batch(10)
+        return event
+
+    def test_racing_workers_never_share_an_event(self):
+        jobs.enqueue_many("test", [{"n": n} for n in range(4)])
+
+        mine, other = racing_claim(jobs.claim_batch, 4, 2)
+
+        self.assertEqual(len(other), 2)
+        self.assertEqual(len(mine), 2)
+        self.assertFalse({e.pk for e in mine} & {e.pk for e in other})
+        self.assertEqual(set(WebhookEvent.objects.values_list("attempts", flat=True)), {1})
+        self.assertEqual(jobs.claim_batch(10), [])
+
+    def test_failures_back_off_exponentially_then_fail(self):
+        jobs.enqueue("test", {})
+
+        for expected_delay in (5, 10):
+            event = self.claim_one()
+            jobs.fail(event, ValueError("boom"))
+            event.refresh_from_db()
+            self.assertEqual(event.status, "pending")
+            delay = (event.available_at - timezone.now()).total_seconds()
+            self.assertAlmostEqual(delay, expected_delay, delta=1)
+
+        event = self.claim_one()
+        jobs.fail(event, ValueError("boom"))
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts, event.last_error), ("failed", 3, "boom"))
+
+    def test_unavailable_upstream_defers_without_spending_an_attempt(self):
+        jobs.enqueue_many("test", [{}, {}])
+        errors = [CircuitOpenError("ghl", 30), RateLimitExceeded("ghl", 120)]
+
+        def handler(payload):
+            raise errors.pop(0)
+
+        with mock.patch.dict(jobs.HANDLERS, {"test": handler}):
+            for event in jobs.claim_batch(10):
+                self.assertFalse(jobs.process_event(event))
+
+        delays = sorted(
+            round((e.available_at - timezone.now()).total_seconds(), -1)
+            for e in WebhookEvent.objects.filter(status="pending", attempts=0)
+        )
+        self.assertEqual(delays, [30, 120])
+
+    def test_stale_lock_is_released(self):
+        jobs.enqueue("test", {})
+        event = self.claim_one()
+        WebhookEvent.objects.filter(pk=event.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(jobs.release_stale(), 1)
+        self.assertEqual(self.claim_one().pk, event.pk)
+
+
+@override_settings(GHL_OUTBOX_MAX_ATTEMPTS=3, GHL_OUTBOX_RETRY_BASE_SECONDS=10, GHL_OUTBOX_RETRY_MAX_SECONDS=15)
+class OutboxTests(TestCase):
+    def add_rows(self, n=1):
+        return GHLOutbox.objects.bulk_create([
+            GHLOutbox(contact_id=f"c{i}", operation="add_tag", payload={"tag": "pago_confirmado"}) for i in range(n)
+        ])
+
+    def claim_one(self):
+        GHLOutbox.objects.filter(status="pending").update(next_attempt_at=timezone.now())
+        (row,) = outbox.claim_batch(10)
+        return row
+
+    def test_racing_dispatchers_never_share_a_row(self):
+        self.add_rows(5)
+
+        mine, other = racing_claim(outbox.claim_batch, 5, 3)
+
+        self.assertEqual((len(mine), len(other)), (2, 3))
+        self.assertFalse({r.pk for r in mine} & {r.pk for r in other})
+        self.assertEqual(outbox.claim_batch(10), [])
+
+    def test_backoff_is_exponential_and_capped(self):
+        self.assertEqual([outbox.backoff_seconds(n) for n in (1, 2, 3)], [10, 15, 15])
+
+    def test_rejected_rows_retry_then_go_to_dead_letter(self):
+        self.add_rows()
+
+        for expected_delay in (10, 15):
+            row = self.claim_one()
+            self.assertFalse(outbox.settle(row, False))
+            row.refresh_from_db()
+            self.assertEqual(row.status, "pending")
+            self.assertAlmostEqual((row.next_attempt_at - timezone.now()).total_seconds(), expected_delay, delta=1)
+
+        row = self.claim_one()
+        outbox.settle(row, RuntimeError("GHL 500"))
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts, row.last_error), ("dead", 3, "GHL 500"))
+
+        self.assertEqual(outbox.requeue_dead(), 1)
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ("pending", 0))
+        self.assertEqual(self.claim_one().pk, row.pk)
+
+    def test_unavailable_ghl_defers_without_spending_an_attempt(self):
+        self.add_rows(2)
+        rows = outbox.claim_batch(10)
+
+        outbox.settle(rows[0], CircuitOpenError("ghl", 30))
+        outbox.settle(rows[1], RateLimitExceeded("ghl", 60))
+
+        self.assertEqual(GHLOutbox.objects.filter(status="pending", attempts=0).count(), 2)
+        self.assertEqual(outbox.claim_batch(10), [])
+
+    def test_sent_rows_are_not_claimed_again(self):
+        self.add_rows()
+        row = self.claim_one()
+
+        self.assertTrue(outbox.settle(row, True))
+
+        row.refresh_from_db()
+        self.assertEqual(row.status, "sent")
+        self.assertIsNotNone(row.sent_at)
+        self.assertEqual(outbox.claim_batch(10), [])
+
+
+class IdempotencyTests(TestCase):
+    body = {"id": 1, "action": "payment.created", "data": {"id": 555}}
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.calls = 0
+
+    def request(self):
+        return self.factory.post("/hook", self.body, content_type="application/json")
+
+    def hook(self, *outcomes):
+        """Vista de webhook cuyas llamadas devuelven (o lanzan) `outcomes` en orden."""
+        outcomes = list(outcomes)
+
+        def run():
+            self.calls += 1
+            outcome = outcomes.pop(0) if outcomes else 200
+            if isinstance(outcome, Exception):
+                raise outcome
+            return JsonResponse({"ok": True}, status=outcome)
+
+        @idempotent("test", mp_event_key)
+        def view(request):
+            return run()
+
+        @idempotent("test", mp_event_key)
+        async def async_view(request):
+            return run()
+
+        return view, async_view
+
+    def test_duplicate_is_answered_without_calling_the_view(self):
+        view, _ = self.hook()
+
+        view(self.request())
+        response = view(self.request())
+
+        self.assertEqual(json.loads(response.content), {"ok": True, "duplicate": True})
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(WebhookReceipt.objects.get().duplicates, 1)
+
+    def test_error_response_releases_the_receipt_for_the_retry(self):
+        view, _ = self.hook(503, 200)
+
+        self.assertEqual(view(self.request()).status_code, 503)
+        self.assertFalse(WebhookReceipt.objects.exists())
+        self.assertEqual(view(self.request()).status_code, 200)
+        self.assertTrue(json.loads(view(self.request()).content)["duplicate"])
+        self.assertEqual(self.calls, 2)
+
+    def test_exception_releases_the_receipt_for_the_retry(self):
+        view, _ = self.hook(RuntimeError("boom"))
+
+        with self.assertRaises(RuntimeError):
+            view(self.request())
+        self.assertEqual(view(self.request()).status_code, 200)
+        self.assertEqual(self.calls, 2)
+
+    async def test_async_view_dedupes_and_releases(self):
+        _, view = self.hook(500, RuntimeError("boom"))
+
+        self.assertEqual((await view(self.request())).status_code, 500)
+        with self.assertRaises(RuntimeError):
+            await view(self.request())
+        self.assertEqual((await view(self.request())).status_code, 200)
+        self.assertTrue(json.loads((await view(self.request())).content)["duplicate"])
+        self.assertEqual(self.calls, 3)
+
+    def test_expired_receipts_are_reused_and_purged(self):
+        self.assertTrue(claim("test", "k1"))
+        self.assertFalse(claim("test", "k1"))
+        WebhookReceipt.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertTrue(claim("test", "k1"))  # vencido: cuenta como evento nuevo
+        claim("test", "k2", ttl=1)
+        WebhookReceipt.objects.filter(key="k2").update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(purge_expired(), 1)
+        self.assertEqual(list(WebhookReceipt.objects.values_list("key", flat=True)), ["k1"])
+
+    def test_mp_event_key(self):
+        self.assertEqual(mp_event_key(self.body), "1:payment.created")
+        self.assertNotEqual(mp_event_key(self.body), mp_event_key(dict(self.body, action="payment.updated")))
+        # formato IPN viejo (sin data.id): hash del payload, sin importar el orden de las claves
+        self.assertEqual(mp_event_key({"id": 5, "topic": "payment"}), payload_hash({"topic": "payment", "id": 5}))
+
+    def test_duplicates_are_exposed_in_metrics(self):
+        view, _ = self.hook()
+        for _ in range(3):
+            view(self.request())
+
+        body = self.client.get("/metrics").content.decode()
+
+        self.assertIn('webhook_receipts{source="test"} 1', body)
+        self.assertIn('webhook_duplicates_absorbed{source="test"} 2', body)
+
+
+class MetricsDirTests(TestCase):
+    """Suma multiproceso de METRICS_DIR: solo cuentan los archivos de procesos vivos."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.registry = Registry(directory=self.directory, flush_interval=5)
+        patcher = mock.patch.object(self.registry, "_ensure_flusher")  # sin hilo de volcado en los tests
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.counter = self.registry.counter("jobs_total", "Trabajos.")
+
+    def write(self, pid, value, age=0):
+        path = os.path.join(self.directory, f"{pid}.json")
+        with open(path, "w") as f:
+            json.dump({"jobs_total": [[[], value]]}, f)
+        if age:
+            os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def total(self):
+        return self.registry.collect()["jobs_total"][()]
+
+    def test_files_of_dead_processes_are_dropped(self):
+        finished = subprocess.Popen([sys.executable, "-c", "pass"])
+        finished.wait()
+        dead = self.write(finished.pid, 10)
+        alive = self.write(os.getppid(), 5)
+        self.counter.inc()
+
+        self.assertEqual(self.total(), 6)
+        self.assertFalse(os.path.exists(dead))
+        self.assertTrue(os.path.exists(alive))
+
+    def test_stale_file_of_a_reused_pid_is_dropped(self):
+        # el PID existe pero es otro proceso: el archivo dejó de actualizarse hace rato
+        stale = self.write(os.getppid(), 10, age=120)
+        self.counter.inc()
+
+        self.assertEqual(self.total(), 1)
+        self.assertFalse(os.path.exists(stale))
+
+    def test_process_removes_its_file_on_exit(self):
+        self.counter.inc()
+        self.registry.flush()
+
+        self.registry.discard()
+
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class FakeClock:
+    """Reloj monótono manual; `sleep` lo adelanta (reemplaza time.sleep / asyncio.sleep)."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(rate=1, burst=2, clock=self.clock)
+
+        self.assertEqual([bucket.reserve() for _ in range(3)], [(0.0, True), (0.0, True), (1.0, True)])
+        self.clock.now += 3
+        self.assertEqual(bucket.reserve(), (0.0, True))
+
+    def test_max_wait_bounds_the_debt(self):
+        bucket = TokenBucket(rate=1, burst=1, clock=self.clock)
+
+        waits = [bucket.reserve(max_wait=2) for _ in range(4)]
+
+        self.assertEqual(waits, [(0.0, True), (1.0, True), (2.0, True), (3.0, False)])
+        self.assertEqual(bucket.tokens, -2)  # el rechazo no tomó token
+        self.clock.now += 1
+        self.assertEqual(bucket.reserve(max_wait=2), (2.0, True))
+
+    def test_pause_blocks_until_retry_after(self):
+        bucket = TokenBucket(rate=10, burst=10, clock=self.clock)
+
+        bucket.pause(5)
+
+        self.assertEqual(bucket.reserve(max_wait=1), (5.0, False))
+        self.clock.now += 5
+        self.assertEqual(bucket.reserve(max_wait=1), (0.0, True))
+
+    def test_limiter_refunds_the_other_buckets_when_one_refuses(self):
+        limiter = RateLimiter([(10, 10), (1 / 3600, 1)], name="ghl#loc-1", clock=self.clock)
+        burst, daily = limiter.buckets
+
+        self.assertEqual(limiter.reserve(max_wait=2), 0.0)
+        with self.assertRaises(RateLimitExceeded) as ctx:
+            limiter.reserve(max_wait=2)
+
+        self.assertAlmostEqual(ctx.exception.retry_in, 3600)
+        self.assertNotIsInstance(ctx.exception, CircuitOpenError)
+        self.assertEqual((burst.tokens, daily.tokens), (9, 0))
+
+
+class FakeResponse:
+    def __init__(self, status_code, retry_after=None, url=""):
+        self.status_code = status_code
+        self.headers = {"Retry-After": retry_after} if retry_after else {}
+        self.url = url
+
+    def close(self):
+        pass
+
+
+class HttpClientWaitBudgetTests(TestCase):
+    """Espera total de `http_client.request` (rate limit + reintentos de 429) con reloj falso."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.url = f"https://budget-{uuid.uuid4().hex[:8]}.test/v1/items"
+        for target, value in (("time.sleep", self.clock.sleep), ("_background", False), ("HTTP_MAX_WAIT", 2),
+                              ("HTTP_BACKGROUND_MAX_WAIT", 60), ("HTTP_429_MAX_RETRIES", 3), ("HTTP_429_MAX_WAIT", 60)):
+            patcher = mock.patch(f"ghlmp_updates.http_client.{target}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def respond(self, *responses):
+        """Sesión falsa para el host de prueba: devuelve `responses` en orden y cuenta las llamadas."""
+        session = mock.Mock()
+        session.request.side_effect = list(responses)
+        patcher = mock.patch("ghlmp_updates.http_client.get_session", return_value=session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return session
+
+    def limit(self, *limits):
+        key = http_client._pool_key(self.url)
+        for table, value in ((http_client._rate_limits, list(limits)),
+                                (http_client._limiters, RateLimiter(limits, name=key, clock=self.clock))):
+            patcher = mock.patch.dict(table, {key: value})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_interactive_429_retries_only_within_the_budget(self):
+        session = self.respond(*(FakeResponse(429, "1", self.url) for _ in range(4)))
+
+        response = http_client.request("GET", self.url)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.clock.slept, [1.0, 1.0])
+        self.assertEqual(session.request.call_count, 3)
+
+    def test_retry_after_longer_than_the_budget_returns_the_429_at_once(self):
+        self.respond(FakeResponse(429, "30", self.url))
+
+        self.assertEqual(http_client.request("GET", self.url).status_code, 429)
+        self.assertEqual(self.clock.slept, [])
+
+    def test_background_worker_waits_retry_after_then_succeeds(self):
+        http_client.run_in_background()
+        self.respond(FakeResponse(429, "30", self.url), FakeResponse(200, url=self.url))
+
+        self.assertEqual(http_client.request("GET", self.url).status_code, 200)
+        self.assertEqual(self.clock.slept, [30.0])
+
+    def test_interactive_call_fails_fast_when_the_quota_is_exhausted(self):
+        self.limit((0.1, 1))
+        session = self.respond(FakeResponse(200, url=self.url))
+
+        http_client.request("GET", self.url)
+        with self.assertRaises(RateLimitExceeded):
+            http_client.request("GET", self.url)
+
+        self.assertEqual(session.request.call_count, 1)
+        self.assertEqual(self.clock.slept, [])
+        self.assertEqual(http_client.get_breaker(self.url).state, "closed")
+
+    def test_background_worker_waits_for_the_quota(self):
+        http_client.run_in_background()
+        self.limit((0.1, 1))
+        self.respond(FakeResponse(200, url=self.url), FakeResponse(200, url=self.url))
+
+        http_client.request("GET", self.url)
+        http_client.request("GET", self.url)
+
+        self.assertEqual(self.clock.slept, [10.0])
+
+    def test_429_pauses_the_tenant_bucket_and_counts_against_the_budget(self):
+        self.limit((10, 10))
+        self.respond(FakeResponse(429, "1.5", self.url), FakeResponse(429, "1", self.url), FakeResponse(200, url=self.url))
+
+        response = http_client.request("GET", self.url)
+
+        # 1.5 s esperados de 2: el segundo 429 pide 1 s más y ya no alcanza
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.clock.slept, [1.5])
+
+
+class AsyncClientLifecycleTests(TestCase):
+    async def open_clients(self):
+        url = f"https://pool-{uuid.uuid4().hex[:8]}.test/v1"
+        clients = [http_client.get_async_client(url), http_client.get_async_client(url, tenant="loc-a")]
+        self.assertIs(http_client.get_async_client(url), clients[0])
+        return clients
+
+    def test_clients_are_closed_when_their_loop_ends(self):
+        # asyncio.run (uvicorn) y async_to_sync (vista async servida por WSGI: un loop por request)
+        for clients in (asyncio.run(self.open_clients()), async_to_sync(self.open_clients)()):
+            self.assertTrue(all(client.is_closed for client in clients))
+
+    def test_each_loop_gets_its_own_clients(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        first = loop.run_until_complete(self.open_clients())
+
+        self.assertFalse(any(client.is_closed for client in first))
+        self.assertTrue(all(client.is_closed for client in asyncio.run(self.open_clients())))
+        self.assertFalse(any(client.is_closed for client in first))
+
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        self.assertTrue(all(client.is_closed for client in first))
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker("mp", failure_threshold=3, reset_timeout=30, half_open_probes=1, clock=self.clock)
+
+    def trip(self):
+        for _ in range(3):
+            self.breaker.before_call()
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures_only(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.breaker.record_success()  # un éxito reinicia la racha
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "closed")
+
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, "open")
+        self.clock.now += 10
+        with self.assertRaises(CircuitOpenError) as ctx:
+            self.breaker.before_call()
+        self.assertEqual(ctx.exception.retry_in, 20)
+        self.assertEqual(self.breaker.rejected, 1)
+
+    def test_half_open_lets_one_probe_through_and_closes_on_success(self):
+        self.trip()
+        self.clock.now += 30
+
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, "half_open")
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()  # la prueba ya está en curso
+
+        self.breaker.record_success()
+        self.assertEqual((self.breaker.state, self.breaker.failures), ("closed", 0))
+        self.breaker.before_call()
+
+    def test_failed_probe_reopens_for_a_full_timeout(self):
+        self.trip()
+        self.clock.now += 30
+        self.breaker.before_call()
+
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, "open")
+        self.assertEqual(self.breaker.retry_in(), 30)
+
+    def test_released_probe_can_be_retried(self):
+        self.trip()
+        self.clock.now += 30
+        self.breaker.before_call()
+
+        self.breaker.release_probe()  # ej. la llamada no se hizo por rate limit
+
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, "half_open")
+
+
+class CreatePreferenceTests(TestCase):
+    body = {"appointmentId": "appt-1", "contactId": "contact-1", "amount": "100.00", "description": "Consulta"}
+
+    def setUp(self):
+        self.created = 0
+        patcher = mock.patch("payments.preferences.mp_request", side_effect=self.mp_create)
+        self.mp = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def mp_create(self, method, url, **kwargs):
+        self.created += 1
+        return mock.Mock(status_code=201, **{"json.return_value": {
+            "id": f"pref-{self.created}", "init_point": f"https://mp.test/pref-{self.created}",
+        }})
+
+    def create(self, idempotency_key=None, **fields):
+        headers = {"HTTP_IDEMPOTENCY_KEY": idempotency_key} if idempotency_key else {}
+        return self.client.post("/api/payments/create/", dict(self.body, **fields),
+                                content_type="application/json", **headers)
+
+    def test_same_idempotency_key_returns_the_same_preference(self):
+        first = self.create("abc").json()
+        second = self.create("abc").json()
+
+        self.assertEqual(self.mp.call_count, 1)
+        self.assertEqual((first["reused"], second["reused"]), (False, True))
+        self.assertEqual(first["preference_id"], second["preference_id"])
+
+    def test_pending_link_is_reused_for_the_same_appointment_contact_and_amount(self):
+        first = self.create().json()
+        again = self.create("otra-clave").json()
+        other_amount = self.create(amount="120.00").json()
+
+        self.assertEqual(again["preference_id"], first["preference_id"])
+        self.assertTrue(again["reused"])
+        self.assertNotEqual(other_amount["preference_id"], first["preference_id"])
+        self.assertEqual(self.mp.call_count, 2)
+
+    def test_paid_link_is_not_reused(self):
+        first = self.create().json()
+        PaymentPreference.objects.get(preference_id=first["preference_id"]).mark_paid("pay-1")
+
+        second = self.create().json()
+
+        self.assertNotEqual(second["preference_id"], first["preference_id"])
+        self.assertFalse(second["reused"])
+
+    def test_identical_request_in_flight_gets_409(self):
+        PreferenceRequest.objects.create(key=request_key(self.body, "abc"))
+
+        with mock.patch("payments.preferences.PREFERENCE_WAIT_SECONDS", 0):
+            response = self.create("abc")
+
+        self.assertEqual(response.status_code, 409)
+        self.mp.assert_not_called()
+
+    def test_abandoned_claim_is_taken_over(self):
+        claim = PreferenceRequest.objects.create(key=request_key(self.body, "abc"))
+        PreferenceRequest.objects.filter(pk=claim.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+
+        response = self.create("abc")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.mp.call_count, 1)
+
+    def test_mp_failure_releases_the_claim_for_the_retry(self):
+        self.mp.side_effect = [mock.Mock(**{"raise_for_status.side_effect": requests.HTTPError(response=mock.Mock(text="boom"))})]
+
+        self.assertEqual(self.create("abc").status_code, 500)
+        self.assertFalse(PreferenceRequest.objects.exists())
+
+        self.mp.side_effect = self.mp_create
+        self.assertFalse(self.create("abc").json()["reused"])
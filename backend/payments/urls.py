@@ -1,6 +1,14 @@
 # payments/urls.py
 from django.urls import path
-from .views import CreatePaymentView, MPWebhookView, ReconcilePaymentsView # ver webhook abajo
+from .views import (  # ver webhook abajo
+    CreatePaymentView,
+    MPWebhookView,
+    create_payment_async,
+    mp_webhook_async,
+    ReconcilePaymentsView,
+    ReconciliationRunView,
+    reconcile_report,
+)
 from django.http import JsonResponse
 
 
@@ -19,10 +27,14 @@ def payment_pending(request):
 urlpatterns = [
     # Crear preferencia de pago
     path("create/", CreatePaymentView.as_view(), name="payments-create"),
+    path("create/async/", create_payment_async, name="payments-create-async"),
     # Webhook (recibe notificaciones de Mercado Pago)
     path("webhooks/mp", MPWebhookView.as_view(), name="mp-webhook"),  # ver webhook abajo
+    path("webhooks/mp/async", mp_webhook_async, name="mp-webhook-async"),
     # Reconciliación de pagos
     path("reconcile/", ReconcilePaymentsView.as_view(), name="reconcile"),
+    path("reconcile/<int:pk>/", ReconciliationRunView.as_view(), name="reconcile-run"),
+    path("reconcile/<int:pk>/report", reconcile_report, name="reconcile-report"),
     # Rutas de retorno (back_urls)
     path('success', payment_success, name='payment_success'),
     path('failure', payment_failure, name='payment_failure'),
@@ -1,176 +1,264 @@
 # payments/views.py
+import logging
 import os
+import io
+import csv
+import json
+import zlib
+import httpx
 import requests
-from django.conf import settings
+from asgiref.sync import sync_to_async
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import CreatePaymentSerializer
-from .models import PaymentPreference
+from .serializers import CreatePaymentSerializer, ReconciliationRunSerializer, ReconciliationDiscrepancySerializer
+from .models import ReconciliationRun
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.parsers import JSONParser
 from dotenv import load_dotenv, find_dotenv
-from payments.reconcile import reconcile_payments
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from payments.reconcile import REPORT_FIELDS, start_reconciliation
+from payments.preferences import (
+    PreferenceInProgress,
+    build_preference_payload,
+    complete,
+    create_preference,
+    link_expiry,
+    mp_headers,
+    preference_fields,
+    preference_response,
+    release,
+    request_key,
+    reserve,
+)
+from payments.jobs import aenqueue, enqueue
+from payments.webhooks import extract_payment_id
+from payments.idempotency import idempotent, mp_event_key
+from ghlmp_updates.circuit import CircuitOpenError, unavailable_response
+from ghlmp_updates.ratelimit import RateLimitExceeded, rate_limited_response
+from mp_oauth.tokens import MP_USER_ID, amp_request
 
 
 # Cargar variables .env
 load_dotenv(find_dotenv())
 
+logger = logging.getLogger(__name__)
+
 MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN")
-if not MP_ACCESS_TOKEN:
+if not MP_ACCESS_TOKEN and not MP_USER_ID:
     # 🛑 Detiene la aplicación si el token crítico no está disponible
     raise EnvironmentError("❌ La variable de entorno MP_ACCESS_TOKEN no está definida.")
 
 MP_BASE = os.getenv("MP_BASE_URL", "https://api.mercadopago.com")
 
-# 💡 AÑADIR ESTA LÍNEA TEMPORALMENTE
+
 # crear preferencia de pago en MP y guardar en BD
+# Si la cita ya tiene un link pendiente vigente (mismo contacto y monto) se devuelve ese;
+# el header Idempotency-Key hace que los reintentos del frontend reciban el mismo link.
 class CreatePaymentView(APIView):
     def post(self, request):
         serializer = CreatePaymentSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
 
-        # preparar payload preferencia
-        items = [{
-            "title": data["description"],
-            "quantity": 1,
-            "unit_price": float(data["amount"]),
-            "currency_id": "PEN"
-        }]
-        payload = {
-            "items": items,
-            "external_reference": f"appointment_{data['appointmentId']}",
-            "metadata": {
-                "appointment_id": data["appointmentId"], 
-                "contact_id": data["contactId"]
-            },
-            "back_urls": {
-        "success": f"{os.getenv('APP_PUBLIC_URL')}/payments/success",
-        "failure": f"{os.getenv('APP_PUBLIC_URL')}/payments/failure",
-        "pending": f"{os.getenv('APP_PUBLIC_URL')}/payments/pending"
-    },
-    "auto_return": "approved",
-    "notification_url": f"{os.getenv('APP_PUBLIC_URL')}/payments/webhooks/mp"
-        }
-
-        headers = {
-            "Authorization": f"Bearer {MP_ACCESS_TOKEN}", 
-            "Content-Type": "application/json"
-        }
-
-        r = requests.post(f"{MP_BASE}/checkout/preferences", json=payload, headers=headers)
+        try:
+            pref, reused = create_preference(data, request.headers.get("Idempotency-Key"))
+        except CircuitOpenError as e:
+            return unavailable_response(e)
+        except RateLimitExceeded as e:
+            return rate_limited_response(e)
+        except PreferenceInProgress:
+            return Response({"error": "La preferencia se está creando, reintentar"}, status=409)
+        except requests.HTTPError as e:
+            return Response({"error": "MP error", "details": e.response.text}, status=500)
+        except requests.RequestException as e:
+            return Response({"error": "Error conexión MP", "details": str(e)}, status=502)
+
+        return Response(preference_response(pref, reused))
+
+
+# Versión async (ASGI): no bloquea un hilo durante el round trip a MP
+@csrf_exempt
+async def create_payment_async(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    try:
+        body = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+
+    serializer = CreatePaymentSerializer(data=body)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    data = serializer.validated_data
+
+    key = request_key(data, request.headers.get("Idempotency-Key"))
+    try:
+        pref, claim = await sync_to_async(reserve)(data, key)
+    except PreferenceInProgress:
+        return JsonResponse({"error": "La preferencia se está creando, reintentar"}, status=409)
+    if pref is not None:
+        return JsonResponse(preference_response(pref, reused=True))
+
+    try:
+        expires_at = link_expiry()
+        r = await amp_request("POST", f"{MP_BASE}/checkout/preferences",
+                              json=build_preference_payload(data, expires_at), headers=mp_headers())
         if r.status_code not in (200, 201):
-            return Response({"error": "MP error", "details": r.text}, status=500)
-        
-        resp = r.json()
-        pref_id = resp.get("id")
-        init_point = resp.get("init_point")
-        sandbox_init_point = resp.get("sandbox_init_point")
-
-        # guardar en BD
-        p = PaymentPreference.objects.create(
-            appointment_id=data["appointmentId"],
-            contact_id=data["contactId"],
-            preference_id=pref_id,
-            init_point=init_point or sandbox_init_point,
-            amount=data["amount"],
-            status="pending"
-        )
-
-        # ✅ Devuelve ambos (para pruebas y producción)
-        return Response({
-            "sandbox_init_point": sandbox_init_point,
-            "init_point": init_point, 
-            "preference_id": pref_id
-            })
+            await sync_to_async(release)(claim)
+            return JsonResponse({"error": "MP error", "details": r.text}, status=500)
+        pref = await sync_to_async(complete)(claim, preference_fields(data, r.json(), expires_at))
+    except CircuitOpenError as e:
+        await sync_to_async(release)(claim)
+        return unavailable_response(e)
+    except RateLimitExceeded as e:
+        await sync_to_async(release)(claim)
+        return rate_limited_response(e)
+    except httpx.RequestError as e:
+        await sync_to_async(release)(claim)
+        return JsonResponse({"error": "Error conexión MP", "details": str(e)}, status=502)
+    except BaseException:
+        await sync_to_async(release)(claim)
+        raise
+    return JsonResponse(preference_response(pref))
 
 
 # webhook para notificaciones de Mercado Pago
+# Solo encola la notificación y responde 200 en milisegundos; el worker
+# `python manage.py process_webhooks` consulta MP y sincroniza GHL.
+# Las notificaciones repetidas se descartan antes de encolar (payments/idempotency.py).
 @method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(idempotent("mp", mp_event_key), name='post')
 class MPWebhookView(APIView):
     parser_classes = [JSONParser]
 
     def post(self, request):
         payload = request.data
-        # Mercado Pago puede enviar distintos shapes; lo común: data.id (payment id) o type=payment + data.id
-        # Normalmente webhook trae: {"id": 123, "type": "payment"}, luego consultamos detalle
         try:
-            # extraer payment id robustamente
-            payment_id = None
-            if "data" in payload and isinstance(payload["data"], dict) and payload["data"].get("id"):
-                payment_id = payload["data"]["id"]
-            elif payload.get("id"):
-                payment_id = payload.get("id")
-
-            if not payment_id:
+            if not extract_payment_id(payload):
                 return Response({"ok": True}, status=200)
-            
-            # 🔎 DEBUG AÑADIDO: Muestra los primeros 10 caracteres del token para confirmar su carga
-            print(f"DEBUG TOKEN (MPWebhookView): {MP_ACCESS_TOKEN[:10] if MP_ACCESS_TOKEN else 'NONE/EMPTY'}")
-
-            # consultar MP para detalle payment
-            headers = {"Authorization": f"Bearer {MP_ACCESS_TOKEN}"}
-            r = requests.get(f"{MP_BASE}/v1/payments/{payment_id}", headers=headers)
-
-            # ⚠️ Evita 500 en simulaciones o pagos no encontrados
-            if r.status_code != 200:
-                print(f"⚠️ Mercado Pago devolvió {r.status_code} para payment_id={payment_id}")
-                print("Respuesta:", r.text)
-                # responder 200 para no repetir el intento del webhook
-                return Response({"ok": True, "note": "payment not found or simulated"}, status=200)
-            
-            payment = r.json()
-            status_mp = payment.get("status")
-            external_ref = payment.get("external_reference") or payment.get("metadata", {}).get("external_reference")
-
-            # mapping external_reference -> preference / appointment
-            # external_ref puede ser "appointment_12345"
-            appointment_id = None
-            if external_ref and external_ref.startswith("appointment_"):
-                appointment_id = external_ref.replace("appointment_", "")
-
-            # Buscar la preferencia por external reference o por payment.preference_id si lo guardaste
-            # Mejor: busca por appointment_id
-            pref = None
-            if appointment_id:
-                pref = PaymentPreference.objects.filter(appointment_id=appointment_id).first()
-            # fallback: buscar por payment.preference_id en payment['preference_id']
-            if not pref and payment.get("preference_id"):
-                pref = PaymentPreference.objects.filter(preference_id=payment.get("preference_id")).first()
-
-            if not pref:
-                # guarda log o crea registro mínimo
-                print("⚠️ Preferencia no encontrada para:", external_ref)
-                return Response({"message": "preference not found"}, status=404)
-
-            # Idempotencia: si payment_id ya fue procesado
-            if pref.payment_id == str(payment_id) or pref.status == "paid":
-                return Response({"ok": True}, status=200)
-
-            if status_mp == "approved":
-                pref.mark_paid(payment_id=str(payment_id))
-                print(f"✅ Pago aprobado: {payment_id}")
-
-                # llamar a GHL para actualizar contacto (ver gh_client)
-                from ..ghlmp_updates.ghl_client import add_tag_to_contact
-                add_tag_to_contact(pref.contact_id, "pago_confirmado")
-            else:
-                # actualizar estado local si quieres
-                pref.status = status_mp
-                pref.save()
-                print(f"ℹ️ Pago actualizado a estado {status_mp}")
 
-            return Response({"ok": True}, status=200)
+            event = enqueue("mp", payload)
+            return Response({"ok": True, "queued": event.pk}, status=200)
 
         except Exception as e:
-            print("❌ Error en webhook:", str(e))
+            logger.exception("❌ Error en webhook: %s", e)
             return Response({"error": str(e)}, status=500)
 
 
-# vista para reconciliar pagos 
+# Versión async del webhook (ASGI): mismo fast-ack con ORM async
+@csrf_exempt
+@idempotent("mp", mp_event_key)
+async def mp_webhook_async(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    try:
+        payload = json.loads(request.body or b"{}")
+        if not extract_payment_id(payload):
+            return JsonResponse({"ok": True}, status=200)
+
+        event = await aenqueue("mp", payload)
+        return JsonResponse({"ok": True, "queued": event.pk}, status=200)
+    except Exception as e:
+        logger.exception("❌ Error en webhook: %s", e)
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+# vista para reconciliar pagos
+# POST inicia una ejecución (la procesa `process_webhooks`); GET lista las últimas
 class ReconcilePaymentsView(APIView):
     def get(self, request):
-        discrepancies = reconcile_payments()
-        return Response({"differences": discrepancies})
+        runs = ReconciliationRun.objects.order_by("-id")[:20]
+        return Response({"runs": ReconciliationRunSerializer(runs, many=True).data})
+
+    def post(self, request):
+        try:
+            days = max(1, int(request.data.get("days", 1)))
+        except (TypeError, ValueError):
+            return Response({"error": "days debe ser un entero"}, status=status.HTTP_400_BAD_REQUEST)
+
+        run = start_reconciliation(days=days)
+        return Response(ReconciliationRunSerializer(run).data, status=status.HTTP_202_ACCEPTED)
+
+
+# progreso, contadores y discrepancias paginadas (keyset: ?after=<id>&limit=<n>&kind=<tipo>)
+class ReconciliationRunView(APIView):
+    def get(self, request, pk):
+        run = get_object_or_404(ReconciliationRun, pk=pk)
+        try:
+            after = int(request.query_params.get("after", 0))
+            limit = min(max(int(request.query_params.get("limit", 100)), 1), 1000)
+        except ValueError:
+            return Response({"error": "after/limit deben ser enteros"}, status=status.HTTP_400_BAD_REQUEST)
+
+        qs = run.discrepancies.filter(id__gt=after).order_by("id")
+        if request.query_params.get("kind"):
+            qs = qs.filter(kind=request.query_params["kind"])
+        page = list(qs[:limit + 1])
+
+        next_url = None
+        if len(page) > limit:
+            page = page[:limit]
+            params = request.query_params.copy()
+            params["after"] = page[-1].id
+            next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+        return Response({
+            "run": ReconciliationRunSerializer(run).data,
+            "discrepancies": ReconciliationDiscrepancySerializer(page, many=True).data,
+            "next": next_url,
+        })
+
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 = formato gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _report_rows(run, chunk_size=2000):
+    return run.discrepancies.order_by("id").values(*REPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def _csv_lines(run):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=REPORT_FIELDS)
+    writer.writeheader()
+    for row in _report_rows(run):
+        writer.writerow(row)
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_lines(run):
+    for row in _report_rows(run):
+        yield json.dumps(row, default=str) + "\n"
+
+
+# reporte completo en streaming: ?format=csv (gzip) | ?format=ndjson[&gzip=1]
+def reconcile_report(request, pk):
+    run = get_object_or_404(ReconciliationRun, pk=pk)
+    if run.status != "done":
+        return JsonResponse({"error": "La reconciliación no ha terminado", "status": run.status}, status=409)
+
+    fmt = request.GET.get("format", "csv")
+    if fmt == "csv":
+        response = StreamingHttpResponse(_gzip_stream(_csv_lines(run)), content_type="application/gzip")
+        response["Content-Disposition"] = f'attachment; filename="reconcile_{run.pk}.csv.gz"'
+        return response
+    if fmt == "ndjson":
+        if request.GET.get("gzip") in ("1", "true"):
+            response = StreamingHttpResponse(_gzip_stream(_ndjson_lines(run)), content_type="application/gzip")
+            response["Content-Disposition"] = f'attachment; filename="reconcile_{run.pk}.ndjson.gz"'
+            return response
+        return StreamingHttpResponse(_ndjson_lines(run), content_type="application/x-ndjson")
+
+    return JsonResponse({"error": "format debe ser csv o ndjson"}, status=400)
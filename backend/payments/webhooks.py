@@ -0,0 +1,106 @@
+# payments/webhooks.py
+# Procesamiento (fuera del request) de las notificaciones de Mercado Pago
+import logging
+import os
+from dotenv import load_dotenv, find_dotenv
+from payments.jobs import register
+from payments.models import PaymentPreference
+from mp_oauth.tokens import mp_request
+from ghlmp_updates.cache import TTLCache
+
+# Cargar variables .env
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+MP_BASE = os.getenv("MP_BASE_URL", "https://api.mercadopago.com")
+
+# 🔹 Cache del detalle de pagos (MP manda varias notificaciones y reintentos por pago)
+MP_PAYMENT_CACHE_SIZE = int(os.getenv("MP_PAYMENT_CACHE_SIZE", "1024"))
+MP_PAYMENT_CACHE_TTL_SECONDS = float(os.getenv("MP_PAYMENT_CACHE_TTL_SECONDS", "60"))
+# estados que aún pueden cambiar (pending, in_process...): TTL corto para no perder la aprobación
+MP_PAYMENT_CACHE_PENDING_TTL_SECONDS = float(os.getenv("MP_PAYMENT_CACHE_PENDING_TTL_SECONDS", "5"))
+MP_FINAL_STATUSES = {"approved", "rejected", "cancelled", "refunded", "charged_back"}
+
+
+def _payment_ttl(payment):
+    if payment and payment.get("status") in MP_FINAL_STATUSES:
+        return MP_PAYMENT_CACHE_TTL_SECONDS
+    return MP_PAYMENT_CACHE_PENDING_TTL_SECONDS
+
+
+payment_cache = TTLCache(maxsize=MP_PAYMENT_CACHE_SIZE, ttl=MP_PAYMENT_CACHE_TTL_SECONDS, ttl_for=_payment_ttl)
+
+
+def extract_payment_id(payload):
+    """
+    Mercado Pago puede enviar distintos shapes; lo común: data.id (payment id) o type=payment + data.id
+    Normalmente webhook trae: {"id": 123, "type": "payment"}, luego consultamos detalle
+    """
+    if not isinstance(payload, dict):
+        return None
+    if "data" in payload and isinstance(payload["data"], dict) and payload["data"].get("id"):
+        return payload["data"]["id"]
+    return payload.get("id")
+
+
+def _fetch_payment(payment_id):
+    r = mp_request("GET", f"{MP_BASE}/v1/payments/{payment_id}")
+
+    # ⚠️ Pagos no encontrados o simulados: no se reintenta
+    if r.status_code == 404:
+        logger.warning("⚠️ Mercado Pago devolvió %s para payment_id=%s", r.status_code, payment_id)
+        return None
+    r.raise_for_status()
+    return r.json()
+
+
+def fetch_payment(payment_id):
+    """
+    Detalle del pago en MP (None si no existe). Las consultas concurrentes del mismo
+    pago comparten un solo GET y el resultado se reutiliza unos segundos.
+    """
+    return payment_cache.get_or_load(str(payment_id), lambda: _fetch_payment(payment_id))
+
+
+@register("mp")
+def process_mp_notification(payload):
+    """Consulta el pago en MP y actualiza la preferencia local (GHL se sincroniza vía outbox)."""
+    payment_id = extract_payment_id(payload)
+    if not payment_id:
+        return
+
+    # consultar MP para detalle payment (cacheado / agrupado por payment_id)
+    payment = fetch_payment(payment_id)
+    if payment is None:
+        return
+
+    status_mp = payment.get("status")
+    external_ref = payment.get("external_reference") or payment.get("metadata", {}).get("external_reference")
+
+    # mapping external_reference -> preference / appointment
+    # external_ref puede ser "appointment_12345"
+    appointment_id = None
+    if external_ref and external_ref.startswith("appointment_"):
+        appointment_id = external_ref.replace("appointment_", "")
+
+    # Buscar la preferencia por payment.preference_id (identifica el link exacto: una cita
+    # puede tener varios) y, si no viene, la más reciente de la cita
+    pref = None
+    if payment.get("preference_id"):
+        pref = PaymentPreference.objects.filter(preference_id=payment.get("preference_id")).first()
+    if not pref and appointment_id:
+        pref = PaymentPreference.objects.filter(appointment_id=appointment_id).order_by("-created_at", "-id").first()
+
+    if not pref:
+        logger.warning("⚠️ Preferencia no encontrada para: %s", external_ref)
+        return
+
+    # Idempotencia: las transiciones son UPDATE condicionales (WHERE status != 'paid');
+    # entre notificaciones concurrentes del mismo pago solo una gana y sincroniza GHL
+    if status_mp == "approved":
+        # la sincronización con GHL queda en el outbox (ver payments/outbox.py)
+        if pref.mark_paid(payment_id=str(payment_id)):
+            logger.info("✅ Pago aprobado: %s", payment_id, extra={"preference_id": pref.preference_id})
+    elif status_mp and pref.set_status(status_mp):
+        logger.info("ℹ️ Pago actualizado a estado %s", status_mp, extra={"preference_id": pref.preference_id})